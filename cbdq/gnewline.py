@@ -1,61 +1,42 @@
 #!/usr/bin/env python3
+'''Validates a tracery grammar, and writes it out as JSON for Cheap Bots, Done Quick!, with
+each space replaced by #SPACE# (which mostly expands to a space) for chaotic spacing effect.'''
 import argparse
-import json
-import re
+import importlib.util
+import os
 import sys
-import yaml
 
-
-skip_keys = frozenset(('QUOTE', 'SPACE', '00-SOURCE'))
-traceryish_rx = re.compile(r'#(\w+)(?:\.\w+)*#')
-
-
-def fmap(f, val):
-    if isinstance(val, list):
-        return [fmap(f, x) for x in val]
-    else:
-        return f(val)
+# Just fewerror/grammar.py: importing the fewerror package would load NLTK, and wordlists
+# relative to the working directory
+_spec = importlib.util.spec_from_file_location('fewerror.grammar', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fewerror', 'grammar.py'))
+grammar = importlib.util.module_from_spec(_spec)
+sys.modules[_spec.name] = grammar
+_spec.loader.exec_module(grammar)
 
 
-def space(val):
-    return val.replace(' ', '#SPACE#')
-
-
-def validate(j):
-    used = {'origin'} | skip_keys
-    for k, v in j.items():
-        def _validate(val, k=k):
-            for var in traceryish_rx.findall(val):
-                if var not in j:
-                    raise ValueError(k, val, var)
-                used.add(var)
-        fmap(_validate, v)
-
-    unused = j.keys() - used
-    if unused:
-        raise ValueError(unused)
+skip_keys = frozenset(('QUOTE', 'SPACE', '00-SOURCE'))
+# Bump this if what build() produces changes
+CACHE_VERSION = 1
 
 
-def transform(j):
-    return {
-        k: v if k in skip_keys else fmap(space, v)
-        for k, v in j.items()
-    }
+def build(data):
+    return grammar.Source.parse(data).validate(skip_keys).transform(skip_keys).to_json()
 
 
 def main():
     p = argparse.ArgumentParser()
-    p.add_argument('source', type=argparse.FileType(mode='r'))
+    p.add_argument('source')
     p.add_argument('--verify', action='store_true')
+    p.add_argument('--no-cache', action='store_true',
+                   help="Don't cache the output in {}".format(grammar.default_cache_dir()))
     a = p.parse_args()
 
-    j = yaml.load(a.source, Loader=yaml.CLoader)
-    validate(j)
-    j_ = transform(j)
-    if a.verify:
-        json.dumps(j_)
-    else:
-        json.dump(j_, sys.stdout, indent=2, sort_keys=True)
+    j = grammar.load_cached(a.source, build, CACHE_VERSION,
+                            None if a.no_cache else grammar.default_cache_dir(),
+                            name='gnewline.' + os.path.basename(a.source))
+    if not a.verify:
+        sys.stdout.write(j)
 
 
 if __name__ == '__main__':
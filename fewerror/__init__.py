@@ -1,13 +1,24 @@
 # coding=utf-8
+import collections
 import logging
+import re
+import threading
 
 from textblob import TextBlob, Word
+from textblob.decorators import requires_nltk_corpus
+from textblob.taggers import NLTKTagger
 from nltk.corpus.reader import WordListCorpusReader
+from nltk.tag.perceptron import PerceptronTagger
 
+from . import metrics
+from .tagcache import TagCache
 from .util import OrderedSet
 
 log = logging.getLogger(__name__)
 
+find_corrections_seconds = metrics.histogram(
+    'fewerror_find_corrections_seconds', 'Time spent tagging and matching a text')
+
 
 def furthermore(qs):
     if len(qs) > 1:
@@ -164,12 +175,21 @@ bad_words_en = bad_words_corpora.words('en')
 
 
 def match(blob_tags, i):
+    m = _match(blob_tags, i)
+    if m is not None:
+        return m[1]
+
+
+def _match(blob_tags, i):
+    '''Returns (the name of the rule which matched, the correction) for the "less" at
+    blob_tags[i]; or None.'''
     if ["could", "care", "less"] == [w.lower() for w, tag in blob_tags[i-2:i+1]]:
-        return "could care fewer"
+        return 'could_care_less', "could care fewer"
 
     if ["less", "than", "jake"] == [w.lower() for w, tag in blob_tags[i:i+3]]:
-        return "Fewer Than Jake"
+        return 'less_than_jake', "Fewer Than Jake"
 
+    rule = 'less'
     reply_words = []
 
     if i > 0:
@@ -182,12 +202,15 @@ def match(blob_tags, i):
             u, u_pos = blob_tags[i - 2]
 
             if u.lower() == 'more' and v.lower() == 'or':
+                rule = 'more_or_less'
                 reply_words.extend([u, v])
             elif u.isdigit() and v == '%':
+                rule = 'percent_less'
                 reply_words.append(u + v)
 
         if not reply_words:
             if v_pos in (POS.RB, POS.DT):
+                rule = 'qualified_less'
                 reply_words.append(v)
 
     less, _less_pos = blob_tags[i]
@@ -225,13 +248,94 @@ def match(blob_tags, i):
             break
 
     reply_words.extend([fewer, w])
-    return ' '.join(reply_words)
+    return rule, ' '.join(reply_words)
+
+
+class OnceNLTKTagger(NLTKTagger):
+    '''NLTKTagger, but loading the model once. nltk.pos_tag constructs a new PerceptronTagger,
+    unpickling all its weights, every time it is called.
+
+    If cache (a tagcache.TagCache) is set, texts found in it aren't tagged again; and the model
+    isn't loaded at all until a text which isn't is.'''
+
+    _tagger = None
+    _lock = threading.Lock()
+
+    cache = None
+
+    @requires_nltk_corpus
+    def tag(self, text):
+        raw = text if isinstance(text, str) else text.raw
+        if self.cache is not None:
+            tags = self.cache.get(raw)
+            if tags is not None:
+                return tags
+
+        if isinstance(text, str):
+            text = TextBlob(text, pos_tagger=self)
+
+        if self._tagger is None:
+            with self._lock:
+                if self._tagger is None:
+                    self._tagger = PerceptronTagger()
+
+        tags = self._tagger.tag(text.tokens)
+        if self.cache is not None:
+            self.cache.put(raw, tags)
+        return tags
+
+
+pos_tagger = OnceNLTKTagger()
+
+
+def use_tag_cache(filename, **kwargs):
+    '''Caches pos_tagger's tags in filename (see tagcache.TagCache); returns the cache.'''
+    pos_tagger.cache = TagCache(filename, **kwargs)
+    return pos_tagger.cache
+
+
+def warm_up():
+    '''Loads the tagger model now, rather than when the first "less" comes along.'''
+    find_corrections('I wish I had less warm-up time')
+
+
+# Cheap test for whether find_corrections could possibly find anything
+lessish_rx = re.compile(r'\bLESS\b', re.IGNORECASE)
 
 
 def find_corrections(text):
-    blob = TextBlob(text)
+    with find_corrections_seconds.time():
+        return _find_corrections(text)
+
+
+def _find_corrections(text):
+    return list(OrderedSet(c.correction for c in explain_corrections(text)))
 
-    words = OrderedSet()
+
+Correction = collections.namedtuple('Correction', 'correction rule start end')
+
+
+def _token_offsets(raw, tokens):
+    '''Where each of tokens, which were split from raw, starts in raw; or None for any which
+    the tokenizer changed.'''
+    offsets = []
+    pos = 0
+    for token in tokens:
+        i = raw.find(token, pos)
+        if i < 0:
+            offsets.append(None)
+        else:
+            offsets.append(i)
+            pos = i + len(token)
+    return offsets
+
+
+def explain_corrections(text):
+    '''Like find_corrections, but returns a Correction for every "less" which matched, with
+    the name of the rule which matched it and where it is in text.'''
+    blob = TextBlob(text, pos_tagger=pos_tagger)
+
+    corrections = []
     for s in blob.sentences:
         # blob.tags excludes punctuation, but we need that to avoid correcting
         # across a comma, ellipsis, etc. In fact, it's not clear there is
@@ -240,14 +344,18 @@ def find_corrections(text):
                   for word, t in s.pos_tagger.tag(s.raw)]
         less_indices = [i for i, (word, tag) in enumerate(s_tags) if word.lower() == 'less']
 
+        offsets = None
         for i in less_indices:
-            q = match(s_tags, i)
-            if q is not None:
-                words.add(q)
-
-    words = list(words)
-    for word in words:
-        if any(w in word for w in bad_words_en):
+            m = _match(s_tags, i)
+            if m is not None:
+                if offsets is None:
+                    offsets = _token_offsets(s.raw, [word for word, _ in s_tags])
+                start = None if offsets[i] is None else s.start + offsets[i]
+                end = None if start is None else start + len(s_tags[i][0])
+                corrections.append(Correction(m[1], m[0], start, end))
+
+    for c in corrections:
+        if any(w in c.correction for w in bad_words_en):
             return []
 
-    return words
+    return corrections
@@ -1,12 +1,24 @@
 import argparse
+import atexit
+import collections
 import json
 import logging
+import logging.config
+import logging.handlers
 import os
-import raven
-from raven.handlers.logging import SentryHandler
+import queue
+import threading
+
+from . import metrics
 
 log = logging.getLogger(__name__)
 
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Written at deploy time by update.sh, so we needn't work it out every time we start
+RELEASE_FILE = os.path.join(REPO, '.release')
+# How long to wait, at exit, for Sentry to be set up so buffered warnings can be sent
+SENTRY_EXIT_TIMEOUT = 5
+
 
 def add_arguments(parser):
     g = parser.add_argument_group('logging').add_mutually_exclusive_group()
@@ -17,29 +29,191 @@ def add_arguments(parser):
     g.add_argument('--log-level',
                    default='DEBUG',
                    help='Log at this level to stderr (default: DEBUG)')
+    parser.add_argument('--log-format',
+                        choices=('text', 'json'),
+                        default='text',
+                        help='Log to stderr as text, or as one JSON object per line; for '
+                             'JSON with --log-config, use checkedshirt.JSONFormatter '
+                             '(default: text)')
+    parser.add_argument('--log-queue',
+                        action='store_true',
+                        help='Format and write log records on a background thread, rather '
+                             'than in the thread that logs them')
 
+    m = parser.add_argument_group('metrics')
+    m.add_argument('--metrics-port',
+                   type=int,
+                   metavar='PORT',
+                   help='Serve Prometheus metrics on http://ADDR:PORT/metrics (default: off)')
+    m.add_argument('--metrics-addr',
+                   default='localhost',
+                   metavar='ADDR',
+                   help='Address to serve metrics on (default: localhost)')
 
-def init(args):
-    if args.log_config:
-        log_config = json.load(args.log_config)
-        logging.config.dictConfig(log_config)
-    else:
-        logging.basicConfig(level=args.log_level,
-                            format='%(asctime)s %(levelname)8s [%(name)s] %(message)s')
 
-    log.info('--- Starting ---')
-    git_sha = raven.fetch_git_sha(os.path.dirname(os.path.dirname(__file__)))
-    log.info('Git commit: %s', git_sha)
+class JSONFormatter(logging.Formatter):
+    '''Formats records as compact JSON objects, for one per line.'''
+
+    def format(self, record):
+        j = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            j['exc'] = self.formatException(record.exc_info)
+        return json.dumps(j, separators=(',', ':'))
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    '''Unlike QueueHandler, doesn't format the record on the way into the queue: the handlers on
+    the far side do that. So arguments to log calls must not be mutated afterwards. It also
+    keeps exc_info, which Sentry needs.'''
+
+    def __init__(self, queue, listener):
+        super(_QueueHandler, self).__init__(queue)
+        self.listener = listener
+
+    def prepare(self, record):
+        return record
+
+
+def _root_handlers():
+    '''The root logger's handlers, including those _queue_handlers() moved behind a queue.'''
+    for handler in logging.getLogger().handlers:
+        yield handler
+        if isinstance(handler, _QueueHandler):
+            yield from handler.listener.handlers
+
+
+def _queue_handlers():
+    '''Moves the root logger's handlers onto a background thread, behind a queue; unless an
+    earlier call already has.'''
+    root = logging.getLogger()
+    if any(isinstance(h, _QueueHandler) for h in root.handlers):
+        return None
+
+    q = queue.Queue()
+    listener = logging.handlers.QueueListener(q, *root.handlers, respect_handler_level=True)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(q, listener))
+    listener.start()
+
+    # Registered after logging's own atexit hook, so runs before it
+    atexit.register(listener.stop)
+    return listener
+
+
+def release():
+    '''The release to report to Sentry: $SENTRY_RELEASE, or what update.sh wrote to
+    RELEASE_FILE, or failing those the git commit checked out.'''
+    r = os.environ.get('SENTRY_RELEASE')
+    if r:
+        return r
+
+    try:
+        with open(RELEASE_FILE, 'r') as f:
+            r = f.read().strip()
+        if r:
+            return r
+    except FileNotFoundError:
+        pass
+
+    import raven
+    return raven.fetch_git_sha(REPO)
+
+
+class _DeferredHandler(logging.Handler):
+    '''Stands in for a handler which isn't ready yet: buffers (up to capacity) records until
+    attach() is called, then passes them, and all later records, to the real handler.'''
+
+    def __init__(self, level=logging.NOTSET, capacity=100):
+        super(_DeferredHandler, self).__init__(level)
+        self._target = None
+        self._buffer = collections.deque(maxlen=capacity)
+
+    def emit(self, record):
+        with self.lock:
+            if self._target is None:
+                self._buffer.append(record)
+                return
+        self._target.handle(record)
+
+    def attach(self, target):
+        with self.lock:
+            while self._buffer:
+                target.handle(self._buffer.popleft())
+            self._target = target
+
+
+def _init_sentry(deferred):
+    # Importing raven takes longer than anything else in init(), so is put off until here
+    import raven
+    import raven.conf
+    from raven.handlers.logging import SentryHandler
+
+    r = release()
+    log.info('Release: %s', r)
 
-    # Log errors to Sentry
     client = raven.Client(
         # dsn=os.environ.get('SENTRY_DSN'),
         include_paths=['fewerror'],
-        release=git_sha,
+        release=r,
         ignore_exceptions=[
             KeyboardInterrupt,
         ],
     )
     handler = SentryHandler(client)
     handler.setLevel(logging.WARNING)
-    raven.conf.setup_logging(handler)
+
+    # As raven.conf.setup_logging does, keep Sentry's own complaints out of Sentry
+    for logger_name in raven.conf.EXCLUDE_LOGGER_DEFAULTS:
+        logger = logging.getLogger(logger_name)
+        logger.propagate = False
+        logger.addHandler(logging.StreamHandler())
+
+    deferred.attach(handler)
+
+
+def _start_sentry():
+    '''Logs warnings and errors to Sentry; but sets that up on a background thread, buffering
+    records until it's ready. Does nothing if an earlier call (say, from an earlier init())
+    already has.'''
+    if any(isinstance(h, _DeferredHandler) for h in _root_handlers()):
+        return None
+
+    deferred = _DeferredHandler(logging.WARNING)
+    logging.getLogger().addHandler(deferred)
+
+    thread = threading.Thread(target=_init_sentry, args=(deferred,), name='sentry-init',
+                              daemon=True)
+    thread.start()
+
+    # Short runs may be over before Sentry is ready: give it a chance to send what's buffered
+    atexit.register(thread.join, SENTRY_EXIT_TIMEOUT)
+    return thread
+
+
+def init(args):
+    if args.log_config:
+        log_config = json.load(args.log_config)
+        logging.config.dictConfig(log_config)
+    else:
+        handler = logging.StreamHandler()
+        if getattr(args, 'log_format', 'text') == 'json':
+            handler.setFormatter(JSONFormatter())
+        else:
+            handler.setFormatter(logging.Formatter(
+                '%(asctime)s %(levelname)8s [%(name)s] %(message)s'))
+        logging.basicConfig(level=args.log_level, handlers=[handler])
+
+    log.info('--- Starting ---')
+    _start_sentry()
+
+    if getattr(args, 'log_queue', False):
+        _queue_handlers()
+
+    if getattr(args, 'metrics_port', None) is not None:
+        metrics.serve(args.metrics_port, args.metrics_addr)
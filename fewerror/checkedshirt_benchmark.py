@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+'''Benchmarks for checkedshirt's logging setup.
+
+    python -m fewerror.checkedshirt_benchmark logging
+
+measures how long the lines LessListener logs for each status take, on the thread that logs
+them, with each combination of --log-format and --log-queue; and how long it then takes for
+the log file to catch up.
+
+    python -m fewerror.checkedshirt_benchmark startup
+
+measures, in fresh processes, how long importing checkedshirt and calling init() takes before
+the caller can get on with its work; and how much longer until Sentry is ready, which is what
+init() used to wait for.'''
+import argparse
+import atexit
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import checkedshirt
+
+log = logging.getLogger('fewerror.twitter')
+
+
+def log_status(i):
+    '''Roughly what LessListener.on_status logs for a status it replies to.'''
+    url = 'https://twitter.com/someone/status/{}'.format(1000000000000000000 + i)
+    log.info('%s %s', url, 'I could care less about this, honestly')
+    log.info('would like to mention %s', ['someone', 'someone_else'])
+    log.info('--> %s', '@someone I think you mean “couldn’t care less”.')
+    log.info('  %s', url)
+
+
+def run_logging(n, log_format, log_queue, filename):
+    root = logging.getLogger()
+    old_handlers = root.handlers[:]
+    for handler in old_handlers:
+        root.removeHandler(handler)
+
+    handler = logging.FileHandler(filename, mode='w')
+    if log_format == 'json':
+        handler.setFormatter(checkedshirt.JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)8s [%(name)s] %(message)s'))
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG)
+
+    listener = checkedshirt._queue_handlers() if log_queue else None
+
+    per_status = []
+    t = time.perf_counter()
+    for i in range(n):
+        s = time.perf_counter()
+        log_status(i)
+        per_status.append(time.perf_counter() - s)
+    logged = time.perf_counter() - t
+
+    if listener is not None:
+        listener.stop()
+        atexit.unregister(listener.stop)
+    handler.close()
+    drained = time.perf_counter() - t
+
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    for h in old_handlers:
+        root.addHandler(h)
+
+    return per_status, logged, drained
+
+
+def benchmark_logging(args):
+    print('{:<6} {:<6} {:>12} {:>12} {:>12}'.format(
+        'format', 'queue', 'median µs', 'p99 µs', 'drained s'))
+    with tempfile.TemporaryDirectory() as d:
+        filename = os.path.join(d, 'benchmark.log')
+        for log_format in ('text', 'json'):
+            for log_queue in (False, True):
+                per_status, _, drained = run_logging(args.n, log_format, log_queue, filename)
+                per_status.sort()
+                print('{:<6} {:<6} {:>12.1f} {:>12.1f} {:>12.2f}'.format(
+                    log_format, 'yes' if log_queue else 'no',
+                    1e6 * statistics.median(per_status),
+                    1e6 * per_status[int(0.99 * (len(per_status) - 1))],
+                    drained))
+
+
+STARTUP = '''
+import argparse, json, threading, time
+from fewerror import checkedshirt
+parser = argparse.ArgumentParser()
+checkedshirt.add_arguments(parser)
+args = parser.parse_args(['--log-level', 'WARNING'])
+t = time.perf_counter()
+checkedshirt.init(args)
+ready = time.perf_counter()
+next(t for t in threading.enumerate() if t.name == 'sentry-init').join()
+print(json.dumps([ready - t, time.perf_counter() - t]))
+'''
+
+
+def benchmark_startup(args):
+    ready, sentry = [], []
+    for _ in range(args.n):
+        out = subprocess.check_output([sys.executable, '-c', STARTUP],
+                                      cwd=checkedshirt.REPO)
+        r, s = json.loads(out.decode('utf-8'))
+        ready.append(r)
+        sentry.append(s)
+
+    print('init() returned after   median {:.1f}ms'.format(1000 * statistics.median(ready)))
+    print('Sentry ready after      median {:.1f}ms'.format(1000 * statistics.median(sentry)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    s = parser.add_subparsers(title='benchmarks')
+
+    p = s.add_parser('logging', help='Per-status logging overhead')
+    p.add_argument('-n', type=int, default=20000, help='statuses (default: %(default)s)')
+    p.set_defaults(func=benchmark_logging)
+
+    p = s.add_parser('startup', help='Time until init() returns, and until Sentry is ready')
+    p.add_argument('-n', type=int, default=10, help='processes (default: %(default)s)')
+    p.set_defaults(func=benchmark_startup)
+
+    args = parser.parse_args()
+    if not hasattr(args, 'func'):
+        parser.error('choose a benchmark')
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+'''Runs find_corrections over a corpus, to see how the rules fare at scale.
+
+    python -m fewerror.evaluate tweets.jsonl --jobs 4 --output corrections.jsonl
+
+Each line of input is either a tweet, as JSON (which goes through get_sanitized_text, as in
+the bot), or a message as plain text. For each message with corrections, a line of JSON is
+written to the output, with the file and line it came from, the corrections, the rule which
+matched each one, and where in the (sanitized) text each "less" was. At the end, we log how many
+messages had corrections, which rules matched how often, the most common corrections, and the
+throughput.
+
+Messages are processed in chunks, on --jobs worker processes, with only a few chunks in flight
+at once; and the most common corrections are counted approximately, in bounded memory. So it
+needs no more memory for a corpus of millions of tweets than for hundreds.
+
+With --tag-cache, the tags for each sentence are kept, so that re-running over the same corpus
+(say, after changing match()) doesn't tag it all again.'''
+import argparse
+import collections
+import json
+import logging
+import multiprocessing
+import time
+
+import tweepy
+
+from . import (checkedshirt, explain_corrections, lessish_rx, pos_tagger, tagcache, use_tag_cache,
+               warm_up)
+from .twitter import get_sanitized_text
+from .tagcache import DEFAULT_MAX_ENTRIES
+from .util import TopK, chunked, imap_bounded
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+# Chunks queued up per worker
+CHUNKS_IN_FLIGHT = 2
+
+
+def parse(line, fmt='auto'):
+    '''Returns (id, text) for a line of input: the tweet's id if it is one, or else None.'''
+    if fmt == 'jsonl' or (fmt == 'auto' and line.lstrip().startswith('{')):
+        status = tweepy.Status.parse(None, json.loads(line))
+        return status.id, get_sanitized_text(status)
+    else:
+        return None, line.rstrip('\r\n')
+
+
+def evaluate_chunk(chunk):
+    '''Evaluates chunk, a list of (file name, line number, line, format); returning a dict of
+    results.'''
+    cpu = time.process_time()
+    cache = pos_tagger.cache
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    results = {
+        'messages': 0,
+        'errors': 0,
+        'lessish': 0,
+        'hits': 0,
+        'rules': collections.Counter(),
+        'corrections': collections.Counter(),
+        'records': [],
+    }
+    for name, lineno, line, fmt in chunk:
+        if not line.strip():
+            continue
+
+        results['messages'] += 1
+        try:
+            id_, text = parse(line, fmt)
+        except (ValueError, KeyError, AttributeError):
+            log.debug('Skipping %s:%d', name, lineno, exc_info=True)
+            results['errors'] += 1
+            continue
+
+        if not lessish_rx.search(text):
+            continue
+        results['lessish'] += 1
+
+        try:
+            corrections = explain_corrections(text)
+        except Exception:
+            # One message the tagger or match() chokes on shouldn't end a run over millions
+            log.debug('Failed on %s:%d', name, lineno, exc_info=True)
+            results['errors'] += 1
+            continue
+        if not corrections:
+            continue
+
+        results['hits'] += 1
+        for c in corrections:
+            results['rules'][c.rule] += 1
+            results['corrections'][c.correction] += 1
+        results['records'].append({
+            'file': name,
+            'line': lineno,
+            'id': id_,
+            'text': text,
+            'corrections': [c._asdict() for c in corrections],
+        })
+
+    if cache is not None:
+        cache.flush()
+        results['tag_cache_hits'] = cache.hits - hits
+        results['tag_cache_misses'] = cache.misses - misses
+    results['cpu_seconds'] = time.process_time() - cpu
+    return results
+
+
+def _init_worker(tag_cache=None, tag_cache_size=None):
+    if tag_cache is not None:
+        use_tag_cache(tag_cache, max_entries=tag_cache_size)
+    warm_up()
+
+
+def _numbered(files, fmt):
+    for name, lines in files:
+        for lineno, line in enumerate(lines, 1):
+            yield name, lineno, line, fmt
+
+
+def evaluate(files, output, jobs=1, fmt='auto', top=20, chunk_size=CHUNK_SIZE,
+             tag_cache=None, tag_cache_size=DEFAULT_MAX_ENTRIES):
+    '''Evaluates each line of files, a sequence of (name, lines) pairs, writing records of
+    corrections to output; and returns a dict of statistics. Workers cache tags in tag_cache,
+    if given; with jobs=1, the caller should set up the cache (with use_tag_cache) itself.'''
+    chunks = chunked(_numbered(files, fmt), chunk_size)
+
+    totals = collections.Counter()
+    rules = collections.Counter()
+    corrections = TopK(top * 10)
+    cpu_seconds = 0.
+    t = time.perf_counter()
+
+    pool = None
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, _init_worker, (tag_cache, tag_cache_size))
+        results = imap_bounded(pool, evaluate_chunk, chunks, jobs * CHUNKS_IN_FLIGHT)
+    else:
+        results = map(evaluate_chunk, chunks)
+
+    next_report = 100000
+    try:
+        for r in results:
+            for key in ('messages', 'errors', 'lessish', 'hits',
+                        'tag_cache_hits', 'tag_cache_misses'):
+                totals[key] += r.get(key, 0)
+            rules.update(r['rules'])
+            corrections.update(r['corrections'])
+            cpu_seconds += r['cpu_seconds']
+            for record in r['records']:
+                output.write(json.dumps(record) + '\n')
+
+            if totals['messages'] >= next_report:
+                log.info('%d messages, %d with corrections', totals['messages'], totals['hits'])
+                next_report += 100000
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    elapsed = time.perf_counter() - t
+    messages = totals['messages']
+    return {
+        'messages': messages,
+        'errors': totals['errors'],
+        'lessish': totals['lessish'],
+        'hits': totals['hits'],
+        'hit_rate': totals['hits'] / messages if messages else 0.,
+        'tag_cache_hits': totals['tag_cache_hits'],
+        'tag_cache_misses': totals['tag_cache_misses'],
+        'rules': dict(rules.most_common()),
+        'top_corrections': corrections.most_common(top),
+        'seconds': elapsed,
+        'messages_per_second': messages / elapsed if elapsed else 0.,
+        'messages_per_cpu_second': messages / cpu_seconds if cpu_seconds else 0.,
+        'jobs': jobs,
+    }
+
+
+def log_stats(stats):
+    log.info('%d messages (%d failed): %d mention "less", %d (%.3f%%) have corrections',
+             stats['messages'], stats['errors'], stats['lessish'], stats['hits'],
+             100 * stats['hit_rate'])
+    for rule, n in stats['rules'].items():
+        log.info('rule %-16s %d', rule, n)
+    for correction, n in stats['top_corrections']:
+        log.info('%8d  %s', n, correction)
+    if stats['tag_cache_hits'] or stats['tag_cache_misses']:
+        log.info('Tag cache: %d hits, %d misses', stats['tag_cache_hits'],
+                 stats['tag_cache_misses'])
+    log.info('%.1fs: %.0f messages/s with %d jobs; %.0f messages/s per core',
+             stats['seconds'], stats['messages_per_second'], stats['jobs'],
+             stats['messages_per_cpu_second'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    checkedshirt.add_arguments(parser)
+    parser.add_argument('corpus', type=argparse.FileType('r', encoding='utf-8'), nargs='+',
+                        help='JSON Lines of tweets, or plain text; - for stdin')
+    parser.add_argument('--format', choices=('auto', 'jsonl', 'text'), default='auto',
+                        help='auto treats lines starting with { as JSON (default: %(default)s)')
+    parser.add_argument('--output', '-o', type=argparse.FileType('w', encoding='utf-8'),
+                        default='-', help='where to write corrections (default: stdout)')
+    parser.add_argument('--stats', type=argparse.FileType('w', encoding='utf-8'),
+                        help='also write the statistics to this file, as JSON')
+    parser.add_argument('--jobs', '-j', type=int, default=multiprocessing.cpu_count(),
+                        help='worker processes (default: %(default)s)')
+    parser.add_argument('--top', type=int, default=20,
+                        help='how many of the most common corrections to show '
+                             '(default: %(default)s)')
+    tagcache.add_arguments(parser)
+    args = parser.parse_args()
+    checkedshirt.init(args)
+
+    if args.jobs == 1:
+        _init_worker(args.tag_cache, args.tag_cache_size)
+
+    files = ((f.name, f) for f in args.corpus)
+    stats = evaluate(files, args.output, jobs=args.jobs, fmt=args.format, top=args.top,
+                     tag_cache=args.tag_cache, tag_cache_size=args.tag_cache_size)
+    log_stats(stats)
+    if pos_tagger.cache is not None:
+        pos_tagger.cache.close()
+    if args.stats:
+        json.dump(stats, args.stats, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,583 @@
+#!/usr/bin/env python3
+'''A faster tracery.
+
+tracery.Grammar.flatten builds a tree of Node objects for every expansion, re-parsing the
+#symbol.modifier# and [action] syntax out of each rule it selects. Here each rule is parsed
+once, with tracery's own parser, into plain tuples: literal strings, Tags (symbol, actions to
+run first, and modifiers with their parameters), and Push/Pop/Run actions. Expanding is then
+a walk over those tuples.
+
+The semantics are tracery's (the Python package's, which differs from tracery.js in never
+undoing a tag's [push] actions), except that each flatten() starts from the grammar as
+loaded, rather than inheriting whatever earlier expansions pushed. With the same random
+sequence, it makes the same choices, in the same order, as tracery.'''
+import argparse
+import collections
+import functools
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import pickle
+import random
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tracery
+import yaml
+from tracery.modifiers import base_english
+
+Tag = collections.namedtuple('Tag', 'symbol actions modifiers')
+Push = collections.namedtuple('Push', 'target rules')
+Pop = collections.namedtuple('Pop', 'target')
+Run = collections.namedtuple('Run', 'rule')
+
+log = logging.getLogger(__name__)
+
+_modifier_params_rx = re.compile(r'\(([^)]+)\)')
+
+
+def _compile_modifier(name):
+    params = ()
+    if name.find('(') > 0:
+        matches = _modifier_params_rx.findall(name)
+        if matches:
+            params = tuple(matches[0].split(','))
+            name = name[:name.find('(')]
+    return name, params
+
+
+def _compile_action(raw):
+    target, *rest = raw.split(':')
+    if not rest:
+        return Run(compile_rule(target))
+    elif rest[0] == 'POP':
+        return Pop(target)
+    else:
+        return Push(target, tuple(compile_rule(r) for r in rest[0].split(',')))
+
+
+def _compile_tag(raw):
+    parsed = tracery.parse_tag(raw)
+    return Tag(parsed['symbol'],
+               tuple(_compile_action(a['raw']) for a in parsed['preactions']),
+               tuple(_compile_modifier(m) for m in parsed['modifiers']))
+
+
+def compile_rule(raw):
+    '''Compiles a rule to a string, if it has no tags or actions; or else a tuple of strings,
+    Tags and actions.'''
+    sections, _ = tracery.parse(raw)
+    segments = []
+    for section in sections:
+        if section['type'] == 0:
+            if segments and isinstance(segments[-1], str):
+                segments[-1] += section['raw']
+            else:
+                segments.append(section['raw'])
+        elif section['type'] == 1:
+            segments.append(_compile_tag(section['raw']))
+        else:
+            segments.append(_compile_action(section['raw']))
+
+    if not segments:
+        return ''
+    elif len(segments) == 1 and isinstance(segments[0], str):
+        return segments[0]
+    else:
+        return tuple(segments)
+
+
+# Pushed rules are the results of expansions, so have to be compiled as we go
+_compile_pushed = functools.lru_cache(maxsize=4096)(compile_rule)
+
+
+def compile_grammar(raw):
+    '''Compiles a tracery grammar (a dict of symbol: rule or [rules]) to a dict of
+    symbol: (compiled rules).'''
+    compiled = {}
+    for symbol, rules in raw.items():
+        if isinstance(rules, str):
+            rules = [rules]
+        elif not isinstance(rules, list):
+            rules = []
+        compiled[symbol] = tuple(compile_rule(r) for r in rules)
+    return compiled
+
+
+class _Unbounded(Exception):
+    pass
+
+
+def expansions(symbols, symbol, limit=10000, _memo=None):
+    '''Every text which symbol can expand to, as a set, given compiled symbols; or None if
+    that involves actions, modifiers or recursion, or there are more than limit texts.'''
+    memo = {} if _memo is None else _memo
+
+    def of_symbol(symbol):
+        try:
+            texts = memo[symbol]
+        except KeyError:
+            pass
+        else:
+            if texts is None:
+                raise _Unbounded(symbol)
+            return texts
+
+        if symbol not in symbols:
+            raise _Unbounded(symbol)
+
+        memo[symbol] = None
+        texts = set()
+        for rule in symbols[symbol]:
+            texts |= of_rule(rule)
+            if len(texts) > limit:
+                raise _Unbounded(symbol)
+        memo[symbol] = texts
+        return texts
+
+    def of_rule(rule):
+        if rule.__class__ is str:
+            return {rule}
+
+        texts = {''}
+        for segment in rule:
+            if segment.__class__ is str:
+                texts = {text + segment for text in texts}
+            elif segment.__class__ is Tag and not segment.actions and not segment.modifiers:
+                texts = {text + t for text in texts for t in of_symbol(segment.symbol)}
+            else:
+                raise _Unbounded(segment)
+
+            if len(texts) > limit:
+                raise _Unbounded(segment)
+        return texts
+
+    try:
+        return of_symbol(symbol)
+    except _Unbounded:
+        return None
+
+
+def modifier_inputs(symbols, name, limit=10000):
+    '''The texts which the modifier called name may be applied to (first, if it's in a
+    chain), as far as expansions() can tell.'''
+    memo = {}
+    texts = set()
+    for rules in symbols.values():
+        for rule in rules:
+            if rule.__class__ is str:
+                continue
+            for segment in rule:
+                if segment.__class__ is Tag and not segment.actions and \
+                        segment.modifiers and segment.modifiers[0][0] == name:
+                    texts |= expansions(symbols, segment.symbol, limit, memo) or set()
+    return texts
+
+
+# Characters which modifiers add: (on average, at most). Others are taken to leave the length
+# alone.
+MODIFIER_LENGTHS = {
+    'a': (2.1, 3),
+    's': (1.1, 2),
+    'ed': (1.9, 2),
+    'is': (3.5, 4),
+}
+
+SymbolStats = collections.namedtuple('SymbolStats', 'derivations mean_length max_length lengths')
+SymbolStats.__doc__ = '''derivations: the number of ways to expand the symbol, counting each
+choice of rule separately; different derivations can produce the same text, so this is only an
+upper bound on the number of distinct texts, which expansions() counts where it can.
+lengths: a numpy array, where lengths[i] is the probability that the expansion is i characters
+long, up to a limit; and lengths[-1] that it is longer than that.
+All are infinite, or in the case of lengths None, for recursive symbols.'''
+
+_RECURSIVE = SymbolStats(math.inf, math.inf, math.inf, None)
+
+
+def stats(symbols, limit=280, modifier_lengths=MODIFIER_LENGTHS):
+    '''Returns a dict of SymbolStats for each of the compiled symbols, assuming (as tracery
+    does) that each of a symbol's rules is equally likely.
+
+    Only the grammar as written is considered: actions are taken to produce nothing and to
+    change nothing. Lengths are in characters, before escapes are removed; modifiers are
+    assumed to add their most characters in the distribution of lengths, which is thus
+    pessimistic.'''
+    memo = {}
+
+    def fold(lengths):
+        if len(lengths) > limit + 2:
+            lengths = np.concatenate([lengths[:limit + 1], [lengths[limit + 1:].sum()]])
+        return lengths
+
+    def shift(lengths, n):
+        return fold(np.concatenate([np.zeros(n), lengths])) if n else lengths
+
+    def of_tag(tag):
+        if tag.symbol in symbols:
+            s = of_symbol(tag.symbol)
+        else:
+            n = len('(({}))'.format(tag.symbol))
+            s = SymbolStats(1, n, n, shift(np.ones(1), n))
+        if s.lengths is None:
+            return s
+
+        derivations, mean, max_, lengths = s
+        for name, _ in tag.modifiers:
+            if name in modifier_lengths:
+                mean_extra, max_extra = modifier_lengths[name]
+            else:
+                mean_extra = max_extra = len('((.{}))'.format(name))
+            mean += mean_extra
+            max_ += max_extra
+            lengths = shift(lengths, max_extra)
+        return SymbolStats(derivations, mean, max_, lengths)
+
+    def of_rule(rule):
+        if rule.__class__ is str:
+            return SymbolStats(1, len(rule), len(rule), shift(np.ones(1), len(rule)))
+
+        derivations, mean, max_, lengths = 1, 0, 0, np.ones(1)
+        for segment in rule:
+            if segment.__class__ is str:
+                n = len(segment)
+                mean += n
+                max_ += n
+                lengths = shift(lengths, n)
+            elif segment.__class__ is Tag:
+                s = of_tag(segment)
+                if s.lengths is None:
+                    return _RECURSIVE
+                derivations *= s.derivations
+                mean += s.mean_length
+                max_ += s.max_length
+                lengths = fold(np.convolve(lengths, s.lengths))
+        return SymbolStats(derivations, mean, max_, lengths)
+
+    def of_symbol(symbol):
+        try:
+            s = memo[symbol]
+        except KeyError:
+            pass
+        else:
+            return _RECURSIVE if s is None else s
+
+        memo[symbol] = None
+        rules = symbols[symbol]
+
+        # Most rules are plain strings, so deal with them all at once
+        literals = [len(rule) for rule in rules if rule.__class__ is str]
+        derivations = len(literals)
+        mean = sum(literals)
+        max_ = max(literals, default=0)
+        lengths = np.bincount(np.minimum(np.array(literals, dtype=int), limit + 1),
+                              minlength=limit + 2).astype(float)
+
+        for rule in rules:
+            if rule.__class__ is str:
+                continue
+            s = of_rule(rule)
+            if s.lengths is None:
+                memo[symbol] = _RECURSIVE
+                return _RECURSIVE
+            derivations += s.derivations
+            mean += s.mean_length
+            max_ = max(max_, s.max_length)
+            lengths[:len(s.lengths)] += s.lengths
+
+        if rules:
+            mean /= len(rules)
+            lengths /= len(rules)
+        memo[symbol] = s = SymbolStats(derivations, mean, max_, lengths)
+        return s
+
+    return {symbol: of_symbol(symbol) for symbol in symbols}
+
+
+def print_stats(all_stats, symbols=None, limit=280, file=None):
+    '''Prints a table of stats(), for symbols (by default, all of them).'''
+    file = file or sys.stdout
+    print('{:<32} {:>12} {:>8} {:>8} {:>10}'.format(
+        'symbol', 'derivations', 'mean', 'max', 'P(>{})'.format(limit)), file=file)
+    for symbol in sorted(all_stats) if symbols is None else symbols:
+        s = all_stats[symbol]
+        print('{:<32} {:>12.4g} {:>8.1f} {:>8} {:>10}'.format(
+            symbol, s.derivations, s.mean_length, s.max_length,
+            '-' if s.lengths is None else '{:.4g}'.format(s.lengths[limit + 1:].sum())),
+            file=file)
+
+
+def clear_escape_chars(text):
+    return text.replace('\\\\', 'DOUBLEBACKSLASH').replace('\\', '').replace(
+        'DOUBLEBACKSLASH', '\\')
+
+
+class Grammar(object):
+    def __init__(self, raw=None, modifiers=base_english, seed=None, compiled=None):
+        '''Either raw (as for tracery.Grammar) or compiled (from compile_grammar) must be
+        given.'''
+        self.symbols = compiled if compiled is not None else compile_grammar(raw)
+        self.modifiers = dict(modifiers)
+        self.rng = random.Random(seed)
+
+    def add_modifiers(self, modifiers):
+        self.modifiers.update(modifiers)
+
+    def flatten(self, rule, rng=None):
+        '''Expands rule, a string like '#origin#'.'''
+        expansion = _Expansion(self, rng or self.rng)
+        return clear_escape_chars(expansion.rule(_compile_pushed(rule)))
+
+
+class _Expansion(object):
+    __slots__ = ('symbols', 'modifiers', 'choice', 'stacks')
+
+    def __init__(self, grammar, rng):
+        self.symbols = grammar.symbols
+        self.modifiers = grammar.modifiers
+        self.choice = rng.choice
+        # Rule stacks for symbols which have been pushed or popped during this expansion
+        self.stacks = {}
+
+    def rule(self, rule):
+        if rule.__class__ is str:
+            return rule
+
+        parts = []
+        for segment in rule:
+            cls = segment.__class__
+            if cls is str:
+                parts.append(segment)
+            elif cls is Tag:
+                parts.append(self.tag(segment))
+            else:
+                self.action(segment)
+        return ''.join(parts)
+
+    def tag(self, tag):
+        for action in tag.actions:
+            self.action(action)
+
+        symbol = tag.symbol
+        stack = self.stacks.get(symbol)
+        if stack is not None:
+            text = self.rule(self.choice(stack[-1]))
+        else:
+            rules = self.symbols.get(symbol)
+            if rules is None:
+                text = '(({}))'.format(symbol)
+            else:
+                text = self.rule(self.choice(rules))
+
+        for name, params in tag.modifiers:
+            modifier = self.modifiers.get(name)
+            if modifier is None:
+                text += '((.' + name + '))'
+            else:
+                text = modifier(text, *params)
+
+        return text
+
+    def action(self, action):
+        cls = action.__class__
+        if cls is Push:
+            rules = tuple(_compile_pushed(self.rule(r)) for r in action.rules)
+            self._stack(action.target, create=True).append(rules)
+        elif cls is Pop:
+            stack = self._stack(action.target, create=False)
+            if stack is not None:
+                stack.pop()
+        else:
+            self.rule(action.rule)
+
+    def _stack(self, symbol, create):
+        try:
+            return self.stacks[symbol]
+        except KeyError:
+            pass
+
+        if symbol in self.symbols:
+            stack = [self.symbols[symbol]]
+        elif create:
+            stack = []
+        else:
+            return None
+
+        self.stacks[symbol] = stack
+        return stack
+
+
+def load(f):
+    '''Loads a grammar source from a YAML (or JSON) file object, or string.'''
+    return yaml.load(f, Loader=yaml.CLoader)
+
+
+traceryish_rx = re.compile(r'#(\w+)(?:\.\w+)*#')
+
+
+def fmap(f, val):
+    if isinstance(val, list):
+        return [fmap(f, x) for x in val]
+    else:
+        return f(val)
+
+
+def validate(j, skip_keys=()):
+    '''Raises ValueError if j uses an undefined symbol, or if any symbol but origin and
+    skip_keys goes unused.'''
+    used = {'origin'} | set(skip_keys)
+    for k, v in j.items():
+        def _validate(val, k=k):
+            for var in traceryish_rx.findall(val):
+                if var not in j:
+                    raise ValueError(k, val, var)
+                used.add(var)
+        fmap(_validate, v)
+
+    unused = j.keys() - used
+    if unused:
+        raise ValueError(unused)
+
+
+def space(val):
+    return val.replace(' ', '#SPACE#')
+
+
+def transform(j, skip_keys=()):
+    '''Replaces spaces with #SPACE# in every rule, except those of skip_keys.'''
+    return {
+        k: v if k in skip_keys else fmap(space, v)
+        for k, v in j.items()
+    }
+
+
+class Source(object):
+    '''A grammar as loaded from YAML or JSON, and the forms derived from it; each computed at
+    most once.'''
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._compiled = None
+
+    @classmethod
+    def parse(cls, data):
+        return cls(load(data))
+
+    def validate(self, skip_keys=()):
+        validate(self.raw, skip_keys)
+        return self
+
+    def transform(self, skip_keys=()):
+        return Source(transform(self.raw, skip_keys))
+
+    def compile(self):
+        if self._compiled is None:
+            self._compiled = compile_grammar(self.raw)
+        return self._compiled
+
+    def to_json(self):
+        return json.dumps(self.raw, indent=2, sort_keys=True)
+
+
+def default_cache_dir():
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                        'fewerror')
+
+
+def load_cached(path, build, version, cache_dir=None, name=None):
+    '''Returns build(the contents of path, as a string). Unless cache_dir is None, the result is
+    pickled there, keyed by name (by default, path's basename), version and the file's hash,
+    and later calls for the same file just unpickle it. Bump version when build changes.'''
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if cache_dir is None:
+        return build(data.decode('utf-8'))
+
+    if name is None:
+        name, _ = os.path.splitext(os.path.basename(path))
+    digest = hashlib.sha256(data).hexdigest()
+    cache_path = os.path.join(cache_dir, '{}.{}.{}.pickle'.format(name, version, digest))
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception:
+        log.warning('Ignoring unreadable cache %s', cache_path, exc_info=True)
+
+    result = build(data.decode('utf-8'))
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(prefix=os.path.basename(cache_path), suffix='.tmp',
+                                         dir=cache_dir, delete=False) as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(f.name, cache_path)
+
+        # Clear out caches of previous versions of the file
+        for old in glob.glob(os.path.join(cache_dir, '{}.*.pickle'.format(glob.escape(name)))):
+            if old != cache_path:
+                os.remove(old)
+    except OSError:
+        log.warning('Failed to cache %s', path, exc_info=True)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Expand a tracery grammar')
+    parser.add_argument('source', type=argparse.FileType('r'),
+                        help='grammar, in YAML or JSON')
+    parser.add_argument('-n', type=int, default=5, help='number of expansions')
+    parser.add_argument('--rule', default='#origin#', help='(default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--benchmark', action='store_true',
+                        help='compare expansions per second with tracery')
+    parser.add_argument('--stats', action='store_true',
+                        help='print statistics about each symbol, rather than expanding')
+    parser.add_argument('--limit', type=int, default=280,
+                        help='length to compute the chance of exceeding (default: %(default)s)')
+    args = parser.parse_args()
+
+    raw = load(args.source)
+
+    if args.stats:
+        print_stats(stats(compile_grammar(raw), args.limit), limit=args.limit)
+        return
+
+    if not args.benchmark:
+        grammar = Grammar(raw, seed=args.seed)
+        for _ in range(args.n):
+            print(grammar.flatten(args.rule))
+        return
+
+    t = time.perf_counter()
+    grammar = Grammar(raw, seed=args.seed)
+    compile_seconds = time.perf_counter() - t
+
+    slow = tracery.Grammar(raw)
+    slow.add_modifiers(base_english)
+
+    results = {}
+    for label, flatten in (('tracery', slow.flatten), ('compiled', grammar.flatten)):
+        t = time.perf_counter()
+        for _ in range(args.n):
+            flatten(args.rule)
+        results[label] = args.n / (time.perf_counter() - t)
+
+    json.dump({
+        'compile_seconds': compile_seconds,
+        'expansions_per_second': results,
+        'speedup': results['compiled'] / results['tracery'],
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
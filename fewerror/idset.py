@@ -0,0 +1,88 @@
+'''Sets of Twitter user ids, stored as sorted NumPy arrays.
+
+A Python set of a million ints costs the best part of 100 MB; the same ids as an int64 array
+cost 8 MB, intersect in milliseconds, and can be saved to disk and memory-mapped back.'''
+import os
+from tempfile import NamedTemporaryFile
+
+import numpy as np
+
+
+class IdSet(object):
+    '''An immutable set of integer ids.'''
+
+    def __init__(self, ids=()):
+        if isinstance(ids, IdSet):
+            self._ids = ids._ids
+        else:
+            if not isinstance(ids, np.ndarray):
+                ids = np.fromiter(ids, dtype=np.int64)
+            self._ids = np.unique(ids.astype(np.int64, copy=False))
+
+    @classmethod
+    def _from_unique(cls, ids):
+        s = cls.__new__(cls)
+        s._ids = ids
+        return s
+
+    @classmethod
+    def from_pages(cls, pages):
+        '''Builds a set from an iterable of lists of ids, such as tweepy.Cursor(...).pages().'''
+        arrays = [np.asarray(page, dtype=np.int64) for page in pages]
+        return cls(np.concatenate(arrays) if arrays else ())
+
+    @property
+    def array(self):
+        '''The ids, sorted, as a read-only array.'''
+        return self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        for i in self._ids:
+            yield int(i)
+
+    def __contains__(self, id_):
+        i = np.searchsorted(self._ids, id_)
+        return i < len(self._ids) and self._ids[i] == id_
+
+    def contains(self, ids):
+        '''Vectorised membership test: returns a boolean array, one per element of ids.'''
+        ids = np.asarray(ids, dtype=np.int64)
+        i = np.searchsorted(self._ids, ids)
+        i[i == len(self._ids)] = 0
+        return (self._ids[i] == ids) if len(self._ids) else np.zeros(ids.shape, dtype=bool)
+
+    def _other(self, other):
+        return other if isinstance(other, IdSet) else IdSet(other)
+
+    def __and__(self, other):
+        return self._from_unique(np.intersect1d(self._ids, self._other(other)._ids,
+                                                assume_unique=True))
+
+    def __or__(self, other):
+        return self._from_unique(np.union1d(self._ids, self._other(other)._ids))
+
+    def __sub__(self, other):
+        return self._from_unique(np.setdiff1d(self._ids, self._other(other)._ids,
+                                              assume_unique=True))
+
+    def __eq__(self, other):
+        return isinstance(other, IdSet) and np.array_equal(self._ids, other._ids)
+
+    def __repr__(self):
+        return '<IdSet: {} ids>'.format(len(self))
+
+    def save(self, path):
+        '''Writes the set to path (a .npy file), atomically.'''
+        directory = os.path.dirname(os.path.abspath(path))
+        with NamedTemporaryFile(prefix=os.path.basename(path), suffix='.tmp', dir=directory,
+                                delete=False) as f:
+            np.save(f, self._ids)
+        os.rename(f.name, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        '''Reads a set written by save(); by default memory-mapped rather than read in.'''
+        return cls._from_unique(np.load(path, mmap_mode='r' if mmap else None))
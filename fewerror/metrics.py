@@ -0,0 +1,280 @@
+'''Just enough of the Prometheus client to count things and time things, and serve them in the
+text exposition format from a background thread.
+
+Updating a metric costs a dict lookup and an uncontended lock, so it's fine on the hot path;
+nothing is formatted until something scrapes /metrics.'''
+import bisect
+import contextlib
+import logging
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30.)
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    '''http.server.ThreadingHTTPServer, which only arrived in Python 3.7.'''
+    daemon_threads = True
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+
+    def escape(v):
+        return str(v).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+    return '{' + ','.join('{}="{}"'.format(k, escape(v)) for k, v in pairs) + '}'
+
+
+def _format_value(v):
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric(object):
+    type_ = None
+    # Appended to the name in the exposition, as Prometheus expects of counters
+    suffix = ''
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(self.name, self.labelnames, labelvalues)
+
+        labelvalues = tuple(str(v) for v in labelvalues)
+        try:
+            return self._children[labelvalues]
+        except KeyError:
+            with self._lock:
+                return self._children.setdefault(labelvalues, self._new_child())
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        '''Yields (suffix, labelvalues, extra labels, value).'''
+        if self.labelnames:
+            children = sorted(self._children.items())
+        else:
+            children = [((), self.labels())]
+
+        for labelvalues, child in children:
+            for suffix, extra, value in child.samples():
+                yield suffix, labelvalues, extra, value
+
+    def expose(self):
+        name = self.name + self.suffix
+        lines = [
+            '# HELP {} {}'.format(name, self.help.replace('\n', ' ')),
+            '# TYPE {} {}'.format(name, self.type_),
+        ]
+        for suffix, labelvalues, extra, value in self._samples():
+            lines.append('{}{}{} {}'.format(
+                name, suffix,
+                _format_labels(self.labelnames, labelvalues, extra),
+                _format_value(value)))
+        return '\n'.join(lines)
+
+    @property
+    def _unlabelled(self):
+        # Unlabelled metrics can be used directly: counter.inc() rather than
+        # counter.labels().inc()
+        try:
+            return self._children[()]
+        except KeyError:
+            return self.labels()
+
+
+class _CounterChild(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+    def samples(self):
+        yield '', (), self.value
+
+
+class Counter(_Metric):
+    type_ = 'counter'
+    suffix = '_total'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, n=1):
+        self._unlabelled.inc(n)
+
+
+class _GaugeChild(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+        self._function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+    def dec(self, n=1):
+        self.inc(-n)
+
+    def set_function(self, f):
+        '''Have the gauge read f() whenever it is scraped, rather than being set.'''
+        self._function = f
+
+    def samples(self):
+        yield '', (), self._function() if self._function is not None else self.value
+
+
+class Gauge(_Metric):
+    type_ = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._unlabelled.set(value)
+
+    def inc(self, n=1):
+        self._unlabelled.inc(n)
+
+    def dec(self, n=1):
+        self._unlabelled.dec(n)
+
+    def set_function(self, f):
+        self._unlabelled.set_function(f)
+
+
+class _HistogramChild(object):
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.
+
+    def observe(self, value):
+        i = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    @contextlib.contextmanager
+    def time(self):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t)
+
+    def samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            sum_ = self._sum
+
+        cumulative = 0
+        for le, n in zip(self._buckets + (float('inf'),), counts):
+            cumulative += n
+            yield '_bucket', (('le', _format_value(float(le))),), cumulative
+        yield '_sum', (), sum_
+        yield '_count', (), cumulative
+
+
+class Histogram(_Metric):
+    type_ = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._unlabelled.observe(value)
+
+    def time(self):
+        return self._unlabelled.time()
+
+
+class Registry(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        '''Registering a second metric with the same name returns the first, so modules can be
+        reloaded (and tests can construct things repeatedly) without complaint.'''
+        with self._lock:
+            existing = self._metrics.setdefault(metric.name, metric)
+
+        if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+            raise ValueError('{} already registered as a different metric'.format(metric.name))
+        return existing
+
+    def expose(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return ''.join(m.expose() + '\n' for m in metrics)
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labelnames=()):
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name, help, labelnames=()):
+    return REGISTRY.register(Gauge(name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.registry.expose().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug('%s %s', self.address_string(), format % args)
+
+
+def serve(port, addr=''):
+    '''Serves /metrics on (addr, port) from a daemon thread. Returns the server.'''
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    log.info('Serving metrics on http://%s:%d/metrics', *server.server_address[:2])
+    return server
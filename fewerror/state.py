@@ -32,6 +32,12 @@ class State(object):
         return '<State: {} replied_to, {} last_time_for_word>'.format(
             len(self._replied_to), len(self._last_time_for_word))
 
+    def sizes(self):
+        return {
+            'replied_to': len(self._replied_to),
+            'last_time_for_word': len(self._last_time_for_word),
+        }
+
     def __eq__(self, value):
         return (
             self._state_filename == value._state_filename and
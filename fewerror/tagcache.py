@@ -0,0 +1,165 @@
+'''An on-disk cache of part-of-speech tags, keyed by the text tagged and the tagger's model.
+
+Tagging dominates find_corrections' runtime, and replays, benchmarks, corpus evaluation and the
+grammar tests tag the same texts over and over. With a cache, only the first run pays for
+tagging; later runs (say, while fiddling with match()) only pay for matching, and needn't even
+load the model unless they meet a text they haven't seen.
+
+Entries are stored in an SQLite database, keyed by a 16-byte hash of the text salted with
+model_version(), so upgrading NLTK or the model makes old entries unreachable rather than
+wrong. Once there are more than max_entries, the least recently used are evicted.'''
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import nltk
+import textblob
+from nltk.tag.perceptron import PICKLE
+
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+tag_cache_lookups = metrics.counter(
+    'fewerror_tag_cache_lookups', 'Lookups in the part-of-speech tag cache', ('result',))
+
+# Bump if what is stored, or how, changes
+FORMAT = 2
+DEFAULT_MAX_ENTRIES = 200000
+# When evicting, make this much room, so we don't have to evict again on the very next put
+EVICT_TO = 0.9
+# Hits only update an entry's last use every this many hits
+TOUCH_BATCH = 1000
+
+
+def add_arguments(parser):
+    parser.add_argument('--tag-cache', metavar='FILE.sqlite3',
+                        help='cache part-of-speech tags in FILE.sqlite3 (default: off)')
+    parser.add_argument('--tag-cache-size', type=int, default=DEFAULT_MAX_ENTRIES,
+                        metavar='N', help='keep at most N cached sentences '
+                                          '(default: %(default)s)')
+
+
+def model_version():
+    '''Everything the tags for a text depend on: the versions of NLTK and of TextBlob (whose
+    tokenizer splits the text into words), and which copy of the tagger's weights is installed.'''
+    parts = ['format={}'.format(FORMAT), 'nltk={}'.format(nltk.__version__),
+             'textblob={}'.format(textblob.__version__)]
+    try:
+        path = nltk.data.find('taggers/averaged_perceptron_tagger/' + PICKLE)
+        st = os.stat(str(path))
+        parts.append('model={}:{}'.format(st.st_size, st.st_mtime_ns))
+    except LookupError:
+        # Tagging will fail anyway, so there's nothing to get wrong
+        parts.append('model=missing')
+    return ' '.join(parts)
+
+
+class TagCache(object):
+    '''Maps texts to their (word, tag) sequences, in an SQLite database. Each process should
+    open its own; the database is safe to share between them. Within a process, it's safe to use
+    from several threads (like the Telegram bot's workers) at once.'''
+
+    def __init__(self, filename, max_entries=DEFAULT_MAX_ENTRIES, version=None):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.version = model_version() if version is None else version
+        self.hits = 0
+        self.misses = 0
+
+        self._salt = hashlib.sha256(self.version.encode('utf-8')).digest()
+        self._touched = set()
+        # Guards _touched, _entries and the connection
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        with self._db:
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS tags (
+                    key BLOB PRIMARY KEY,
+                    tags TEXT NOT NULL,
+                    used REAL NOT NULL
+                ) WITHOUT ROWID''')
+            self._db.execute('CREATE INDEX IF NOT EXISTS tags_used ON tags (used)')
+        self._entries = len(self)
+
+    def _key(self, text):
+        return hashlib.sha256(self._salt + text.encode('utf-8')).digest()[:16]
+
+    def __len__(self):
+        with self._lock:
+            return self._count()
+
+    def _count(self):
+        return self._db.execute('SELECT COUNT(*) FROM tags').fetchone()[0]
+
+    def get(self, text):
+        '''Returns the tags stored for text, as a list of (word, tag) tuples; or None.'''
+        key = self._key(text)
+        with self._lock:
+            row = self._db.execute('SELECT tags FROM tags WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                tag_cache_lookups.labels('miss').inc()
+                return None
+
+            self.hits += 1
+            tag_cache_lookups.labels('hit').inc()
+            self._touched.add(key)
+            if len(self._touched) >= TOUCH_BATCH:
+                self._flush()
+        return [tuple(pair) for pair in json.loads(row[0])]
+
+    def put(self, text, tags):
+        '''Stores tags, a sequence of (word, tag) pairs, for text.'''
+        value = json.dumps([[str(word), str(tag)] for word, tag in tags],
+                           ensure_ascii=False, separators=(',', ':'))
+        key = self._key(text)
+        with self._lock:
+            with self._db:
+                cursor = self._db.execute('INSERT OR REPLACE INTO tags VALUES (?, ?, ?)',
+                                          (key, value, time.time()))
+            self._entries += cursor.rowcount
+            if self._entries > self.max_entries:
+                self._evict()
+
+    def flush(self):
+        '''Records when entries which have been hit were last used.'''
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._touched:
+            return
+        now = time.time()
+        with self._db:
+            self._db.executemany('UPDATE tags SET used = ? WHERE key = ?',
+                                 ((now, key) for key in self._touched))
+        self._touched.clear()
+
+    def evict(self):
+        '''Evicts the least recently used entries, until there's room for some more.'''
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        self._flush()
+        excess = self._count() - int(self.max_entries * EVICT_TO)
+        if excess > 0:
+            with self._db:
+                self._db.execute('''
+                    DELETE FROM tags WHERE key IN (
+                        SELECT key FROM tags ORDER BY used LIMIT ?
+                    )''', (excess,))
+            log.info('Evicted %d entries from %s', excess, self.filename)
+        self._entries = self._count()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._db.close()
@@ -2,17 +2,45 @@
 # vim: fileencoding=utf-8
 
 import argparse
+import functools
+import hashlib
 import logging
 import os
+import socket
+import time
 import telegram
 from telegram.ext import (
-    Updater, CommandHandler, MessageHandler, Filters,
+    Updater, CommandHandler, MessageHandler, Filters, TypeHandler,
 )
 
-from . import checkedshirt, find_corrections, format_reply
+from . import checkedshirt, find_corrections, format_reply, lessish_rx, metrics, warm_up
+from .util import KeyedWorkQueue
 
 log = logging.getLogger(__name__)
 
+# How long to wait for the webhook server to start listening
+WEBHOOK_START_TIMEOUT = 10
+
+messages_received = metrics.counter(
+    'fewerror_telegram_messages_received', 'Text messages received')
+corrections_found = metrics.counter(
+    'fewerror_telegram_corrections_found', 'Messages with at least one correction')
+replies_posted = metrics.counter(
+    'fewerror_telegram_replies_posted', 'Replies sent')
+api_call_seconds = metrics.histogram(
+    'fewerror_telegram_api_call_seconds', 'Time spent in Telegram API calls', ('method',))
+queue_depth = metrics.gauge(
+    'fewerror_queue_depth', 'Items waiting in internal queues', ('queue',))
+messages_prefiltered = metrics.counter(
+    'fewerror_telegram_messages_prefiltered', "Text messages which don't mention less")
+messages_dropped = metrics.counter(
+    'fewerror_telegram_messages_dropped', "Messages dropped because their chat's queue was full")
+webhook_updates = metrics.counter(
+    'fewerror_telegram_webhook_updates', 'Updates received by the webhook')
+handler_seconds = metrics.histogram(
+    'fewerror_telegram_handler_seconds',
+    'Time from receiving a message to finishing with it, including time queued')
+
 
 def _context(message):
     """Just for logging convenience"""
@@ -31,19 +59,108 @@ def on_start(bot, update):
                          "should say ‘fewer’.")
 
 
-def on_message(bot, update):
+def on_message(bot, update, chats):
+    '''Runs on the dispatcher: queues messages which might need correcting for their chat's
+    worker.'''
+    messages_received.inc()
     message = update.message
-    context = _context(message)
-    qs = find_corrections(message.text)
-    if qs:
-        log.info('<%s> %s', context, update.message.text)
+    if not lessish_rx.search(message.text):
+        messages_prefiltered.inc()
+        return
+
+    if not chats.put(message.chat_id, (bot, message, time.perf_counter())):
+        messages_dropped.inc()
+        log.warning('<%s> queue full; dropping %s', _context(message), message.text)
+
+
+def handle_message(item):
+    '''Runs on a worker, in order for each chat.'''
+    bot, message, received = item
+    try:
+        qs = find_corrections(message.text)
+        if qs:
+            corrections_found.inc()
+            log.info('<%s> %s', _context(message), message.text)
+
+            reply = format_reply(qs)
+            log.info('--> %s', reply)
+            with api_call_seconds.labels('sendMessage').time():
+                bot.sendMessage(
+                    chat_id=message.chat_id,
+                    reply_to_message_id=message.message_id,
+                    text=reply)
+            replies_posted.inc()
+    finally:
+        handler_seconds.observe(time.perf_counter() - received)
+
+
+def on_webhook_update(bot, update):
+    webhook_updates.inc()
+
+
+def add_webhook_arguments(parser):
+    group = parser.add_argument_group('webhook',
+                                      'Receive updates over HTTP, rather than polling for them')
+    group.add_argument('--webhook-port', metavar='PORT', type=int, default=None,
+                       help='listen for updates on PORT')
+    group.add_argument('--webhook-listen', metavar='ADDR', default='127.0.0.1',
+                       help='listen on ADDR (default: %(default)s)')
+    group.add_argument('--webhook-path', metavar='PATH', default=None,
+                       help='accept updates POSTed to PATH (default: derived from the token)')
+    group.add_argument('--webhook-url', metavar='URL', default=None,
+                       help='register URL + PATH (where a proxy forwards to ADDR:PORT) '
+                            'with Telegram')
+
+
+def make_updater(token, args, **kwargs):
+    '''Returns an Updater with our handlers, and the KeyedWorkQueue on which a pool of
+    args.workers handles each chat's messages.'''
+    # Load the tagger before the workers all want it at once
+    warm_up()
+    chats = KeyedWorkQueue(handle_message, workers=args.workers,
+                           maxsize=args.chat_queue_size, name='telegram')
+
+    updater = Updater(token=token, **kwargs)
+    dispatcher = updater.dispatcher
+    queue_depth.labels('telegram_updates').set_function(updater.update_queue.qsize)
+    queue_depth.labels('telegram_chats').set_function(chats.qsize)
+    dispatcher.add_handler(CommandHandler('start', on_start))
+    dispatcher.add_handler(MessageHandler(Filters.text,
+                                          functools.partial(on_message, chats=chats)))
+    return updater, chats
+
+
+def start_webhook(updater, args):
+    '''Starts updater's webhook server and dispatcher. TLS is left to a proxy in front of it,
+    so unless given --webhook-url, the webhook isn't registered with Telegram.'''
+    path = args.webhook_path
+    if path is None:
+        # Only Telegram should know where to send updates
+        path = '/' + hashlib.sha256(updater.bot.token.encode('utf-8')).hexdigest()[:32]
+
+    # In a group of its own, so it sees every update, before our other handlers
+    updater.dispatcher.add_handler(TypeHandler(telegram.Update, on_webhook_update), group=-1)
+    updater.start_webhook(listen=args.webhook_listen, port=args.webhook_port, url_path=path)
+    # start_webhook() returns before the server is listening, and stopping the updater in the
+    # meantime can hang, so don't let anyone think they can use it yet
+    _wait_until_listening((args.webhook_listen, args.webhook_port))
+
+    if args.webhook_url is not None:
+        updater.bot.set_webhook(url=args.webhook_url.rstrip('/') + path)
 
-        reply = format_reply(qs)
-        log.info('--> %s', reply)
-        bot.sendMessage(
-            chat_id=message.chat_id,
-            reply_to_message_id=message.message_id,
-            text=reply)
+    log.info('Listening for updates on %s:%d', args.webhook_listen, args.webhook_port)
+
+
+def _wait_until_listening(address, timeout=WEBHOOK_START_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(address, timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
 
 
 def main():
@@ -51,15 +168,23 @@ def main():
         description='Annoy some Telegram users. '
                     'Set $TELEGRAM_BOT_TOKEN for success.')
     checkedshirt.add_arguments(parser)
+    add_webhook_arguments(parser)
+    parser.add_argument('--workers', metavar='N', type=int, default=4,
+                        help='look for corrections in up to N chats at once '
+                             '(default: %(default)s)')
+    parser.add_argument('--chat-queue-size', metavar='N', type=int, default=20,
+                        help='drop messages when N are already waiting in the same chat '
+                             '(default: %(default)s)')
     args = parser.parse_args()
     checkedshirt.init(args)
 
     token = os.environ['TELEGRAM_BOT_TOKEN']
-    updater = Updater(token=token)
-    dispatcher = updater.dispatcher
-    dispatcher.add_handler(CommandHandler('start', on_start))
-    dispatcher.add_handler(MessageHandler(Filters.text, on_message))
-    updater.start_polling()
+    updater, _ = make_updater(token, args)
+
+    if args.webhook_port is None:
+        updater.start_polling()
+    else:
+        start_webhook(updater, args)
     updater.idle()
 
 
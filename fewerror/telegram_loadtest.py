@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+'''Load test for the Telegram bot in webhook mode.
+
+Runs the bot in this process, with its webhook on a local port and its Bot API pointed at a
+fake API server (also in this process) which records replies. Several keep-alive connections
+then POST synthetic updates to the webhook at a target rate, and we report the rate that was
+sustained, and the latency from POSTing each message to the bot's reply arriving.
+
+    python -m fewerror.telegram_loadtest --rate 500 --duration 30'''
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+from . import checkedshirt, pos_tagger, tagcache, telegram as bot, use_tag_cache
+from .metrics import ThreadingHTTPServer
+from .util import percentile
+
+log = logging.getLogger(__name__)
+
+TOKEN = '123456:fake-token-for-load-testing'
+
+TEXTS = [
+    'I have less apples than you',
+    'There were less people here yesterday',
+    'Less is more',
+    'I care less about this every day',
+    'nothing to see here',
+    'lunch?',
+    'see you at 3',
+    'more or less done, honestly, after all that',
+]
+
+
+class FakeBotAPI(ThreadingHTTPServer):
+    '''Just enough of the Bot API for the bot to reply to messages.'''
+
+    def __init__(self, address):
+        super(FakeBotAPI, self).__init__(address, FakeBotAPIHandler)
+        self.lock = threading.Lock()
+        self.replies = {}  # message_id -> time.perf_counter() when reply received
+        self.message_ids = itertools.count(1)
+
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        params = json.loads(body.decode('utf-8')) if body else {}
+        method = self.path.rsplit('/', 1)[-1]
+
+        if method == 'sendMessage':
+            now = time.perf_counter()
+            with self.server.lock:
+                self.server.replies[int(params['reply_to_message_id'])] = now
+            result = {
+                'message_id': next(self.server.message_ids),
+                'date': int(time.time()),
+                'chat': {'id': int(params['chat_id']), 'type': 'group', 'title': 'load'},
+                'text': params['text'],
+            }
+        elif method == 'getMe':
+            result = {'id': 123456, 'is_bot': True, 'first_name': 'fewerror',
+                      'username': 'fewerror_bot'}
+        elif method == 'getMyCommands':
+            result = []
+        else:
+            result = True
+
+        response = json.dumps({'ok': True, 'result': result}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+def synthetic_update(update_id, chat_id, text):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'group', 'title': 'chat {}'.format(chat_id)},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load',
+                     'username': 'load{}'.format(chat_id)},
+            'text': text,
+        },
+    }
+
+
+class Sender(threading.Thread):
+    '''POSTs updates over one keep-alive connection, at rate per second, until stop is set.'''
+
+    def __init__(self, address, path, ids, rate, chats, stop, seed):
+        super(Sender, self).__init__(daemon=True)
+        self.address = address
+        self.path = path
+        self.ids = ids
+        self.interval = 1. / rate
+        self.chats = chats
+        self.stop = stop
+        self.rng = random.Random(seed)
+        self.sent = {}  # message_id -> time.perf_counter() when POSTed
+        self.post_seconds = []
+        self.errors = 0
+
+    def run(self):
+        conn = http.client.HTTPConnection(*self.address)
+        next_at = time.perf_counter()
+        while not self.stop.is_set():
+            update_id = next(self.ids)
+            body = json.dumps(synthetic_update(update_id, self.rng.randrange(self.chats),
+                                               self.rng.choice(TEXTS)))
+            t = time.perf_counter()
+            try:
+                conn.request('POST', self.path, body=body,
+                             headers={'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    self.errors += 1
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(*self.address)
+                continue
+
+            self.sent[update_id] = t
+            self.post_seconds.append(time.perf_counter() - t)
+
+            next_at += self.interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        conn.close()
+
+
+def format_seconds(xs, ps=(0.5, 0.9, 0.99, 1.)):
+    xs = sorted(xs)
+    return ' '.join('p{:g}={:.1f}ms'.format(p * 100, 1000 * percentile(xs, p)) if xs else
+                    'p{:g}=-'.format(p * 100)
+                    for p in ps)
+
+
+def free_port(host):
+    '''A port nothing is listening on, since Updater.start_webhook can't tell us which port it
+    got if asked for port 0.'''
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    checkedshirt.add_arguments(parser)
+    parser.add_argument('--rate', type=float, default=200,
+                        help='updates per second to send, in total (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='seconds to send for (default: %(default)s)')
+    parser.add_argument('--connections', type=int, default=8,
+                        help='concurrent keep-alive connections (default: %(default)s)')
+    parser.add_argument('--chats', type=int, default=50,
+                        help='distinct chats to spread messages over (default: %(default)s)')
+    parser.add_argument('--drain', type=float, default=10,
+                        help='seconds to wait for outstanding replies (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--chat-queue-size', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    tagcache.add_arguments(parser)
+    args = parser.parse_args()
+    checkedshirt.init(args)
+    if args.tag_cache:
+        use_tag_cache(args.tag_cache, max_entries=args.tag_cache_size)
+
+    api = FakeBotAPI(('127.0.0.1', 0))
+    threading.Thread(target=api.serve_forever, name='fake-bot-api', daemon=True).start()
+    base_url = 'http://{}:{}/bot'.format(*api.server_address[:2])
+
+    args.webhook_listen = '127.0.0.1'
+    args.webhook_port = free_port(args.webhook_listen)
+    args.webhook_path = '/webhook'
+    args.webhook_url = None
+    updater, chats = bot.make_updater(TOKEN, args, base_url=base_url)
+    bot.start_webhook(updater, args)
+
+    ids = itertools.count(1)
+    stop = threading.Event()
+    senders = [Sender((args.webhook_listen, args.webhook_port), args.webhook_path, ids,
+                      args.rate / args.connections, args.chats, stop, args.seed + i)
+               for i in range(args.connections)]
+
+    started = time.perf_counter()
+    for s in senders:
+        s.start()
+    time.sleep(args.duration)
+    stop.set()
+    for s in senders:
+        s.join()
+    elapsed = time.perf_counter() - started
+
+    sent = {}
+    for s in senders:
+        sent.update(s.sent)
+
+    # Wait for the bot to catch up (nothing queued, and no more replies arriving), or give up
+    deadline = time.perf_counter() + args.drain
+    n_replies = -1
+    while time.perf_counter() < deadline:
+        with api.lock:
+            n = len(api.replies)
+        if n == n_replies and updater.update_queue.qsize() == 0 and chats.qsize() == 0:
+            break
+        n_replies = n
+        time.sleep(1)
+
+    with api.lock:
+        latencies = [t - sent[i] for i, t in api.replies.items() if i in sent]
+
+    print('sent       {} updates in {:.1f}s: {:.1f}/s ({} errors)'.format(
+        len(sent), elapsed, len(sent) / elapsed, sum(s.errors for s in senders)))
+    print('POST       {}'.format(format_seconds(
+        [x for s in senders for x in s.post_seconds])))
+    print('replies    {} ({:.1f}/s)'.format(len(latencies), len(latencies) / elapsed))
+    print('reply      {}'.format(format_seconds(latencies)))
+    print('dropped    {}'.format(bot.messages_dropped.labels().value))
+
+    updater.stop()
+    chats.shutdown(wait=False)
+    api.shutdown()
+    if pos_tagger.cache is not None:
+        # Workers may still be tagging, so just save what they've used
+        pos_tagger.cache.flush()
+
+
+if __name__ == '__main__':
+    main()
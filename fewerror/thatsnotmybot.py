@@ -1,71 +1,194 @@
 #!/usr/bin/env python3
 import argparse
+import functools
+import hashlib
 import logging
+import multiprocessing
 import os
-import re
+import random
+import sys
+import statistics
+import tempfile
 import textblob
-import tracery
+import time
 import tweepy
 import yaml
 
 from tracery.modifiers import base_english
 
 from fewerror.twitter import auth_from_env, status_url
-from fewerror import checkedshirt
+from fewerror import checkedshirt, grammar, pos_tagger
+from fewerror.util import BloomFilter, imap_bounded
 
 SOURCE = os.path.join(os.path.dirname(__file__), 'thatsnotmybot.yaml')
-traceryish_rx = re.compile(r'#(\w+)(?:\.\w+)*#')
+# Each worker process in sample() generates this many texts at a time, from its own seed
+SAMPLE_CHUNK_SIZE = 1000
+# ...and has at most this many chunks submitted to it but not yet written out
+SAMPLE_CHUNKS_IN_FLIGHT = 2
 
 log = logging.getLogger(__name__)
 
 
-def fmap(f, val):
-    if isinstance(val, list):
-        return [fmap(f, x) for x in val]
-    else:
-        return f(val)
+class _NotCached(Exception):
+    '''Raised by _build() with a result which should be used, but not cached.'''
+    def __init__(self, result):
+        super().__init__()
+        self.result = result
+
+
+def _build(data):
+    source = grammar.Source.parse(data).validate()
+    compiled = source.compile()
+    verbs = precompute_verbs(compiled)
+    result = source.raw, compiled, verbs
+    if verbs is None:
+        # Or else the verbs would stay missing from the cache even once the tagger is installed
+        raise _NotCached(result)
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def cache_version():
+    '''A hash of this module and of grammar, which between them decide what load_source()
+    returns: so that changing either invalidates the cache, without anyone having to remember
+    to.'''
+    h = hashlib.sha256()
+    for module in (grammar, sys.modules[__name__]):
+        with open(module.__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def load_source(path=SOURCE, cache_dir=None):
+    '''Returns the validated grammar in path, its compiled form, and precompute_verbs() for
+    it. Parsing 12,000 lines of YAML (and then compiling them) takes most of the time it takes
+    to construct the bot, so unless cache_dir is None, the results are cached there.'''
+    try:
+        return grammar.load_cached(path, _build, cache_version(), cache_dir)
+    except _NotCached as e:
+        return e.result
 
 
-def validate(j):
-    used = {'origin', }
-    for k, v in j.items():
-        def _validate(val, k=k):
-            for var in traceryish_rx.findall(val):
-                if var not in j:
-                    raise ValueError(k, val, var)
-                used.add(var)
-        fmap(_validate, v)
+@functools.lru_cache(maxsize=4096)
+def agreeing_verb(noun_phrase):
+    '''Extremely crude {is,are} agreement: ' are' if noun_phrase ends in a plural noun, or else
+    ' is'.'''
+    s = textblob.Sentence(noun_phrase, pos_tagger=pos_tagger)
+    _, pos_tag = s.pos_tags[-1]
+    return ' are' if pos_tag in ('NNS', 'NNPS') else ' is'
 
-    unused = j.keys() - used
-    if unused:
-        raise ValueError(unused)
 
+def precompute_verbs(compiled):
+    '''agreeing_verb() for every phrase the grammar can apply .is to, as a dict; or None if the
+    tagger isn't available.'''
+    phrases = grammar.modifier_inputs(compiled, 'is')
+    try:
+        return {phrase: agreeing_verb(phrase) for phrase in sorted(phrases)}
+    except (LookupError, textblob.exceptions.MissingCorpusError):
+        log.warning('Not precomputing is/are for %d phrases: tagger data missing', len(phrases))
+        return None
 
-def modifier_is(noun_phrase):
-    '''Extremely crude noun_phrase + {is,are} agreement.'''
-    s = textblob.Sentence(noun_phrase)
-    _, pos_tag = s.pos_tags[-1]
-    verb = ' are' if pos_tag in ('NNS', 'NNPS') else ' is'
+
+def modifier_is(noun_phrase, verbs=None):
+    '''noun_phrase + {is,are}, looked up in verbs (from precompute_verbs()) if possible.'''
+    verb = verbs.get(noun_phrase) if verbs else None
+    if verb is None:
+        verb = agreeing_verb(noun_phrase)
     return noun_phrase + verb
 
 
-class ThatsNotMyBot(object):
-    def __init__(self):
-        with open(SOURCE, 'r', encoding='utf-8') as f:
-            self.source = yaml.load(f, Loader=yaml.CLoader)
+# The bot in each of sample()'s worker processes
+_sampler = None
+
+
+def _init_sampler(cache_dir):
+    global _sampler
+    _sampler = ThatsNotMyBot(cache=cache_dir is not None, cache_dir=cache_dir)
+
+
+def _sample_chunk(task):
+    return _sampler.generate_many(*task)
 
-        validate(self.source)
-        self.grammar = tracery.Grammar(self.source)
+
+class ThatsNotMyBot(object):
+    def __init__(self, cache=True, cache_dir=None, seed=None):
+        if cache and cache_dir is None:
+            cache_dir = grammar.default_cache_dir()
+        self.cache_dir = cache_dir if cache else None
+        self.source, compiled, verbs = load_source(SOURCE, cache_dir if cache else None)
+        self.grammar = grammar.Grammar(compiled=compiled, seed=seed)
         self.grammar.add_modifiers(base_english)
-        self.grammar.add_modifiers({'is': modifier_is})
+        self.grammar.add_modifiers({'is': functools.partial(modifier_is, verbs=verbs)})
 
     def generate(self):
         return self.grammar.flatten('#origin#')
 
-    def sample(self, n):
+    def generate_many(self, n, seed):
+        rng = random.Random(seed)
+        return [self.grammar.flatten('#origin#', rng=rng) for _ in range(n)]
+
+    def sample(self, n, seed=None, jobs=1, output=sys.stdout, dedup=False, error_rate=0.001):
         '''Print out n sample texts'''
-        for _ in range(n):
-            print(self.generate())
+        # Texts are generated in chunks, each seeded from seed and its index, so the output for a
+        # given seed doesn't depend on the number of jobs.
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        tasks = ((min(SAMPLE_CHUNK_SIZE, n - start), '{}:{}'.format(seed, i))
+                 for i, start in enumerate(range(0, n, SAMPLE_CHUNK_SIZE)))
+
+        seen = BloomFilter(max(n, 1), error_rate)
+        distinct = 0
+        t = time.perf_counter()
+
+        pool = None
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs, _init_sampler, (self.cache_dir,))
+            chunks = imap_bounded(pool, _sample_chunk, tasks, jobs * SAMPLE_CHUNKS_IN_FLIGHT)
+        else:
+            chunks = (self.generate_many(*task) for task in tasks)
+
+        try:
+            for chunk in chunks:
+                for text in chunk:
+                    new = seen.add(text)
+                    distinct += new
+                    if new or not dedup:
+                        print(text, file=output)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        elapsed = time.perf_counter() - t
+        log.info('Generated %d texts in %.1fs (%.0f/s); about %d (%.1f%%) distinct',
+                 n, elapsed, n / elapsed if elapsed else 0, distinct,
+                 100 * distinct / n if n else 0)
+
+    def stats(self, limit, all_symbols=False):
+        '''Print the number of derivations of each symbol, and their lengths, without sampling'''
+        all_stats = grammar.stats(self.grammar.symbols, limit)
+        grammar.print_stats(all_stats, None if all_symbols else ['origin', 'not', 'is'],
+                            limit)
+
+    @staticmethod
+    def benchmark(n):
+        '''Time constructing the bot n times with a cold cache, and n times with a warm one'''
+        def construct(cache_dir):
+            t = time.perf_counter()
+            ThatsNotMyBot(cache_dir=cache_dir)
+            return time.perf_counter() - t
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cold = []
+            for _ in range(n):
+                for f in os.listdir(cache_dir):
+                    os.remove(os.path.join(cache_dir, f))
+                cold.append(construct(cache_dir))
+
+            warm = [construct(cache_dir) for _ in range(n)]
+
+        for label, ts in (('cold', cold), ('warm', warm)):
+            print('{}: median {:.1f}ms, min {:.1f}ms'.format(
+                label, 1000 * statistics.median(ts), 1000 * min(ts)))
 
     @staticmethod
     def get_twitter_api():
@@ -140,7 +263,25 @@ class ThatsNotMyBot(object):
         sample_parser = s.add_parser('sample', help=self.sample.__doc__)
         add_argument(sample_parser, 'n', type=int, nargs='?', default=5,
                      help='Number of sample texts')
-        sample_parser.set_defaults(cmd=lambda args: self.sample(args.n))
+        sample_parser.add_argument('--seed', type=int,
+                                   help='Seed the random choices, for repeatable samples')
+        add_argument(sample_parser, '--jobs', '-j', type=int, default=1,
+                     help='Generate in JOBS worker processes')
+        add_argument(sample_parser, '--output', '-o', type=argparse.FileType('w'), default='-',
+                     help='Write texts to OUTPUT')
+        sample_parser.add_argument('--dedup', action='store_true',
+                                   help='Only print the first of each distinct text')
+        add_argument(sample_parser, '--error-rate', type=float, default=0.001,
+                     help='Chance of wrongly counting a text as a duplicate')
+        sample_parser.set_defaults(cmd=lambda args: self.sample(
+            args.n, args.seed, args.jobs, args.output, args.dedup, args.error_rate))
+
+        stats_parser = s.add_parser('stats', help=self.stats.__doc__)
+        add_argument(stats_parser, '--limit', type=int, default=280,
+                     help='Show the chance of texts being longer than LIMIT characters')
+        stats_parser.add_argument('--all', action='store_true',
+                                  help='Show every symbol, not just the top-level ones')
+        stats_parser.set_defaults(cmd=lambda args: self.stats(args.limit, args.all))
 
         tweet_parser = s.add_parser('tweet', help=self.tweet.__doc__)
         add_argument(tweet_parser, '--state',
@@ -148,6 +289,11 @@ class ThatsNotMyBot(object):
                      help='Load and save state to STATE')
         tweet_parser.set_defaults(cmd=lambda args: self.tweet(args.state))
 
+        benchmark_parser = s.add_parser('benchmark', help=self.benchmark.__doc__)
+        add_argument(benchmark_parser, 'n', type=int, nargs='?', default=20,
+                     help='Number of constructions of each kind')
+        benchmark_parser.set_defaults(cmd=lambda args: self.benchmark(args.n))
+
         normalize = s.add_parser('normalize', help=self.normalize.__doc__)
         normalize.set_defaults(cmd=lambda args: self.normalize())
 
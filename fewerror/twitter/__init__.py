@@ -7,17 +7,44 @@ import random
 import re
 import time
 
+import requests
 import tweepy
+import urllib3
 from tweepy.streaming import StreamListener
 
-from .. import find_corrections, format_reply
+from .. import find_corrections, format_reply, lessish_rx, metrics, warm_up
+from ..idset import IdSet
 from ..state import State
-from ..util import reverse_inits, OrderedSet
+from ..util import reverse_inits, Backoff, OrderedSet
 from .util import user_url, status_url
-from .fmk import FMK, classify_user
+from .fmk import FMK, ClassificationCache, classify_user, fingerprint
+from .latency import LatencyTracker
+from .blocklist import Blocklist
+from .hydrate import FollowQueue, Hydrator
 
 log = logging.getLogger(__name__)
 
+# Follower snapshots older than this many seconds aren't used: see LessListener
+FOLLOWER_IDS_MAX_AGE = 6 * 60 * 60
+
+statuses_received = metrics.counter(
+    'fewerror_twitter_statuses_received', 'Statuses delivered by the stream')
+statuses_rejected = metrics.counter(
+    'fewerror_twitter_statuses_rejected', 'Statuses not replied to, by reason', ('reason',))
+corrections_found = metrics.counter(
+    'fewerror_twitter_corrections_found', 'Statuses with at least one correction')
+replies_posted = metrics.counter(
+    'fewerror_twitter_replies_posted', 'Replies posted')
+friendship_lookups = metrics.counter(
+    'fewerror_twitter_friendship_lookups', 'Calls to friendships/lookup')
+api_call_seconds = metrics.histogram(
+    'fewerror_twitter_api_call_seconds', 'Time spent in Twitter API calls', ('method',))
+reconnect_gap_seconds = metrics.histogram(
+    'fewerror_twitter_reconnect_gap_seconds', 'Time from losing the stream to reconnecting',
+    buckets=(.1, .5, 1., 5., 10., 30., 60., 300., 900.))
+state_entries = metrics.gauge(
+    'fewerror_state_entries', 'Entries in the reply state', ('account', 'kind'))
+
 
 def get_sanitized_text(status):
     if hasattr(status, 'extended_tweet'):
@@ -53,7 +80,6 @@ def get_sanitized_text(status):
     return text.strip()
 
 
-lessish_rx = re.compile(r'\bLESS\b', re.IGNORECASE)
 manual_rt_rx = re.compile(r'''\b[RM]T\b''')
 quote_rx = re.compile(r'''^['"‘“]''')
 
@@ -67,18 +93,74 @@ class LessListener(StreamListener):
         state_dir = kwargs.pop('state_dir')
         self.post_replies = kwargs.pop('post_replies', False)
         self.gather = kwargs.pop('gather', None)
+        self.latency = LatencyTracker(kwargs.pop('latency_log', None))
+        follower_ids = kwargs.pop('follower_ids', None)
+        follower_ids_max_age = kwargs.pop('follower_ids_max_age', FOLLOWER_IDS_MAX_AGE)
         StreamListener.__init__(self, *args, **kwargs)
         self.me = self.api.me()
 
         self._state = State.load(self.me.screen_name, state_dir)
+        for kind in self._state.sizes():
+            state_entries.labels(self.me.screen_name, kind).set_function(
+                lambda kind=kind: self._state.sizes()[kind])
+
+        self._blocklist = Blocklist.load(self.me.screen_name, state_dir)
+        self._hydrator = Hydrator(self.api)
+        self._classifications = ClassificationCache(
+            os.path.join(state_dir, 'classifications.sqlite3'))
+        self._follows = FollowQueue(self.handle_follows,
+                                    name='follows_{}'.format(self.me.screen_name))
 
         if self.gather:
             os.makedirs(self.gather, exist_ok=True)
 
+        # A snapshot of our followers' ids, as written by fetch-followers, lets us skip the
+        # friendships/lookup call for most non-followers. People who follow us while we're
+        # running are added to _new_followers by on_follow; but those who followed between the
+        # snapshot and now are taken for non-followers, so an old snapshot isn't trusted.
+        if follower_ids is not None and not isinstance(follower_ids, IdSet):
+            age = time.time() - os.stat(follower_ids).st_mtime
+            if age > follower_ids_max_age:
+                log.warning('%s is %.1f hours old; ignoring it, and looking up every author',
+                            follower_ids, age / 3600)
+                follower_ids = None
+            else:
+                follower_ids = IdSet.load(follower_ids)
+        self._follower_ids = follower_ids
+        self._new_followers = set()
+
+        self._connected_at = None
+        self._disconnected_at = None
+        self.last_reconnect_gap = None
+
     def on_connect(self):
         me = self.me
         log.info("streaming as @%s (#%d)", me.screen_name, me.id)
 
+        self._connected_at = time.monotonic()
+        if self._disconnected_at is not None:
+            self.last_reconnect_gap = self._connected_at - self._disconnected_at
+            reconnect_gap_seconds.observe(self.last_reconnect_gap)
+            log.info("reconnected after %.3fs", self.last_reconnect_gap)
+
+    def mark_disconnected(self):
+        '''Called when the stream has dropped. Returns how long we were connected for, in
+        seconds, or None if we never managed to connect.'''
+        self._disconnected_at = time.monotonic()
+        if self._connected_at is None:
+            return None
+
+        connected_for = self._disconnected_at - self._connected_at
+        self._connected_at = None
+        return connected_for
+
+    def might_follow_us(self, user_id):
+        '''False if our follower snapshot says user_id doesn't follow us; True if it says they
+        do, or if we have no snapshot.'''
+        return (self._follower_ids is None or
+                user_id in self._follower_ids or
+                user_id in self._new_followers)
+
     def on_error(self, status_code):
         log.info("HTTP status %d", status_code)
         return True  # permit tweepy.Stream to retry
@@ -125,23 +207,42 @@ class LessListener(StreamListener):
         with open(filename, 'w') as f:
             json.dump(obj=received_status._json, fp=f)
 
+    def _call(self, method, *args, **kwargs):
+        with api_call_seconds.labels(method).time():
+            return getattr(self.api, method)(*args, **kwargs)
+
+    # Statuses rejected for these reasons were never candidates for a correction
+    NOT_CANDIDATES = frozenset(('retweet', 'no_less'))
+
     def on_status(self, status):
+        statuses_received.inc()
+        timing = self.latency.start(status)
+        reason = self._on_status(status, timing)
+        if reason is not None:
+            statuses_rejected.labels(reason).inc()
+
+        if reason not in self.NOT_CANDIDATES:
+            outcome = reason or ('replied' if self.post_replies else 'dry_run')
+            self.latency.finish(timing, outcome)
+
+    def _on_status(self, status, timing):
+        '''Returns why we didn't reply, if we didn't.'''
         to_mention = OrderedSet()
 
         # Reply to the original when a tweet is RTed properly
         if hasattr(status, 'retweeted_status'):
             # Ignore real RTs
-            return
+            return 'retweet'
 
         text = get_sanitized_text(status)
         if not lessish_rx.search(text):
-            return
+            return 'no_less'
 
         log.info("%s %s", status_url(status), text)
 
         if looks_like_retweet(text):
             log.info('…looks like a manual RT, skipping')
-            return
+            return 'manual_rt'
 
         self.save_tweet(status)
 
@@ -149,13 +250,17 @@ class LessListener(StreamListener):
             quantities = find_corrections(text)
         except Exception:
             log.exception(u'exception while wrangling ‘%s’:', text)
-            return
+            return 'error'
+
+        self.latency.found(timing)
 
         if not quantities:
-            return
+            return 'no_corrections'
+
+        corrections_found.inc()
 
         if not self._state.can_reply(status.id, quantities):
-            return
+            return 'state'
 
         to_mention.add(status.author.screen_name)
         for x in status.entities['user_mentions']:
@@ -165,7 +270,13 @@ class LessListener(StreamListener):
         to_mention.discard(self.me.screen_name)
         log.info('would like to mention %s', to_mention)
 
-        for rel in self.api.lookup_friendships(screen_names=tuple(to_mention)):
+        if not mentioned_me and not self.might_follow_us(status.author.id):
+            log.info('sender %s is not in our follower snapshot, not replying',
+                     status.author.screen_name)
+            return 'not_followed'
+
+        friendship_lookups.inc()
+        for rel in self._call('lookup_friendships', screen_names=tuple(to_mention)):
             if not rel.is_followed_by:
                 # If someone explicitly tags us, they're fair game
                 is_author = rel.screen_name == status.author.screen_name
@@ -174,12 +285,12 @@ class LessListener(StreamListener):
 
                 if rel.is_following:
                     log.info(u"%s no longer follows us; unfollowing", rel.screen_name)
-                    self.api.destroy_friendship(screen_name=rel.screen_name)
+                    self._call('destroy_friendship', screen_name=rel.screen_name)
 
         if status.author.screen_name not in to_mention:
             log.info('sender %s does not follow us (any more), not replying',
                      status.author.screen_name)
-            return
+            return 'not_followed'
 
         # Keep dropping mentions until the reply is short enough
         # TODO: hashtags?
@@ -200,12 +311,14 @@ class LessListener(StreamListener):
             if self.post_replies:
                 # TODO: I think tweepy commit f99b1da broke calling this without naming the status
                 # parameter by adding media_ids before *args -- why do the tweepy tests pass?
-                r = self.api.update_status(status=reply, in_reply_to_status_id=status.id)
+                r = self._call('update_status', status=reply, in_reply_to_status_id=status.id)
                 log.info("  %s", status_url(r))
+                replies_posted.inc()
 
                 self._state.record_reply(status.id, quantities, r.id)
         else:
             log.info('too long, not replying')
+            return 'too_long'
 
     def on_event(self, event):
         if event.source.id == self.me.id:
@@ -221,30 +334,63 @@ class LessListener(StreamListener):
 
     def on_follow(self, whom):
         log.info("followed by %s", user_url(whom))
+        self._new_followers.add(whom.id)
         if whom.following:
             return
 
-        classification = classify_user(self.api, whom)
+        # Classifying them may take API calls, so don't hold up the stream
+        self._follows.put(whom)
+
+    def handle_follows(self, users):
+        '''Called on the follow queue's thread with batches of new followers.'''
+        # Users we've classified before, and who haven't changed since, needn't be looked up.
+        # They're cached under their fingerprint as delivered, without a status.
+        # One user whose timeline we can't see, or whom we can't block or follow, shouldn't cost
+        # the rest of the batch their turn
+        to_hydrate = []
+        for whom in users:
+            classification = self._classifications.get(whom.id, fingerprint(whom))
+            if classification is None:
+                to_hydrate.append(whom)
+                continue
+
+            try:
+                self._act_on_follow(whom, classification)
+            except tweepy.TweepError:
+                log.warning('Failed to handle follow by %s', whom.screen_name, exc_info=True)
+
+        for whom, hydrated in zip(to_hydrate, self._hydrator.hydrate(to_hydrate)):
+            try:
+                classification = classify_user(self._hydrator, hydrated)
+                self._classifications.put(whom.id, fingerprint(whom), classification)
+                self._act_on_follow(hydrated, classification)
+            except tweepy.TweepError:
+                log.warning('Failed to handle follow by %s', whom.screen_name, exc_info=True)
+
+    def _act_on_follow(self, whom, classification):
         if classification == FMK.BLOCK:
             log.info('blocking %s', user_url(whom))
             self.block(whom.id)
         elif classification == FMK.FOLLOW_BACK:
-            # TODO: delay this
             log.info("following %s back", user_url(whom))
-            whom.follow()
+            with api_call_seconds.labels('create_friendship').time():
+                whom.follow()
 
     def block(self, user_id):
-        self.api.create_block(user_id=user_id,
-                              include_entities=False,
-                              skip_status=True)
+        self._call('create_block',
+                   user_id=user_id,
+                   include_entities=False,
+                   skip_status=True)
+        self._blocklist.add(user_id)
 
 
-def auth_from_env():
-    consumer_key = os.environ["CONSUMER_KEY"]
-    consumer_secret = os.environ["CONSUMER_SECRET"]
+def auth_from_env(prefix=''):
+    '''Reads credentials from $CONSUMER_KEY, etc., or $<prefix>CONSUMER_KEY, etc.'''
+    consumer_key = os.environ[prefix + "CONSUMER_KEY"]
+    consumer_secret = os.environ[prefix + "CONSUMER_SECRET"]
 
-    access_token = os.environ["ACCESS_TOKEN"]
-    access_token_secret = os.environ["ACCESS_TOKEN_SECRET"]
+    access_token = os.environ[prefix + "ACCESS_TOKEN"]
+    access_token_secret = os.environ[prefix + "ACCESS_TOKEN_SECRET"]
 
     auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
     auth.set_access_token(access_token, access_token_secret)
@@ -252,20 +398,69 @@ def auth_from_env():
     return auth
 
 
+def make_api(auth):
+    return tweepy.API(
+        auth,
+        wait_on_rate_limit=True,
+        wait_on_rate_limit_notify=True,
+        # It looks like if retry_count is 0 (the default), wait_on_rate_limit=True will not
+        # actually retry after a rate limit.
+        retry_count=1)
+
+
+# Errors which just mean it's time to reconnect. (tweepy.Stream retries HTTP errors and
+# timeouts itself.)
+STREAM_ERRORS = (
+    requests.exceptions.RequestException,
+    urllib3.exceptions.HTTPError,
+    ConnectionError,
+)
+
+# If a connection lasted at least this long, the next failure starts backing off afresh.
+STABLE_CONNECTION_SECONDS = 60
+
+
 def stream(api, args):
+    # Everything expensive -- who we are, our state, the tagger -- is set up once, not on
+    # every reconnect.
+    warm_up()
+    listener = LessListener(api,
+                            post_replies=args.post_replies,
+                            gather=args.gather,
+                            state_dir=args.state,
+                            latency_log=args.latency_log,
+                            follower_ids=args.follower_ids,
+                            follower_ids_max_age=args.follower_ids_max_age * 3600)
+    run_stream(listener, use_public_stream=args.use_public_stream)
+
+
+def run_stream(listener, use_public_stream=False):
+    '''Streams to listener forever, reconnecting as needed.'''
+    stream = tweepy.Stream(listener.api.auth, listener)
+    backoff = Backoff()
+
     while True:
         try:
-            listener = LessListener(api,
-                                    post_replies=args.post_replies,
-                                    gather=args.gather,
-                                    state_dir=args.state)
-
-            stream = tweepy.Stream(api.auth, listener)
-            if args.use_public_stream:
+            if use_public_stream:
                 stream.filter(track=['less'])
             else:
                 stream.userstream(replies='all')
+
+            log.warning('Stream ended')
+            delay = None
         except tweepy.RateLimitError:
             log.warning("Rate-limited, and Tweepy didn't save us; time for a nap",
                         exc_info=True)
-            time.sleep(15 * 60)
+            delay = 15 * 60
+        except STREAM_ERRORS:
+            log.warning('Stream failed', exc_info=True)
+            delay = None
+
+        connected_for = listener.mark_disconnected()
+        if connected_for is not None and connected_for >= STABLE_CONNECTION_SECONDS:
+            backoff.reset()
+
+        if delay is None:
+            delay = backoff.next()
+        log.info('Reconnecting in %.1fs', delay)
+        time.sleep(delay)
@@ -3,9 +3,7 @@ import argparse
 import logging
 import os
 
-import tweepy
-
-from . import auth_from_env, batch, stream
+from . import FOLLOWER_IDS_MAX_AGE, accounts, auth_from_env, batch, make_api, stream
 from .. import checkedshirt
 
 log = logging.getLogger(__name__)
@@ -36,6 +34,18 @@ def main():
                                'degustation (default: {})'.format(gather_dir))
     stream_p.add_argument('--state', metavar='DIR', default=var,
                           help='store state in DIR (default: {})'.format(var))
+    stream_p.add_argument('--latency-log', metavar='FILE', default=None,
+                          help='append per-status reply latencies to FILE; see '
+                               'python -m fewerror.twitter.latency')
+    stream_p.add_argument('--follower-ids', metavar='FILE.npy', default=None,
+                          help='only look up friendships for authors in this follower snapshot '
+                               '(followers.ids.npy, as written by fetch-followers). Anyone who '
+                               'followed after it was written, but before the stream started, '
+                               'is taken for a non-follower')
+    stream_p.add_argument('--follower-ids-max-age', metavar='HOURS', type=float,
+                          default=FOLLOWER_IDS_MAX_AGE / 3600,
+                          help="ignore the follower snapshot if it's older than this "
+                               '(default: %(default)s)')
 
     modes = stream_p.add_argument_group('stream mode').add_mutually_exclusive_group()
     modes.add_argument('--post-replies', action='store_true',
@@ -43,20 +53,23 @@ def main():
     modes.add_argument('--use-public-stream', action='store_true',
                        help='search public tweets for "less", rather than your own stream')
 
+    # stream-many
+    many_p = subparsers.add_parser('stream-many', help=u'annoy some tweeps from several accounts',
+                                   description=accounts.stream_many.__doc__)
+    many_p.set_defaults(func=accounts.stream_many, needs_api=False)
+    many_p.add_argument('config', type=argparse.FileType('r'), metavar='ACCOUNTS.yaml',
+                        help='per-account configuration')
+
     batch.add_subcommands(subparsers, var)
 
     args = parser.parse_args()
     checkedshirt.init(args)
 
-    log.info('Initializing API')
-    auth = auth_from_env()
-    api = tweepy.API(
-        auth,
-        wait_on_rate_limit=True,
-        wait_on_rate_limit_notify=True,
-        # It looks like if retry_count is 0 (the default), wait_on_rate_limit=True will not
-        # actually retry after a rate limit.
-        retry_count=1)
+    if getattr(args, 'needs_api', True):
+        log.info('Initializing API')
+        api = make_api(auth_from_env())
+    else:
+        api = None
     args.func(api, args)
 
 
@@ -0,0 +1,112 @@
+'''Running several bot identities from one process.
+
+Each account gets its own credentials, State file and stream connection, but they all share
+this process's tagger, word lists and other module-level caches, which are most of the memory
+(and all of the start-up time) of a single bot. So an extra account costs a connection, a
+thread and its State, not another copy of NLTK.'''
+import logging
+import os
+import threading
+
+import yaml
+
+from . import FOLLOWER_IDS_MAX_AGE, LessListener, auth_from_env, make_api, run_stream
+from .. import warm_up
+
+log = logging.getLogger(__name__)
+
+ACCOUNT_KEYS = frozenset((
+    'name',
+    'env_prefix',
+    'state',
+    'gather',
+    'latency_log',
+    'follower_ids',
+    'follower_ids_max_age',
+    'post_replies',
+    'use_public_stream',
+))
+
+DEFAULTS = {
+    'env_prefix': '',
+    'state': os.path.abspath('var'),
+    'gather': None,
+    'latency_log': None,
+    'follower_ids': None,
+    'follower_ids_max_age': FOLLOWER_IDS_MAX_AGE / 3600,
+    'post_replies': False,
+    'use_public_stream': False,
+}
+
+
+def load_accounts(f):
+    '''Parses a file like:
+
+        defaults:
+          post_replies: true
+        accounts:
+          - name: fewerror
+          - name: fewerror_uk
+            env_prefix: UK_
+            state: var/uk
+
+    into a list of dicts, one per account, with the defaults filled in. env_prefix is
+    prepended to CONSUMER_KEY etc. when reading that account's credentials from the
+    environment.'''
+    config = yaml.safe_load(f) or {}
+    defaults = dict(DEFAULTS, **config.get('defaults', {}))
+
+    accounts = []
+    names = set()
+    for i, account in enumerate(config.get('accounts', [])):
+        account = dict(defaults, **account)
+        unknown = account.keys() - ACCOUNT_KEYS
+        if unknown:
+            raise ValueError('account {}: unknown keys {}'.format(i, ', '.join(sorted(unknown))))
+
+        name = account.setdefault('name', 'account{}'.format(i))
+        if name in names:
+            raise ValueError('account {}: duplicate name {}'.format(i, name))
+        names.add(name)
+
+        accounts.append(account)
+
+    if not accounts:
+        raise ValueError('no accounts configured')
+
+    return accounts
+
+
+def stream_many(api, args):
+    '''Stream several accounts from one process, sharing one correction engine.'''
+    accounts = load_accounts(args.config)
+
+    warm_up()
+
+    threads = []
+    for account in accounts:
+        log.info('Initializing API for %s', account['name'])
+        account_api = make_api(auth_from_env(account['env_prefix']))
+        listener = LessListener(account_api,
+                                post_replies=account['post_replies'],
+                                gather=account['gather'],
+                                state_dir=account['state'],
+                                latency_log=account['latency_log'],
+                                follower_ids=account['follower_ids'],
+                                follower_ids_max_age=account['follower_ids_max_age'] * 3600)
+        t = threading.Thread(target=run_stream,
+                             name=account['name'],
+                             args=(listener,),
+                             kwargs={'use_public_stream': account['use_public_stream']},
+                             daemon=True)
+        threads.append(t)
+
+    for t in threads:
+        t.start()
+
+    # If any stream dies for good, take the process down so it gets restarted
+    while all(t.is_alive() for t in threads):
+        threads[0].join(timeout=60)
+
+    dead = [t.name for t in threads if not t.is_alive()]
+    raise RuntimeError('stream thread(s) died: {}'.format(', '.join(dead)))
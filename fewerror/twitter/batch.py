@@ -1,14 +1,25 @@
 import argparse
-import glob
+import collections
+import gzip
+import itertools
 import json
 import logging
+import multiprocessing
 import os
 import re
+import sys
 import time
+from tempfile import NamedTemporaryFile
 
+import numpy as np
 import tweepy
 
-from . import FMK, classify_user, user_url
+from . import FMK, classify_user, columnar, user_url
+from .fmk import ClassificationCache
+from .blocklist import Blocklist
+from .pacing import Journal, Pacer, rate_limit
+from ..idset import IdSet
+from ..util import chunked
 
 log = logging.getLogger(__name__)
 
@@ -31,78 +42,367 @@ def get_user_kwargs(args):
         raise ValueError(args)
 
 
-def save_user(user, directory):
-    path = os.path.join(directory, 'user.{}.json'.format(user.id_str))
-    with open(path, 'w') as f:
-        json.dump(obj=user._json, fp=f)
+SNAPSHOT = 'followers.jsonl'
+CHECKPOINT = 'followers.checkpoint.json'
+FOLLOWER_IDS = 'followers.ids.npy'
+user_filename_rx = re.compile(r'user.(\d+).json')
 
 
-def fetch_followers(api, args):
-    '''Fetches all followers' JSON and saves them to the given directory.
+def _open_snapshot(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    else:
+        return open(path, mode, encoding='utf-8')
+
+
+def _snapshots(directory):
+    for name in (SNAPSHOT, SNAPSHOT + '.gz'):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            yield path
+
+
+def _snapshot_lines(path):
+    with _open_snapshot(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def iter_user_lines(directory):
+    '''Yields the unparsed JSON of each user in a directory populated by fetch-followers: both
+    the followers.jsonl[.gz] snapshot, and the user.<id>.json files that older versions
+    wrote.'''
+    for path in _snapshots(directory):
+        yield from _snapshot_lines(path)
+
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if user_filename_rx.match(filename):
+                with open(os.path.join(dirpath, filename), 'r', encoding='utf-8') as f:
+                    yield f.read()
+
+
+def iter_users(directory):
+    '''Like iter_user_lines, but parsed.'''
+    for line in iter_user_lines(directory):
+        yield json.loads(line)
+
+
+def iter_user_ids(directory, limit=None):
+    '''Like iter_users, but only the ids, which for user.<id>.json are in the filename. If limit
+    is given, only the first limit lines of the snapshot are read.'''
+    snapshot_ids = (json.loads(line)['id']
+                    for path in _snapshots(directory)
+                    for line in _snapshot_lines(path))
+    yield from itertools.islice(snapshot_ids, limit)
+
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            m = user_filename_rx.match(filename)
+            if m:
+                yield int(m.group(1))
+
+
+def load_follower_ids(directory):
+    '''Returns an IdSet of the followers in a directory populated by fetch-followers. The ids
+    are cached in followers.ids.npy, which fetch-followers rewrites whenever it finishes, and
+    which is rebuilt here if missing or older than the snapshot.'''
+    path = os.path.join(directory, FOLLOWER_IDS)
+    try:
+        mtime = os.path.getmtime(path)
+    except FileNotFoundError:
+        mtime = None
+
+    if mtime is not None and all(os.path.getmtime(s) <= mtime for s in _snapshots(directory)):
+        return IdSet.load(path)
+
+    return _save_follower_ids(directory)
+
+
+def _save_follower_ids(directory):
+    ids = IdSet(iter_user_ids(directory))
+    ids.save(os.path.join(directory, FOLLOWER_IDS))
+    return ids
+
+
+def _load_checkpoint(directory):
+    try:
+        with open(os.path.join(directory, CHECKPOINT), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_checkpoint(directory, checkpoint):
+    path = os.path.join(directory, CHECKPOINT)
+    with NamedTemporaryFile(prefix=CHECKPOINT, suffix='.tmp', dir=directory, mode='w',
+                            delete=False) as f:
+        json.dump(obj=checkpoint, fp=f)
+    os.rename(f.name, path)
+
+
+def _truncate_snapshot(path, size):
+    '''Discards anything appended to the snapshot after the checkpoint recorded its size: a
+    page written by a fetch which was interrupted before it could save the cursor, and which
+    will be fetched again. (Each page of a gzipped snapshot is a gzip member of its own, so
+    this works for them too.)'''
+    if size is None or not os.path.exists(path):
+        return
+
+    extra = os.path.getsize(path) - size
+    if extra > 0:
+        log.info('Discarding %d bytes written after the last checkpoint', extra)
+        with open(path, 'r+b') as f:
+            f.truncate(size)
+
 
-    Files will have names of the form 'user.<numeric id>.json'.'''
+def fetch_followers(api, args):
+    '''Fetches all followers' JSON to followers.jsonl (or followers.jsonl.gz) in the given
+    directory, one user per line, a page at a time.
+
+    Progress is checkpointed after every page, so an interrupted fetch picks up where it left
+    off when run again, discarding any page it wrote but did not checkpoint. Once a fetch has
+    completed, --incremental fetches just the followers who arrived since, stopping at the
+    first one already in the snapshot; it is checkpointed too, remembering how much of the
+    snapshot was there beforehand, so that a resumed --incremental doesn't stop at a follower
+    it appended itself. --restart throws the snapshot away and starts again.'''
     os.makedirs(args.directory, exist_ok=True)
+    checkpoint = _load_checkpoint(args.directory)
 
+    if args.restart:
+        for path in list(_snapshots(args.directory)):
+            os.remove(path)
+        try:
+            os.remove(os.path.join(args.directory, FOLLOWER_IDS))
+        except FileNotFoundError:
+            pass
+        checkpoint = {}
+
+    if not checkpoint:
+        snapshot = SNAPSHOT + ('.gz' if args.compress else '')
+        checkpoint = {'snapshot': snapshot, 'next_cursor': -1, 'n': 0}
+    elif 'incremental' in checkpoint and not args.incremental:
+        log.info('Previous --incremental fetch did not complete; run with --incremental to '
+                 'resume it, or --restart to start again')
+        return
+    elif checkpoint['next_cursor'] == 0 and not args.incremental:
+        log.info('%s is complete (%d followers); use --incremental to fetch new followers, '
+                 'or --restart to start again', checkpoint['snapshot'], checkpoint['n'])
+        return
+    elif checkpoint['next_cursor'] != 0 and args.incremental:
+        raise ValueError('Previous fetch did not complete; run without --incremental to '
+                         'resume it first')
+
+    if args.incremental:
+        incremental = checkpoint.get('incremental')
+        if incremental is None:
+            known = load_follower_ids(args.directory)
+            log.info('Fetching followers newer than the %d we have', len(known))
+            incremental = checkpoint['incremental'] = {'next_cursor': -1, 'known': checkpoint['n']}
+            _save_checkpoint(args.directory, checkpoint)
+        else:
+            # The snapshot now includes the new followers fetched so far; we must not stop at them
+            known = IdSet(iter_user_ids(args.directory, limit=incremental['known']))
+            log.info('Resuming fetching followers newer than the %d we had, after %d new ones',
+                     len(known), checkpoint['n'] - incremental['known'])
+        cursor = incremental['next_cursor']
+    else:
+        incremental = None
+        known = None
+        cursor = checkpoint['next_cursor']
+        if checkpoint['n']:
+            log.info('Resuming after %d followers', checkpoint['n'])
+
+    path = os.path.join(args.directory, checkpoint['snapshot'])
+    _truncate_snapshot(path, checkpoint.get('size'))
     n = api.me().followers_count
-    g = tweepy.Cursor(api.followers, count=200).items()
-
-    for i, follower in enumerate(g, 1):
-        log.info('[%d/%d] %s', i, n, follower.screen_name)
-        save_user(follower, args.directory)
+    g = tweepy.Cursor(api.followers, count=200, cursor=cursor).pages()
+
+    for page in g:
+        if known is not None:
+            new = []
+            for follower in page:
+                if follower.id in known:
+                    break
+                new.append(follower)
+            page, done = new, len(new) < len(page)
+        else:
+            done = False
+
+        with _open_snapshot(path, 'a') as f:
+            f.writelines(json.dumps(follower._json) + '\n' for follower in page)
+
+        checkpoint['n'] += len(page)
+        checkpoint['size'] = os.path.getsize(path)
+        if incremental is None:
+            checkpoint['next_cursor'] = g.next_cursor
+        else:
+            incremental['next_cursor'] = g.next_cursor
+        _save_checkpoint(args.directory, checkpoint)
+
+        log.info('[%d/%d] ...%s', checkpoint['n'], n,
+                 page[-1].screen_name if page else '')
+        if done:
+            break
+
+    if incremental is not None:
+        del checkpoint['incremental']
+        _save_checkpoint(args.directory, checkpoint)
+
+    log.info('Done; %d followers in %s', checkpoint['n'], path)
+    if known is not None or checkpoint['next_cursor'] == 0:
+        _save_follower_ids(args.directory)
 
 
 def fetch_mutuals(api, args):
-    '''Intersects a directory of user.*.json (as populated with fetch-followers) with users
-    following USER_ID/SCREEN_NAME.'''
+    '''Intersects a directory populated with fetch-followers with users following
+    USER_ID/SCREEN_NAME.'''
 
-    mine = {
-        int(re.match(r'user.(\d+).json', os.path.basename(f)).group(1))
-        for f in glob.glob(os.path.join(args.directory, 'user.*.json'))
-    }
-    mutuals = set()
+    mine = load_follower_ids(args.directory)
+    n = 0
 
     kwargs = get_user_kwargs(args)
     kwargs['count'] = 5000
 
+    pacer = Pacer(api, max_delay=60)
     g = tweepy.Cursor(api.followers_ids, **kwargs).pages()
     for i, page in enumerate(g, 1):
-        m = (mine & set(page))
+        m = mine & page
         log.info('Page %d: %d mutuals', i, len(m))
         print('\n'.join(map(str, m)), flush=True)
-        mutuals |= m
-        time.sleep(60)
+        n += len(m)
+        pacer.wait()
 
-    log.info('Done; %d mutuals total', len(mutuals))
+    log.info('Done; %d mutuals total', n)
 
 
-def classify(api, args):
-    classes = {e: set() for e in FMK}
-    for dirpath, _, filenames in os.walk(args.directory):
-        for filename in filenames:
-            if not re.match(r'user.\d+.json', filename):
-                continue
+CLASSIFY_CHUNK_SIZE = 1000
+ALREADY_FOLLOWING = 'already following'
+
+
+def _label(c):
+    return c.name.lower().replace('_', ' ')
 
-            with open(os.path.join(dirpath, filename), 'rb') as f:
-                j = json.load(f)
 
-            user = tweepy.models.User.parse(api, j)
-            c = classify_user(api, user, fetch_statuses=False)
-            classes[c].add(user)
+# This process's ClassificationCache, if classify was given --cache
+_classification_cache = None
 
-    for user in classes[FMK.BLOCK]:
-        args.block_file.write('{}\n'.format(user.id))
 
-    already_following = {u for u in classes[FMK.FOLLOW_BACK] if u.following}
-    classes[FMK.FOLLOW_BACK] -= already_following
+def _open_classification_cache(filename):
+    '''Opens the cache for this process; run once in each of classify's worker processes.'''
+    global _classification_cache
+    _classification_cache = ClassificationCache(filename, source='batch') if filename else None
 
-    results = {'already following': len(already_following)}
-    for e, us in classes.items():
-        results[e.name.lower().replace('_', ' ')] = len(us)
 
-    w = max(map(len, results))
-    v = max(len(str(n)) for n in results.values())
-    for label, n in results.items():
-        print('{:>{w}}: {:{v}} users'.format(label, n, w=w, v=v))
+def _classify_lines(lines):
+    '''Classifies a chunk of users' JSON; returns ([ids to block], Counter of labels, Counter
+    of cache hits and misses).'''
+    cache = _classification_cache
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    block_ids = []
+    counts = collections.Counter()
+    for line in lines:
+        user = tweepy.models.User.parse(None, json.loads(line))
+        c = classify_user(None, user, fetch_statuses=False, cache=cache)
+        if c == FMK.BLOCK:
+            block_ids.append(user.id)
+
+        if c == FMK.FOLLOW_BACK and user.following:
+            counts[ALREADY_FOLLOWING] += 1
+        else:
+            counts[_label(c)] += 1
+
+    cache_counts = collections.Counter()
+    if cache is not None:
+        cache_counts.update(hit=cache.hits - hits, miss=cache.misses - misses)
+
+    return block_ids, counts, cache_counts
+
+
+def classify(api, args):
+    '''Classifies a directory populated with fetch-followers, writing the ids of users to
+    block as it goes.
+
+    Users are read lazily and classified in chunks across a pool of processes; only the
+    chunks in flight and the totals are held in memory. With --cache, verdicts are cached, so
+    users who haven't changed since the last run aren't classified again; but since classify
+    never fetches timelines, that is usually slower than classifying them afresh.'''
+    chunks = chunked(iter_user_lines(args.directory), CLASSIFY_CHUNK_SIZE)
+    results = collections.Counter()
+    cache_results = collections.Counter()
+
+    def collect(block_ids, counts, cache_counts):
+        args.block_file.writelines('{}\n'.format(i) for i in block_ids)
+        args.block_file.flush()
+        results.update(counts)
+        cache_results.update(cache_counts)
+        log.info('Classified %d users', sum(results.values()))
+
+    if args.jobs <= 1:
+        _open_classification_cache(args.cache)
+        try:
+            for chunk in chunks:
+                collect(*_classify_lines(chunk))
+        finally:
+            if _classification_cache is not None:
+                _classification_cache.close()
+    else:
+        with multiprocessing.Pool(args.jobs, _open_classification_cache, (args.cache,)) as pool:
+            # Pool.imap_unordered would read the whole input up front, so feed it a few
+            # chunks per worker at a time.
+            for window in chunked(chunks, 4 * args.jobs):
+                for result in pool.imap_unordered(_classify_lines, window):
+                    collect(*result)
+
+    if args.cache:
+        lookups = cache_results['hit'] + cache_results['miss']
+        log.info('Classification cache: %d/%d hits (%.1f%%)',
+                 cache_results['hit'], lookups,
+                 100 * cache_results['hit'] / lookups if lookups else 0)
+
+    _print_counts(results)
+
+
+def _print_counts(results):
+    labels = [ALREADY_FOLLOWING] + [_label(e) for e in FMK]
+    w = max(map(len, labels))
+    v = max(len(str(results[label])) for label in labels)
+    for label in labels:
+        print('{:>{w}}: {:{v}} users'.format(label, results[label], w=w, v=v))
+
+
+def export_columns(api, args):
+    '''Converts a directory populated with fetch-followers to one array per field, in
+    DIRECTORY/columns, for classify-columns.'''
+    output = os.path.join(args.directory, columnar.COLUMNS_DIRECTORY)
+    columns = columnar.from_lines(iter_user_lines(args.directory))
+    columns.save(output)
+    log.info('Wrote %d users to %s', len(columns), output)
+
+
+def classify_columns(api, args):
+    '''Classifies the followers exported by export-columns all at once, optionally writing the
+    ids of users to block; and summarises them by language.'''
+    columns = columnar.Columns.load(os.path.join(args.directory, columnar.COLUMNS_DIRECTORY))
+    fmk = columnar.classify(columns)
+
+    if args.block_file is not None:
+        block_ids = columns.id[fmk == FMK.BLOCK.value]
+        args.block_file.writelines('{}\n'.format(i) for i in block_ids)
+
+    already_following = (fmk == FMK.FOLLOW_BACK.value) & columns.following
+    results = collections.Counter({
+        _label(e): int(np.count_nonzero(fmk == e.value)) for e in FMK
+    })
+    results[ALREADY_FOLLOWING] = int(np.count_nonzero(already_following))
+    results[_label(FMK.FOLLOW_BACK)] -= results[ALREADY_FOLLOWING]
+    _print_counts(results)
+
+    print()
+    counts = np.bincount(columns.lang, minlength=len(columns.langs))
+    for i in np.argsort(-counts)[:args.top_langs]:
+        print('{:>8}: {} users'.format(columns.langs[i] or '?', counts[i]))
 
 
 def report_spam(api, *args, **kwargs):
@@ -118,16 +418,32 @@ def report_spam(api, *args, **kwargs):
                 #
                 # Annoyingly, this is a different error code to the normal
                 # “rate-limited“ error code so tweepy's built-in rate limiting
-                # doesn't apply.
+                # doesn't apply. If the response says when the limit resets, wait until
+                # then; otherwise guess, less optimistically each time.
+                limit = rate_limit(api)
+                if limit is not None:
+                    delay = max(0, limit[1] - time.time()) + 1
+                else:
+                    delay = sleep_time
+                    sleep_time *= 1.5
+
                 log.info("Over the spam-report limit; sleeping for %ds",
-                         sleep_time, exc_info=True)
-                time.sleep(sleep_time)
-                sleep_time *= 1.5
+                         delay, exc_info=True)
+                time.sleep(delay)
             else:
                 raise
 
 
-def _block_many(api, to_block_ids, timeout, report):
+def _block_many(api, to_block_ids, timeout, report, journal=None, blocklist=None,
+                per_window=None):
+    '''Blocks and unfollows each of an IdSet of users, waiting at most timeout seconds between
+    users. The endpoints involved don't report their rate limits, so without per_window (users
+    per 15-minute window) that means waiting timeout seconds. Ids in journal are skipped, and
+    the rest are added to it as they are processed; new blocks are added to blocklist.'''
+    if journal is not None:
+        to_block_ids -= journal.ids
+
+    pacer = Pacer(api, max_delay=timeout, budget=per_window)
     n = len(to_block_ids)
     for i, to_block_id in enumerate(to_block_ids, 1):
         try:
@@ -142,6 +458,9 @@ def _block_many(api, to_block_ids, timeout, report):
                                      skip_status=True)
                 log.info('blocked %s (#%d)', user_url(u), to_block_id)
 
+            if blocklist is not None:
+                blocklist.add(to_block_id)
+
             api.destroy_friendship(user_id=to_block_id)
             log.info('Unfollowed #%d', to_block_id)
         except tweepy.TweepError as e:
@@ -153,48 +472,86 @@ def _block_many(api, to_block_ids, timeout, report):
             else:
                 raise
 
+        if journal is not None:
+            journal.record(to_block_id)
+
         if i < n:
-            time.sleep(timeout)
+            pacer.wait()
+
+
+def _load_blocklist(api, args):
+    '''Loads our local blocklist from the state directory, reconciling it with the API if
+    asked to, or if it is more than --max-age days old.'''
+    blocklist = Blocklist.load(api.me().screen_name, args.state)
+    age = blocklist.age()
+    if args.reconcile or age is None or age > args.max_age * 24 * 60 * 60:
+        blocklist.reconcile(api)
+    return blocklist
+
+
+def reconcile_blocks(api, args):
+    '''Refresh the local copy of our blocklist from the API.'''
+    blocklist = Blocklist.load(api.me().screen_name, args.state)
+    blocklist.reconcile(api)
+    blocklist.close()
 
 
 def block(api, args):
     '''Unfollow, block, and optionally report as spam many user IDs.'''
-    to_block_ids = {int(line) for line in args.block_file if line.strip()}
+    to_block_ids = IdSet(int(line) for line in args.block_file if line.strip())
     log.info('would like to unfollow block %d ids', len(to_block_ids))
 
-    existing_block_ids = set(tweepy.Cursor(api.blocks_ids).items())
-    log.info('%d existing blocks', len(existing_block_ids))
-    to_block_ids.difference_update(existing_block_ids)
+    blocklist = _load_blocklist(api, args)
+    log.info('%d existing blocks', len(blocklist))
+    to_block_ids -= blocklist.ids
 
-    _block_many(api, to_block_ids, timeout=args.timeout, report=args.report)
+    journal_path = args.journal
+    if journal_path is None and args.block_file is not sys.stdin:
+        journal_path = args.block_file.name + '.journal'
+
+    journal = Journal(journal_path) if journal_path else None
+    try:
+        _block_many(api, to_block_ids, timeout=args.timeout, report=args.report,
+                    journal=journal, blocklist=blocklist, per_window=args.per_window)
+    finally:
+        if journal is not None:
+            journal.close()
+        blocklist.close()
 
 
 def block_one(api, args):
     '''Block and unfollow a user, and (optionally) our friends who follow them.'''
 
     kwargs = get_user_kwargs(args)
+    blocklist = Blocklist.load(api.me().screen_name, args.state)
 
     if args.mutuals:
         log.info('Fetching our friends')
-        my_friends = set(tweepy.Cursor(api.friends_ids).items())
+        pacer = Pacer(api, max_delay=args.timeout)
+        my_friends = IdSet.from_pages(tweepy.Cursor(api.friends_ids).pages())
         log.info('Fetched %d friends', len(my_friends))
-        time.sleep(args.timeout)
+        pacer.wait()
+
+        def intersect_pages():
+            g = tweepy.Cursor(api.followers_ids, **kwargs).pages()
+            for i, page in enumerate(g, 1):
+                m = my_friends & page
+                log.info('Page %d: %d mutuals', i, len(m))
+                yield m.array
+                pacer.wait()
 
-        mutuals = set()
         log.info('Intersecting friends with users following %s', kwargs)
-        g = tweepy.Cursor(api.followers_ids, **kwargs).pages()
-        for i, page in enumerate(g, 1):
-            m = my_friends & set(page)
-            log.info('Page %d: %d mutuals', i, len(m))
-            mutuals |= m
-            time.sleep(args.timeout)
+        mutuals = IdSet.from_pages(intersect_pages())
 
-        _block_many(api, mutuals, timeout=args.timeout, report=False)
+        _block_many(api, mutuals - blocklist.ids, timeout=args.timeout, report=False,
+                    blocklist=blocklist, per_window=args.per_window)
 
     u = api.create_block(include_entities=False,
                          skip_status=True,
                          **kwargs)
     log.info('Blocked %s', user_url(u))
+    blocklist.add(u.id)
+    blocklist.close()
 
     api.destroy_friendship(**kwargs)
     log.info('Unfollowed %s', user_url(u))
@@ -219,6 +576,13 @@ def add_subcommands(subparsers, var):
     default_fetch_directory = os.path.join(var, 'followers')
     fetch_p.add_argument('directory', default=default_fetch_directory,
                          help='(default: {})'.format(default_fetch_directory))
+    fetch_p.add_argument('--compress', action='store_true',
+                         help='write a gzipped snapshot (for new fetches)')
+    fetch_mode = fetch_p.add_mutually_exclusive_group()
+    fetch_mode.add_argument('--incremental', action='store_true',
+                            help='only fetch followers newer than the last complete fetch')
+    fetch_mode.add_argument('--restart', action='store_true',
+                            help='discard any previous fetch and start again')
 
     # fetch-mutuals
     fetch_m = subparsers.add_parser('fetch-mutuals', help='intersect some tweeps',
@@ -228,14 +592,40 @@ def add_subcommands(subparsers, var):
     add_user_args(fetch_m)
 
     # classify
-    classify_p = subparsers.add_parser('classify', help='group some tweeps')
+    classify_p = subparsers.add_parser('classify', help='group some tweeps',
+                                       description=classify.__doc__)
     classify_p.set_defaults(func=classify)
+    classify_p.add_argument('--jobs', '-j', type=ℕ, default=os.cpu_count(),
+                            help='number of worker processes (default: %(default)s)')
+    classify_p.add_argument('--cache', metavar='FILE', default=None,
+                            help='remember verdicts in FILE; only worthwhile if looking them '
+                                 'up is slower than classifying afresh, which without '
+                                 'timelines it is not (default: off)')
     classify_p.add_argument('directory', default=default_fetch_directory,
                             help='(default: {})'.format(default_fetch_directory))
     classify_p.add_argument('block_file', type=argparse.FileType('w'),
                             help='file to store one numeric user id per line, '
                                  'as used by "block" command')
 
+    # export-columns
+    export_p = subparsers.add_parser('export-columns', help='columnize some tweeps',
+                                     description=export_columns.__doc__)
+    export_p.set_defaults(func=export_columns, needs_api=False)
+    export_p.add_argument('directory', default=default_fetch_directory,
+                          help='(default: {})'.format(default_fetch_directory))
+
+    # classify-columns
+    classify_c = subparsers.add_parser('classify-columns', help='group many tweeps',
+                                       description=classify_columns.__doc__)
+    classify_c.set_defaults(func=classify_columns, needs_api=False)
+    classify_c.add_argument('--top-langs', metavar='N', type=ℕ, default=10,
+                            help='show the N most common languages (default: %(default)s)')
+    classify_c.add_argument('directory', default=default_fetch_directory,
+                            help='(default: {})'.format(default_fetch_directory))
+    classify_c.add_argument('block_file', type=argparse.FileType('w'), nargs='?',
+                            help='file to store one numeric user id per line, '
+                                 'as used by "block" command')
+
     block_one_p = subparsers.add_parser('block-one', help='block one tweep',
                                         description=block_one.__doc__)
     block_one_p.set_defaults(func=block_one)
@@ -243,7 +633,22 @@ def add_subcommands(subparsers, var):
     block_one_p.add_argument('--mutuals', action='store_true',
                              help='Also block friends who follow them')
     block_one_p.add_argument('--timeout', type=ℕ, default=DEFAULT_BLOCK_TIMEOUT,
-                             help='delay in seconds between each API call')
+                             help='maximum delay in seconds between each API call')
+    block_one_p.add_argument('--per-window', metavar='N', type=ℕ, default=None,
+                             help='with --mutuals, block up to N users per 15 minutes, '
+                                  'still waiting at most --timeout between them '
+                                  '(default: wait --timeout)')
+    block_one_p.add_argument('--state', metavar='DIR', default=var,
+                             help='record the block in the local blocklist in DIR '
+                                  '(default: {})'.format(var))
+
+    # reconcile-blocks
+    reconcile_p = subparsers.add_parser('reconcile-blocks', help='refresh local blocklist',
+                                        description=reconcile_blocks.__doc__)
+    reconcile_p.set_defaults(func=reconcile_blocks)
+    reconcile_p.add_argument('--state', metavar='DIR', default=var,
+                             help='keep the local copy of our blocklist in DIR '
+                                  '(default: {})'.format(var))
 
     # block
     block_p = subparsers.add_parser('block', help='block some tweeps',
@@ -254,7 +659,22 @@ def add_subcommands(subparsers, var):
     block_p.add_argument('--report', action='store_true',
                          help='with --block, also report for spam')
     block_p.add_argument('--timeout', type=ℕ, default=DEFAULT_BLOCK_TIMEOUT,
-                         help='delay in seconds between each API call')
+                         help='maximum delay in seconds between each user')
+    block_p.add_argument('--per-window', metavar='N', type=ℕ, default=None,
+                         help="block up to N users per 15 minutes, since Twitter doesn't say "
+                              'how many blocks it allows; still waiting at most --timeout '
+                              'between them (default: wait --timeout)')
+    block_p.add_argument('--journal', metavar='FILE', default=None,
+                         help='record processed ids in FILE, and skip those already there '
+                              '(default: BLOCK_FILE.journal)')
+    block_p.add_argument('--state', metavar='DIR', default=var,
+                         help='keep the local copy of our blocklist in DIR '
+                              '(default: {})'.format(var))
+    block_p.add_argument('--max-age', metavar='DAYS', type=ℕ, default=7,
+                         help='refresh the local blocklist from the API if it is older '
+                              'than this (default: %(default)s)')
+    block_p.add_argument('--reconcile', action='store_true',
+                         help='refresh the local blocklist from the API regardless')
 
 
 __all__ = ['add_subcommands']
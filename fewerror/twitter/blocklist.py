@@ -0,0 +1,134 @@
+'''A local copy of whom an account has blocked, so that we needn't page through the whole of
+blocks/ids every time we want to know.
+
+It's a snapshot of blocks/ids, taken when last reconciled with the API, plus a log of the
+blocks we've created since. Blocks made elsewhere (on the website, say) only show up at the
+next reconciliation, as do unblocks.'''
+import json
+import logging
+import os
+import threading
+import time
+from tempfile import NamedTemporaryFile
+
+import tweepy
+
+from .pacing import Journal
+from ..idset import IdSet
+
+log = logging.getLogger(__name__)
+
+
+class Blocklist(object):
+    def __init__(self, snapshot_filename, log_filename, clock=time.time):
+        self._snapshot_filename = snapshot_filename
+        self._state_filename = snapshot_filename + '.json'
+        self._log_filename = log_filename
+        self._clock = clock
+
+        try:
+            self._snapshot = IdSet.load(snapshot_filename)
+        except FileNotFoundError:
+            self._snapshot = IdSet()
+
+        # When the snapshot was taken, by clock; without it, the snapshot is of unknown age
+        try:
+            with open(self._state_filename, 'r') as f:
+                self._snapshot_time = json.load(f)['reconciled']
+        except FileNotFoundError:
+            self._snapshot_time = None
+
+        self._log = self._open_log()
+        self._added = set()
+        self._ids = None
+        # Blocks added while reconcile() is fetching blocks/ids, which it may have missed
+        self._pending = None
+        # Guards all of the above against add() from other threads
+        self._lock = threading.Lock()
+        self._reconcile_lock = threading.Lock()
+
+    def __str__(self):
+        return '<Blocklist: {} ids>'.format(len(self.ids))
+
+    @classmethod
+    def load(cls, screen_name, directory, **kwargs):
+        prefix = os.path.join(directory, 'blocks.{}'.format(screen_name))
+        blocklist = cls(prefix + '.npy', prefix + '.log', **kwargs)
+        log.info('loaded %s: %s', prefix, blocklist)
+        return blocklist
+
+    def _open_log(self):
+        return Journal(self._log_filename, label='blocked since the last reconciliation')
+
+    @property
+    def ids(self):
+        '''An IdSet of everyone we know we've blocked.'''
+        with self._lock:
+            if self._ids is None:
+                self._ids = self._snapshot | self._log.ids | self._added
+            return self._ids
+
+    def __contains__(self, user_id):
+        return user_id in self._snapshot or user_id in self._log or user_id in self._added
+
+    def __len__(self):
+        return len(self.ids)
+
+    def age(self):
+        '''Seconds since the last reconciliation, or None if there hasn't been one.'''
+        if self._snapshot_time is None:
+            return None
+        return self._clock() - self._snapshot_time
+
+    def add(self, user_id):
+        '''Records that we've just blocked user_id.'''
+        with self._lock:
+            self._log.record(user_id)
+            self._added.add(user_id)
+            if self._pending is not None:
+                self._pending.add(user_id)
+            self._ids = None
+
+    def reconcile(self, api):
+        '''Replaces the snapshot with the API's idea of our blocks, and empties the log of all
+        but the blocks added while fetching it, which it may not include.'''
+        with self._reconcile_lock:
+            with self._lock:
+                self._pending = set()
+
+            try:
+                log.info('Fetching blocks to reconcile %s', self._snapshot_filename)
+                snapshot = IdSet.from_pages(tweepy.Cursor(api.blocks_ids).pages())
+                log.info('%d blocks (%d locally)', len(snapshot), len(self.ids))
+            except BaseException:
+                with self._lock:
+                    self._pending = None
+                raise
+
+            with self._lock:
+                pending, self._pending = self._pending, None
+                snapshot_time = self._clock()
+                snapshot.save(self._snapshot_filename)
+                self._save_state({'reconciled': snapshot_time})
+                self._log.close()
+                self._replace(self._log_filename, ''.join('{}\n'.format(i) for i in pending))
+
+                self._snapshot = snapshot
+                self._snapshot_time = snapshot_time
+                self._log = self._open_log()
+                self._added = pending
+                self._ids = None
+
+    def _save_state(self, state):
+        self._replace(self._state_filename, json.dumps(state))
+
+    @staticmethod
+    def _replace(filename, text):
+        directory = os.path.dirname(filename)
+        with NamedTemporaryFile(prefix=os.path.basename(filename), suffix='.tmp',
+                                dir=directory or None, mode='w', delete=False) as f:
+            f.write(text)
+        os.rename(f.name, filename)
+
+    def close(self):
+        self._log.close()
@@ -0,0 +1,131 @@
+'''Follower snapshots as one NumPy array per field, for asking questions of the whole
+population without parsing everyone's JSON each time.
+
+export_columns() writes DIRECTORY/columns/<field>.npy for each of FIELDS, plus langs.json, the
+vocabulary which the lang and status_lang columns index into; Columns.load() memory-maps them
+back. classify() is classify_user(..., fetch_statuses=False), vectorised.'''
+import json
+import logging
+import os
+
+import numpy as np
+
+from .fmk import FMK, FORBIDDEN_LANGS, NEVER_TWEETED_MAX_FOLLOWERS, lang_base
+from ..util import chunked
+
+log = logging.getLogger(__name__)
+
+COLUMNS_DIRECTORY = 'columns'
+LANGS = 'langs.json'
+
+# status_lang for users without a status
+NO_STATUS = -1
+
+FIELDS = {
+    'id': np.int64,
+    'lang': np.int16,
+    'protected': np.bool_,
+    'following': np.bool_,
+    'statuses_count': np.int64,
+    'followers_count': np.int64,
+    'status_lang': np.int16,
+}
+
+
+class Columns(object):
+    def __init__(self, langs, **columns):
+        self.langs = langs
+        for field in FIELDS:
+            setattr(self, field, columns[field])
+
+    def __len__(self):
+        return len(self.id)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        '''Loads the columns written by export_columns into directory.'''
+        with open(os.path.join(directory, LANGS), 'r') as f:
+            langs = json.load(f)
+
+        return cls(langs, **{
+            field: np.load(os.path.join(directory, field + '.npy'),
+                           mmap_mode='r' if mmap else None)
+            for field in FIELDS
+        })
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for field in FIELDS:
+            np.save(os.path.join(directory, field + '.npy'), getattr(self, field))
+
+        # Written last: its presence means the rest are complete
+        with open(os.path.join(directory, LANGS), 'w') as f:
+            json.dump(self.langs, f)
+
+    def lang_mask(self, codes, predicate):
+        '''A boolean array: predicate(lang) for each of codes, which index self.langs.
+        NO_STATUS is never true.'''
+        # Indexing with NO_STATUS (-1) picks out the extra False on the end
+        lookup = np.array([bool(predicate(lang)) for lang in self.langs] + [False])
+        return lookup[codes]
+
+
+def _user_rows(lines, langs):
+    for line in lines:
+        user = json.loads(line)
+        status = user.get('status')
+        yield (
+            user['id'],
+            langs.setdefault(user.get('lang') or '', len(langs)),
+            bool(user.get('protected')),
+            bool(user.get('following')),
+            user.get('statuses_count') or 0,
+            user.get('followers_count') or 0,
+            NO_STATUS if status is None else langs.setdefault(status.get('lang') or '',
+                                                              len(langs)),
+        )
+
+
+def from_lines(lines, chunk_size=100000):
+    '''Builds Columns from users' JSON, one per item of lines.'''
+    langs = {}
+    parts = {field: [] for field in FIELDS}
+    for rows in chunked(_user_rows(lines, langs), chunk_size):
+        for field, values in zip(FIELDS, zip(*rows)):
+            parts[field].append(np.array(values, dtype=FIELDS[field]))
+
+    columns = {
+        field: np.concatenate(arrays) if arrays else np.zeros(0, dtype=FIELDS[field])
+        for field, arrays in parts.items()
+    }
+    return Columns(sorted(langs, key=langs.get), **columns)
+
+
+def classify(columns):
+    '''Returns an array of FMK values, one per user, with the same results as
+    classify_user(None, user, fetch_statuses=False) for each.'''
+    def forbidden(lang):
+        return lang_base(lang) in FORBIDDEN_LANGS
+
+    def english(lang):
+        return lang_base(lang) == 'en'
+
+    has_status = columns.status_lang != NO_STATUS
+    conditions = [
+        columns.lang_mask(columns.lang, forbidden),
+        has_status & columns.lang_mask(columns.status_lang, forbidden),
+        has_status & ~columns.lang_mask(columns.status_lang, english),
+        has_status,
+        columns.protected,
+        (columns.statuses_count == 0) &
+        (columns.followers_count > NEVER_TWEETED_MAX_FOLLOWERS),
+    ]
+    choices = [
+        FMK.BLOCK.value,
+        FMK.BLOCK.value,
+        FMK.NEUTRAL.value,
+        FMK.FOLLOW_BACK.value,
+        FMK.FOLLOW_BACK.value,
+        FMK.BLOCK.value,
+    ]
+    return np.select(conditions, choices, default=FMK.NEUTRAL.value).astype(np.int8)
@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+'''A local stand-in for the bits of the Twitter API that the bot uses, for load testing.
+
+Streams statuses (from the tests/*.json fixtures, or made up on the spot) at a configurable
+rate, and answers the handful of REST calls LessListener makes, with configurable latency and
+rate limits. tweepy insists on https://, so by default a throwaway self-signed certificate is
+generated with openssl; point REQUESTS_CA_BUNDLE at it (as loadtest does) to make tweepy
+trust it.'''
+import argparse
+import collections
+import datetime
+import glob
+import json
+import logging
+import os
+import random
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+
+from ..metrics import ThreadingHTTPServer
+from ..util import percentile
+
+log = logging.getLogger(__name__)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', '..', 'tests', '*.json')
+
+ME = {
+    "screen_name": "fewerror",
+    "id": 1932168457,
+    "id_str": "1932168457",
+    "name": "Fewer Errors",
+    "lang": "en",
+    "protected": False,
+    "following": False,
+    "followers_count": 5000,
+    "statuses_count": 10000,
+}
+
+SYNTHETIC_TEXTS = (
+    "I wish there was less {noun} in my life",
+    "Honestly this is less {adjective} than I expected",
+    "Could not be less {adjective} about it",
+    "less than {n} minutes to go",
+    "@{mention} the new one has less {noun} and it is less {adjective}",
+    "{n}% less {noun} for the same price",
+    "more or less {adjective}, to be fair",
+)
+SYNTHETIC_WORDS = {
+    'noun': ('cake', 'blood', 'traffic', 'noise', 'sugar', 'drama', 'rain', 'bugs'),
+    'adjective': ('annoying', 'impressive', 'keen', 'lucky', 'onerous', 'helpful'),
+}
+
+# Per-endpoint (limit, window in seconds), roughly as documented by Twitter
+DEFAULT_RATE_LIMITS = {
+    '/1.1/account/verify_credentials.json': (75, 15 * 60),
+    '/1.1/users/show.json': (900, 15 * 60),
+    '/1.1/friendships/lookup.json': (15, 15 * 60),
+    '/1.1/statuses/update.json': (300, 3 * 60 * 60),
+    '/1.1/blocks/create.json': (None, None),
+    '/1.1/friendships/destroy.json': (None, None),
+}
+
+
+def twitter_time(t):
+    return datetime.datetime.utcfromtimestamp(t).strftime('%a %b %d %H:%M:%S +0000 %Y')
+
+
+def fixture_statuses(pattern=FIXTURES):
+    '''Loads status JSON from files matching pattern, skipping those without a user.'''
+    statuses = []
+    for filename in sorted(glob.glob(pattern)):
+        with open(filename, 'r') as f:
+            j = json.load(f)
+        if 'user' in j and 'text' in j:
+            statuses.append(j)
+    return statuses
+
+
+def synthetic_user(rng, n_users):
+    i = rng.randrange(n_users)
+    return {
+        "screen_name": "user{}".format(i),
+        "id": 10 ** 9 + i,
+        "id_str": str(10 ** 9 + i),
+        "name": "User {}".format(i),
+        "lang": "en",
+        "protected": False,
+        "following": None,
+        "followers_count": i % 5000,
+        "statuses_count": i % 20000,
+    }
+
+
+def synthetic_status(rng, n_users=10000):
+    template = rng.choice(SYNTHETIC_TEXTS)
+    mention = synthetic_user(rng, n_users)
+    text = template.format(noun=rng.choice(SYNTHETIC_WORDS['noun']),
+                           adjective=rng.choice(SYNTHETIC_WORDS['adjective']),
+                           n=rng.randrange(2, 100),
+                           mention=mention['screen_name'])
+    user_mentions = []
+    if text.startswith('@'):
+        user_mentions.append({
+            'screen_name': mention['screen_name'],
+            'id': mention['id'],
+            'id_str': mention['id_str'],
+            'name': mention['name'],
+            'indices': [0, 1 + len(mention['screen_name'])],
+        })
+
+    return {
+        "text": text,
+        "user": synthetic_user(rng, n_users),
+        "entities": {"hashtags": [], "symbols": [], "urls": [], "user_mentions": user_mentions},
+        "lang": "en",
+        "truncated": False,
+        # tweepy's StreamListener uses the presence of this key to recognise statuses
+        "in_reply_to_status_id": None,
+    }
+
+
+class RateLimiter(object):
+    '''Fixed-window rate limits, reported in the same headers Twitter uses.'''
+
+    def __init__(self, limits):
+        self._limits = limits
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def check(self, path):
+        '''Returns (allowed, headers).'''
+        limit, window = self._limits.get(path, (None, None))
+        if limit is None:
+            return True, {}
+
+        now = time.time()
+        with self._lock:
+            reset, used = self._windows.get(path, (now + window, 0))
+            if now >= reset:
+                reset, used = now + window, 0
+            allowed = used < limit
+            if allowed:
+                used += 1
+            self._windows[path] = (reset, used)
+
+        return allowed, {
+            'x-rate-limit-limit': str(limit),
+            'x-rate-limit-remaining': str(limit - used),
+            'x-rate-limit-reset': str(int(reset)),
+        }
+
+
+class FakeTwitter(object):
+    '''Server-side state: what has been streamed, and what the bot did about it.'''
+
+    def __init__(self,
+                 statuses=None,
+                 rate=10.,
+                 latency=0.,
+                 rate_limits=None,
+                 followed_by=1.,
+                 seed=None,
+                 n_users=10000):
+        self.rng = random.Random(seed)
+        self.statuses = statuses
+        self.rate = rate
+        self.latency = latency
+        self.rate_limiter = RateLimiter(DEFAULT_RATE_LIMITS if rate_limits is None
+                                        else rate_limits)
+        self.followed_by = followed_by
+        self.n_users = n_users
+
+        self._lock = threading.Lock()
+        self._next_id = 10 ** 18
+        # id -> time.time() at which it was written to a stream; bounded so a long run with
+        # few replies doesn't grow without limit
+        self._emitted = collections.OrderedDict()
+        self._max_emitted = 100000
+        self.counts = collections.Counter()
+        self.reply_latencies = collections.deque(maxlen=100000)
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.counts[key] += n
+
+    def next_status(self):
+        with self._lock:
+            self._next_id += 1
+            id_ = self._next_id
+            if self.statuses:
+                j = dict(self.statuses[(id_ - 1) % len(self.statuses)])
+            else:
+                j = synthetic_status(self.rng, self.n_users)
+
+        now = time.time()
+        j.pop('retweeted_status', None)
+        j['id'] = id_
+        j['id_str'] = str(id_)
+        j['created_at'] = twitter_time(now)
+        j['timestamp_ms'] = str(int(now * 1000))
+
+        with self._lock:
+            self._emitted[id_] = now
+            while len(self._emitted) > self._max_emitted:
+                self._emitted.popitem(last=False)
+            self.counts['streamed'] += 1
+
+        return j
+
+    def is_followed_by(self, screen_name):
+        '''Deterministic per screen name, so repeated lookups agree.'''
+        return zlib.crc32(screen_name.encode('utf-8')) % 1000 < self.followed_by * 1000
+
+    def relationship(self, i, screen_name):
+        connections = ['followed_by', 'following'] if self.is_followed_by(screen_name) else []
+        return {
+            "name": screen_name,
+            "screen_name": screen_name,
+            "id": i,
+            "id_str": str(i),
+            "connections": connections,
+        }
+
+    def record_reply(self, in_reply_to_status_id):
+        now = time.time()
+        with self._lock:
+            self.counts['replies'] += 1
+            emitted = self._emitted.get(in_reply_to_status_id)
+            if emitted is not None:
+                self.reply_latencies.append(now - emitted)
+
+            self._next_id += 1
+            return self._next_id
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.reply_latencies)
+            counts = dict(self.counts)
+
+        return {
+            'counts': counts,
+            'reply_latency': {
+                'n': len(latencies),
+                'p50': percentile(latencies, 0.5),
+                'p95': percentile(latencies, 0.95),
+                'p99': percentile(latencies, 0.99),
+                'max': latencies[-1] if latencies else None,
+            },
+        }
+
+
+class FakeTwitterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeTwitter/1.0'
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def log_message(self, format, *args):
+        log.debug('%s %s', self.address_string(), format % args)
+
+    def _params(self):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length).decode('utf-8')
+            params.update({k: v[-1] for k, v in parse_qs(body).items()})
+        return url.path, params
+
+    def _send_json(self, obj, status=200, headers=()):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in dict(headers).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        path, params = self._params()
+        self.fake.count(path)
+
+        if path in ('/1.1/statuses/filter.json', '/1.1/user.json'):
+            return self._stream(params)
+
+        if path == '/fake/stats.json':
+            return self._send_json(self.fake.stats())
+
+        routes = {
+            '/1.1/account/verify_credentials.json': self._me,
+            '/1.1/users/show.json': self._me,
+            '/1.1/friendships/lookup.json': self._lookup_friendships,
+            '/1.1/statuses/update.json': self._update_status,
+            '/1.1/blocks/create.json': self._user,
+            '/1.1/friendships/destroy.json': self._user,
+        }
+        try:
+            route = routes[path]
+        except KeyError:
+            return self._send_json({'errors': [{'code': 34, 'message': 'Sorry, that page '
+                                                'does not exist.'}]}, status=404)
+
+        allowed, headers = self.fake.rate_limiter.check(path)
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+
+        if not allowed:
+            self.fake.count('rate-limited')
+            return self._send_json({'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]},
+                                   status=429, headers=headers)
+
+        self._send_json(route(params), headers=headers)
+
+    def _me(self, params):
+        return ME
+
+    def _user(self, params):
+        user_id = int(params.get('user_id', 0))
+        screen_name = params.get('screen_name', 'user{}'.format(user_id))
+        return dict(ME, id=user_id, id_str=str(user_id), screen_name=screen_name)
+
+    def _lookup_friendships(self, params):
+        screen_names = [s for s in params.get('screen_name', '').split(',') if s]
+        return [
+            self.fake.relationship(i, screen_name)
+            for i, screen_name in enumerate(screen_names, 2 ** 32)
+        ]
+
+    def _update_status(self, params):
+        in_reply_to = params.get('in_reply_to_status_id')
+        id_ = self.fake.record_reply(int(in_reply_to) if in_reply_to else None)
+        now = time.time()
+        return {
+            'id': id_,
+            'id_str': str(id_),
+            'text': params.get('status', ''),
+            'created_at': twitter_time(now),
+            'user': ME,
+            'entities': {'hashtags': [], 'symbols': [], 'urls': [], 'user_mentions': []},
+        }
+
+    def _stream(self, params):
+        '''Writes statuses in the delimited=length format tweepy asks for, until the client
+        goes away.'''
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        interval = 1. / self.fake.rate if self.fake.rate > 0 else None
+        next_t = time.monotonic()
+        try:
+            while True:
+                if interval is None:
+                    # Keep-alive only
+                    self.wfile.write(b'\r\n')
+                    self.wfile.flush()
+                    time.sleep(30)
+                    continue
+
+                payload = (json.dumps(self.fake.next_status()) + '\r\n').encode('utf-8')
+                self.wfile.write('{}\r\n'.format(len(payload)).encode('ascii') + payload)
+                self.wfile.flush()
+
+                next_t += interval
+                delay = next_t - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -1:
+                    # Fallen behind (slow reader); don't try to catch up in a burst
+                    next_t = time.monotonic()
+        except (BrokenPipeError, ConnectionResetError, ssl.SSLError):
+            log.info('stream client went away')
+
+
+# Passed with -config rather than -subj/-addext, since -addext needs OpenSSL 1.1.1
+CERT_CONFIG = '''
+[req]
+prompt = no
+distinguished_name = dn
+x509_extensions = ext
+
+[dn]
+CN = localhost
+
+[ext]
+subjectAltName = DNS:localhost,IP:127.0.0.1
+'''
+
+
+def make_self_signed_cert(directory):
+    '''Generates a certificate for localhost with openssl, returning (certfile, keyfile).'''
+    configfile = os.path.join(directory, 'fake-twitter.cnf')
+    certfile = os.path.join(directory, 'fake-twitter.crt')
+    keyfile = os.path.join(directory, 'fake-twitter.key')
+    with open(configfile, 'w') as f:
+        f.write(CERT_CONFIG)
+    subprocess.check_call(
+        ('openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-config', configfile, '-keyout', keyfile, '-out', certfile),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certfile, keyfile
+
+
+def make_server(fake, host='localhost', port=0, certfile=None, keyfile=None):
+    '''Returns a server ready for serve_forever(); without certfile it speaks plain HTTP.'''
+    server = ThreadingHTTPServer((host, port), FakeTwitterHandler)
+    server.fake = fake
+
+    if certfile is not None:
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+
+    return server
+
+
+def add_arguments(parser):
+    g = parser.add_argument_group('fake Twitter')
+    g.add_argument('--rate', type=float, default=10.,
+                   help='statuses per second on each stream (default: %(default)s)')
+    g.add_argument('--latency', type=float, default=0.,
+                   help='seconds to wait before answering each REST call '
+                        '(default: %(default)s)')
+    g.add_argument('--synthetic', action='store_true',
+                   help='make up statuses, rather than replaying tests/*.json')
+    g.add_argument('--followed-by', type=float, default=1., metavar='FRACTION',
+                   help='fraction of users who follow the bot (default: %(default)s)')
+    g.add_argument('--no-rate-limits', action='store_true',
+                   help='never answer 429')
+    g.add_argument('--seed', type=int, default=None)
+
+
+def fake_from_args(args):
+    return FakeTwitter(statuses=None if args.synthetic else fixture_statuses(),
+                       rate=args.rate,
+                       latency=args.latency,
+                       rate_limits={} if args.no_rate_limits else None,
+                       followed_by=args.followed_by,
+                       seed=args.seed)
+
+
+def main():
+    from .. import checkedshirt
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    checkedshirt.add_arguments(parser)
+    add_arguments(parser)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--certfile', help='(default: generate a self-signed one)')
+    parser.add_argument('--keyfile')
+    parser.add_argument('--plain-http', action='store_true',
+                        help="don't use TLS (tweepy won't talk to this without a proxy)")
+    args = parser.parse_args()
+    checkedshirt.init(args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        certfile, keyfile = args.certfile, args.keyfile
+        if certfile is None and not args.plain_http:
+            certfile, keyfile = make_self_signed_cert(tmp)
+            log.info('Generated certificate %s', certfile)
+
+        server = make_server(fake_from_args(args), args.host, args.port, certfile, keyfile)
+        log.info('Listening on %s:%d', *server.server_address[:2])
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
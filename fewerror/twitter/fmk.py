@@ -1,17 +1,32 @@
 import enum
+import json
 import logging
+import sqlite3
 
 from .util import user_url
+from .. import metrics
 
 
 log = logging.getLogger(__name__)
 
+classification_cache = metrics.counter(
+    'fewerror_twitter_classification_cache', 'Lookups in the classification cache',
+    ('result',))
+
 
 def lang_base(lang):
     base, *rest = lang.split('-')
     return base
 
 
+# Sorry if you speak these languages, but after getting several
+# thousand spam followers I needed a crude signal.
+FORBIDDEN_LANGS = frozenset(('ar', 'ja', 'tr', 'zh'))
+
+# Users who've never tweeted but have more followers than this are spam
+NEVER_TWEETED_MAX_FOLLOWERS = 1000
+
+
 class FMK(enum.Enum):
     '''Classification for new followers.'''
     FOLLOW_BACK = 1
@@ -19,17 +34,93 @@ class FMK(enum.Enum):
     BLOCK = 3
 
 
-def classify_user(api, whom, fetch_statuses=True):
+def fingerprint(whom, fetch_statuses=True):
+    '''Everything about whom that classify_user depends on, bar their timeline, as a string.
+    If they tweet, statuses_count changes, which is as good as a change to their timeline.'''
+    try:
+        status_lang = whom.status.lang
+    except AttributeError:
+        # Without a status, the answer depends on whether we may fetch their timeline
+        status_lang = '-' if fetch_statuses else '?'
+
+    return json.dumps([getattr(whom, key, None)
+                       for key in ('lang', 'protected', 'statuses_count', 'followers_count')] +
+                      [status_lang])
+
+
+class ClassificationCache(object):
+    '''Remembers classify_user's verdicts in an SQLite database, keyed by user id, so long as
+    their fingerprint() hasn't changed. Safe to share between processes, but not between
+    forked ones: open one per process.
+
+    Different users of the same file (the stream listener and batch classify, say) should pass
+    different sources, so that neither overwrites the other's verdicts.'''
+
+    def __init__(self, filename, source='stream'):
+        self.filename = filename
+        self.source = source
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(filename, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        with self._db:
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS verdicts (
+                    source TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    fmk INTEGER NOT NULL,
+                    PRIMARY KEY (source, user_id)
+                )''')
+
+    def get(self, user_id, fingerprint):
+        row = self._db.execute(
+            'SELECT fmk FROM verdicts WHERE source = ? AND user_id = ? AND fingerprint = ?',
+            (self.source, user_id, fingerprint)).fetchone()
+        if row is None:
+            self.misses += 1
+            classification_cache.labels('miss').inc()
+            return None
+
+        self.hits += 1
+        classification_cache.labels('hit').inc()
+        return FMK(row[0])
+
+    def put(self, user_id, fingerprint, fmk):
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)',
+                             (self.source, user_id, fingerprint, fmk.value))
+
+    def close(self):
+        self._db.close()
+
+
+def classify_user(api, whom, fetch_statuses=True, cache=None):
     '''Crude attempt to identify spammy followers. It appears that this bot
     is used to boost follower counts since it almost always follows back.
 
+    If cache (a ClassificationCache) is given, users whose fingerprint hasn't
+    changed since they were last classified get the same answer as last time,
+    without any API calls.
+
     Returns an entry from FMK.'''
+    if cache is None:
+        return _classify_user(api, whom, fetch_statuses)
+
+    fp = fingerprint(whom, fetch_statuses)
+    classification = cache.get(whom.id, fp)
+    if classification is None:
+        classification = _classify_user(api, whom, fetch_statuses)
+        cache.put(whom.id, fp, classification)
+
+    return classification
+
+
+def _classify_user(api, whom, fetch_statuses):
     label = '{} (#{})'.format(user_url(whom), whom.id)
 
-    # Sorry if you speak these languages, but after getting several
-    # thousand spam followers I needed a crude signal.
-    forbidden_langs = {'ar', 'ja', 'tr', 'zh'}
-    if lang_base(whom.lang) in forbidden_langs:
+    if lang_base(whom.lang) in FORBIDDEN_LANGS:
         log.info('%s has forbidden lang %s',
                  label, whom.lang)
         return FMK.BLOCK
@@ -44,7 +135,7 @@ def classify_user(api, whom, fetch_statuses=True):
             log.info('%s is protected; assume they are okay', label)
             return FMK.FOLLOW_BACK
 
-        if whom.statuses_count == 0 and whom.followers_count > 1000:
+        if whom.statuses_count == 0 and whom.followers_count > NEVER_TWEETED_MAX_FOLLOWERS:
             log.info('%s has never tweeted but has %d followers',
                      label, whom.followers_count)
             return FMK.BLOCK
@@ -59,9 +150,9 @@ def classify_user(api, whom, fetch_statuses=True):
             return FMK.NEUTRAL
 
     langs = {lang_base(status.lang) for status in statuses}
-    if langs & forbidden_langs:
+    if langs & FORBIDDEN_LANGS:
         log.info('%s tweets in forbidden lang %s',
-                 label, ', '.join(langs & forbidden_langs))
+                 label, ', '.join(langs & FORBIDDEN_LANGS))
         return FMK.BLOCK
 
     if 'en' not in langs:
@@ -0,0 +1,119 @@
+'''Classifying new followers without a timeline call apiece.
+
+Users in follow events don't come with their latest status, so classify_user used to fetch each
+new follower's timeline: one call per follower, on the stream thread. Instead, follows are
+queued for a worker thread, which looks them up 100 at a time with users/lookup (whose results
+do include the latest status) and caches what it learns for a while.'''
+import logging
+import queue
+import threading
+import time
+
+from .. import metrics
+from ..util import TTLCache, chunked
+
+log = logging.getLogger(__name__)
+
+LOOKUP_BATCH_SIZE = 100
+
+user_lookups = metrics.counter(
+    'fewerror_twitter_user_lookups', 'Calls to users/lookup')
+hydration_cache = metrics.counter(
+    'fewerror_twitter_hydration_cache', 'Users and timelines found in (or missing from) the '
+    'hydration cache', ('result',))
+queue_depth = metrics.gauge(
+    'fewerror_queue_depth', 'Items waiting in internal queues', ('queue',))
+
+
+class Hydrator(object):
+    '''Fetches users, with their latest status, in bulk; and timelines, one at a time. Both are
+    cached for ttl seconds.'''
+
+    def __init__(self, api, ttl=60 * 60, maxsize=10000, clock=time.monotonic):
+        self.api = api
+        self._users = TTLCache(ttl, maxsize, clock)
+        self._timelines = TTLCache(ttl, maxsize, clock)
+
+    def hydrate(self, users):
+        '''Returns users, in the same order, replacing any without a status by the result of
+        looking them up. (Users who have never tweeted, or are protected, won't have one even
+        then.)'''
+        missing = []
+        for user in users:
+            if hasattr(user, 'status'):
+                continue
+            if user.id in self._users:
+                hydration_cache.labels('hit').inc()
+            else:
+                hydration_cache.labels('miss').inc()
+                missing.append(user.id)
+
+        for batch in chunked(dict.fromkeys(missing), LOOKUP_BATCH_SIZE):
+            user_lookups.inc()
+            for user in self.api.lookup_users(user_ids=batch, include_entities=False):
+                self._users[user.id] = user
+
+        return [user if hasattr(user, 'status') else self._users.get(user.id, user)
+                for user in users]
+
+    def user_timeline(self, user_id, count=20):
+        '''Like api.user_timeline, but cached; so a Hydrator can stand in for the API in
+        classify_user.'''
+        try:
+            statuses = self._timelines[user_id]
+            hydration_cache.labels('hit').inc()
+        except KeyError:
+            hydration_cache.labels('miss').inc()
+            statuses = self.api.user_timeline(user_id=user_id, count=count)
+            self._timelines[user_id] = statuses
+        return statuses
+
+
+class FollowQueue(object):
+    '''Passes users to handle(users) on a worker thread, in batches: after the first user
+    arrives, waits up to linger seconds for more, up to batch_size.'''
+
+    def __init__(self, handle, name='follows', linger=5., batch_size=LOOKUP_BATCH_SIZE):
+        self.name = name
+        self._handle = handle
+        self._linger = linger
+        self._batch_size = batch_size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        queue_depth.labels(name).set_function(self._queue.qsize)
+
+    def put(self, user):
+        self._queue.put(user)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def join(self):
+        '''Blocks until every user put so far has been handled.'''
+        self._queue.join()
+
+    def _take_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._linger
+        while len(batch) < self._batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                self._handle(batch)
+            except Exception:
+                log.exception('while handling %d follows', len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
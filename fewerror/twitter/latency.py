@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+'''How long after someone tweets "less" do we get around to correcting them?
+
+For every candidate status (one that mentions "less"), LatencyTracker records the time from its
+creation to: our receiving it from the stream; find_corrections finishing; and the reply being
+posted or the status being rejected. Recent timings are kept for a rolling percentile summary,
+and optionally appended to a tab-separated log:
+
+    status_id  created_ms  received  found  done  outcome
+
+where created_ms is milliseconds since the epoch, and received/found/done are milliseconds
+after creation (found is empty if we never got that far). Run this module on such a log for a
+summary.'''
+import argparse
+import calendar
+import collections
+import logging
+import time
+
+from .. import metrics
+from ..util import percentile
+
+log = logging.getLogger(__name__)
+
+STAGES = ('received', 'found', 'done')
+
+latency_seconds = metrics.histogram(
+    'fewerror_twitter_latency_seconds',
+    'Time from a status being created to each stage of handling it',
+    ('stage',),
+    buckets=(.5, 1., 2., 3., 5., 10., 30., 60., 300., 3600.))
+
+
+def created_timestamp(status):
+    '''Seconds since the epoch. Streamed statuses carry timestamp_ms; created_at is only
+    precise to the second.'''
+    try:
+        return int(status.timestamp_ms) / 1000
+    except (AttributeError, TypeError, ValueError):
+        return calendar.timegm(status.created_at.utctimetuple())
+
+
+class Timing(object):
+    __slots__ = ('status_id', 'created', 'received', 'found')
+
+    def __init__(self, status_id, created, received):
+        self.status_id = status_id
+        self.created = created
+        self.received = received
+        self.found = None
+
+
+class LatencyTracker(object):
+    def __init__(self, log_filename=None, window=1000, summary_every=100, clock=time.time):
+        self._clock = clock
+        self._window = {stage: collections.deque(maxlen=window) for stage in STAGES}
+        self._summary_every = summary_every
+        self._n = 0
+        self._log = open(log_filename, 'a', buffering=1) if log_filename else None
+
+    def start(self, status):
+        return Timing(status.id, created_timestamp(status), self._clock())
+
+    def found(self, timing):
+        timing.found = self._clock()
+
+    def finish(self, timing, outcome):
+        done = self._clock()
+        deltas = {
+            'received': timing.received - timing.created,
+            'found': None if timing.found is None else timing.found - timing.created,
+            'done': done - timing.created,
+        }
+        for stage, delta in deltas.items():
+            if delta is not None:
+                self._window[stage].append(delta)
+                latency_seconds.labels(stage).observe(delta)
+
+        if self._log is not None:
+            self._log.write('{}\t{}\t{}\t{}\t{}\t{}\n'.format(
+                timing.status_id,
+                int(timing.created * 1000),
+                *('' if deltas[stage] is None else int(deltas[stage] * 1000)
+                  for stage in STAGES),
+                outcome))
+
+        self._n += 1
+        if self._summary_every and self._n % self._summary_every == 0:
+            log.info('latency over last %d candidates: %s', len(self._window['done']),
+                     self.format_summary())
+
+    def summary(self, ps=(0.5, 0.9, 0.99)):
+        '''{stage: {p: seconds}} over the most recent candidates.'''
+        result = {}
+        for stage, window in self._window.items():
+            xs = sorted(window)
+            result[stage] = {p: percentile(xs, p) for p in ps}
+        return result
+
+    def format_summary(self):
+        return '; '.join(
+            '{} {}'.format(stage, ' '.join(
+                'p{:g}={}'.format(p * 100, '-' if v is None else '{:.2f}s'.format(v))
+                for p, v in ps.items()))
+            for stage, ps in self.summary().items())
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+
+
+def read_log(f):
+    '''Yields (status_id, created_ms, {stage: ms or None}, outcome) from a latency log.'''
+    for line in f:
+        status_id, created_ms, *stages, outcome = line.rstrip('\n').split('\t')
+        yield (int(status_id), int(created_ms),
+               {stage: int(ms) if ms else None for stage, ms in zip(STAGES, stages)},
+               outcome)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize latency logs')
+    parser.add_argument('log', nargs='+', type=argparse.FileType('r'))
+    args = parser.parse_args()
+
+    by_outcome = collections.defaultdict(lambda: {stage: [] for stage in STAGES})
+    for f in args.log:
+        for _, _, stages, outcome in read_log(f):
+            for key in (outcome, 'all'):
+                for stage, ms in stages.items():
+                    if ms is not None:
+                        by_outcome[key][stage].append(ms / 1000)
+
+    ps = (0.5, 0.9, 0.99, 1.)
+    print('{:>16} {:>8} {:>8} {}'.format('outcome', 'stage', 'n',
+                                         ' '.join('{:>8}'.format('p{:g}'.format(p * 100))
+                                                  for p in ps)))
+    for outcome, stages in sorted(by_outcome.items()):
+        for stage in STAGES:
+            xs = sorted(stages[stage])
+            if not xs:
+                continue
+            print('{:>16} {:>8} {:8d} {}'.format(
+                outcome, stage, len(xs),
+                ' '.join('{:8.2f}'.format(percentile(xs, p)) for p in ps)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+'''Drives a real LessListener against the fake Twitter API in fewerror.twitter.fake, reporting
+sustained throughput, reply latency and memory use over time.
+
+    python -m fewerror.twitter.loadtest --rate 200 --duration 60 --synthetic'''
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import requests
+import tweepy
+
+from . import LessListener
+from . import fake
+from .. import checkedshirt, pos_tagger, tagcache, use_tag_cache
+
+log = logging.getLogger(__name__)
+
+
+class MeasuringListener(LessListener):
+    def __init__(self, *args, **kwargs):
+        super(MeasuringListener, self).__init__(*args, **kwargs)
+        self.n_statuses = 0
+        self.busy_seconds = 0.
+
+    def on_status(self, status):
+        t = time.monotonic()
+        try:
+            return super(MeasuringListener, self).on_status(status)
+        finally:
+            self.busy_seconds += time.monotonic() - t
+            self.n_statuses += 1
+
+
+def rss_bytes():
+    '''Current resident set size, or the peak where /proc isn't available.'''
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _serve(args, certfile, keyfile, conn):
+    server = fake.make_server(fake.fake_from_args(args), 'localhost', 0, certfile, keyfile)
+    conn.send(server.server_address[1])
+    conn.close()
+    server.serve_forever()
+
+
+def start_server(args, certfile, keyfile):
+    '''Runs the fake server in its own process, so its memory isn't counted against ours.'''
+    parent_conn, child_conn = multiprocessing.Pipe()
+    p = multiprocessing.Process(target=_serve, args=(args, certfile, keyfile, child_conn),
+                                daemon=True)
+    p.start()
+    port = parent_conn.recv()
+    return p, 'localhost:{}'.format(port)
+
+
+def run(args, tmp):
+    certfile, keyfile = fake.make_self_signed_cert(tmp)
+    # tweepy always uses https:// and offers no way to pass verify= through to the REST API
+    os.environ['REQUESTS_CA_BUNDLE'] = certfile
+    server, host = start_server(args, certfile, keyfile)
+
+    auth = tweepy.OAuthHandler('fake', 'fake')
+    auth.set_access_token('fake', 'fake')
+    api = tweepy.API(auth, host=host, wait_on_rate_limit=True,
+                     wait_on_rate_limit_notify=True, retry_count=1)
+    # Otherwise tweepy asks the real Twitter who we are
+    auth.username = api.verify_credentials().screen_name
+
+    state_dir = os.path.join(tmp, 'state')
+    os.makedirs(state_dir, exist_ok=True)
+    listener = MeasuringListener(api, post_replies=True, state_dir=state_dir)
+
+    stream = tweepy.Stream(auth, listener, host=host, verify=certfile)
+    start = time.monotonic()
+    stream.filter(track=['less'], is_async=True)
+
+    print('{:>8} {:>10} {:>10} {:>8} {:>8} {:>8} {:>10}'.format(
+        'elapsed', 'statuses', 'per sec', 'busy', 'replies', 'p95 (s)', 'RSS (MiB)'))
+    last_n, last_t = 0, start
+    stats = {'counts': {}, 'reply_latency': {}}
+    try:
+        while time.monotonic() - start < args.duration:
+            time.sleep(args.interval)
+            now = time.monotonic()
+            n = listener.n_statuses
+            stats = requests.get('https://{}/fake/stats.json'.format(host),
+                                 verify=certfile).json()
+            p95 = stats['reply_latency']['p95']
+            print('{:8.1f} {:10d} {:10.1f} {:7.0%} {:8d} {:>8} {:10.1f}'.format(
+                now - start, n, (n - last_n) / (now - last_t),
+                listener.busy_seconds / (now - start),
+                stats['counts'].get('replies', 0),
+                '-' if p95 is None else '{:.3f}'.format(p95),
+                rss_bytes() / 2 ** 20), flush=True)
+            last_n, last_t = n, now
+    finally:
+        stream.disconnect()
+        server.terminate()
+
+    elapsed = time.monotonic() - start
+    print()
+    print('statuses handled: {} ({:.1f}/s sustained)'.format(
+        listener.n_statuses, listener.n_statuses / elapsed))
+    print('streamed by server: {}'.format(stats['counts'].get('streamed', 0)))
+    print('rate-limited calls: {}'.format(stats['counts'].get('rate-limited', 0)))
+    for k, v in sorted(stats['reply_latency'].items()):
+        print('reply latency {}: {}'.format(k, v))
+    print('listener latency: {}'.format(listener.latency.format_summary()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    checkedshirt.add_arguments(parser)
+    fake.add_arguments(parser)
+    tagcache.add_arguments(parser)
+    parser.add_argument('--duration', type=float, default=60.,
+                        help='seconds to run for (default: %(default)s)')
+    parser.add_argument('--interval', type=float, default=5.,
+                        help='seconds between reports (default: %(default)s)')
+    args = parser.parse_args()
+    checkedshirt.init(args)
+    if args.tag_cache:
+        use_tag_cache(args.tag_cache, max_entries=args.tag_cache_size)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            run(args, tmp)
+    finally:
+        if pos_tagger.cache is not None:
+            # The stream's thread may still be tagging, so just save what it's used
+            pos_tagger.cache.flush()
+
+
+if __name__ == '__main__':
+    main()
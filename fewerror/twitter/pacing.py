@@ -0,0 +1,109 @@
+'''Pacing long runs of API calls by the rate-limit headers Twitter sends back, and remembering
+which ids a run has already dealt with.'''
+import logging
+import os
+import time
+
+from ..idset import IdSet
+
+log = logging.getLogger(__name__)
+
+# Twitter's rate-limit windows are 15 minutes long
+WINDOW = 15 * 60
+
+
+def rate_limit(api):
+    '''Returns (remaining calls, reset time in seconds since the epoch) from the headers of the
+    last response api received, or None if it didn't say.'''
+    response = getattr(api, 'last_response', None)
+    if response is None:
+        return None
+
+    try:
+        return (int(response.headers['x-rate-limit-remaining']),
+                int(response.headers['x-rate-limit-reset']))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class Pacer(object):
+    '''Spreads the calls remaining in the current rate-limit window evenly over the time until
+    it resets. Never waits longer than max_delay between calls, unless the window is exhausted,
+    in which case it waits for the reset.
+
+    Endpoints which don't report their limits (which include POSTs like blocks/create) get
+    max_delay; unless budget is given, in which case the Pacer counts calls to wait() itself,
+    and paces them as if the endpoint allowed budget calls per window.'''
+
+    def __init__(self, api, max_delay, budget=None, window=WINDOW, clock=None, sleep=None):
+        self.api = api
+        self.max_delay = max_delay
+        self.budget = budget
+        self.window = window
+        self._clock = clock or time.time
+        self._sleep = sleep or time.sleep
+        self._window_start = None
+        self._spent = 0
+
+    def _spend(self):
+        now = self._clock()
+        if self._window_start is None or now >= self._window_start + self.window:
+            self._window_start = now
+            self._spent = 0
+        self._spent += 1
+
+    def delay(self):
+        limit = rate_limit(self.api)
+        if limit is None and self._window_start is not None:
+            limit = (self.budget - self._spent, self._window_start + self.window)
+        if limit is None:
+            return self.max_delay
+
+        remaining, reset = limit
+        until_reset = max(0, reset - self._clock())
+        if remaining <= 0:
+            return until_reset + 1
+
+        return min(self.max_delay, until_reset / remaining)
+
+    def wait(self):
+        if self.budget is not None:
+            self._spend()
+        delay = self.delay()
+        log.debug('sleeping for %.1fs', delay)
+        self._sleep(delay)
+
+
+class Journal(object):
+    '''An append-only file of ids that have been processed, one per line, so that a resumed run
+    can skip them. label says what its ids are, for the log.'''
+
+    def __init__(self, path, label='already processed'):
+        self.path = path
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+
+        # A last line without its newline was cut off mid-write, and may hold only part of an
+        # id: cut it off entirely, so that it is neither skipped nor completed by the next write.
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            log.warning('%s: discarding incomplete last line %r', path, data[end:])
+            os.truncate(path, end)
+        self.ids = IdSet(int(line) for line in data[:end].split())
+
+        self._f = open(path, 'a')
+        log.info('%s: %d ids %s', path, len(self.ids), label)
+
+    def __contains__(self, id_):
+        return id_ in self.ids
+
+    def record(self, id_):
+        self._f.write('{}\n'.format(id_))
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
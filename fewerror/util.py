@@ -1,5 +1,15 @@
 import collections
 import collections.abc
+import concurrent.futures
+import hashlib
+import itertools
+import logging
+import math
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
 
 
 def reverse_inits(xs):
@@ -7,6 +17,38 @@ def reverse_inits(xs):
         yield xs[:i]
 
 
+def percentile(sorted_xs, p):
+    '''The p-th quantile (0 <= p <= 1) of sorted_xs, by the nearest-rank method; or None if it's
+    empty.'''
+    if not sorted_xs:
+        return None
+    return sorted_xs[min(len(sorted_xs) - 1, int(p * len(sorted_xs)))]
+
+
+def chunked(iterable, n):
+    '''Yields lists of (up to) n consecutive items from iterable, lazily.'''
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+def imap_bounded(pool, func, iterable, in_flight):
+    '''Like pool.imap(func, iterable), but with at most in_flight items submitted to pool and
+    not yet yielded, so that neither the pool's queues nor its results grow with iterable when
+    the caller is slower than the workers. Items are submitted from the caller's thread, so if
+    func raises, nothing is left blocked, and pool can be terminated.'''
+    pending = collections.deque()
+    for item in iterable:
+        if len(pending) >= in_flight:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (item,)))
+    while pending:
+        yield pending.popleft().get()
+
+
 class OrderedSet(collections.abc.MutableSet):
     def __init__(self, it=()):
         super(OrderedSet, self).__init__()
@@ -35,3 +77,198 @@ class OrderedSet(collections.abc.MutableSet):
 
     def __str__(self):
         return '{' + ', '.join(map(str, self)) + '}'
+
+
+class Backoff(object):
+    '''Exponential backoff with jitter: the nth delay is somewhere between half and all of
+    min(cap, initial * factor ** n), so that many clients failing at once don't all come back at
+    once.'''
+
+    def __init__(self, initial=1., cap=320., factor=2., random=random.random):
+        self.initial = initial
+        self.cap = cap
+        self.factor = factor
+        self._random = random
+        self.attempts = 0
+
+    def next(self):
+        delay = min(self.cap, self.initial * self.factor ** self.attempts)
+        if delay < self.cap:
+            self.attempts += 1
+        return delay / 2 + self._random() * delay / 2
+
+    def reset(self):
+        self.attempts = 0
+
+
+class TTLCache(object):
+    '''A mapping whose entries expire ttl seconds after being set. Beyond maxsize entries, the
+    oldest are evicted.'''
+
+    def __init__(self, ttl, maxsize=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._data = collections.OrderedDict()
+
+    def __setitem__(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = (self._clock() + self.ttl, value)
+        while self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __getitem__(self, key):
+        expires, value = self._data[key]
+        if expires <= self._clock():
+            del self._data[key]
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def __len__(self):
+        return len(self._data)
+
+
+class BloomFilter(object):
+    '''A set of strings in a fixed amount of memory, which may wrongly claim to contain a string
+    it doesn't: with probability about error_rate, once capacity strings have been added.'''
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.n_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.n_bits + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.sha256(item.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        return ((h1 + i * h2) % self.n_bits for i in range(self.n_hashes))
+
+    def __contains__(self, item):
+        return all(self._bits[i >> 3] & (1 << (i & 7)) for i in self._positions(item))
+
+    def add(self, item):
+        '''Adds item, returning True if it was (definitely) not already present.'''
+        new = False
+        for i in self._positions(item):
+            mask = 1 << (i & 7)
+            if not self._bits[i >> 3] & mask:
+                self._bits[i >> 3] |= mask
+                new = True
+        return new
+
+
+class TopK(object):
+    '''Approximately the most common items in a stream, in memory for just capacity of them
+    (by the Space-Saving algorithm). Counts may be overestimated, by at most the smallest
+    count kept.'''
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._counts = {}
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, item, count=1):
+        counts = self._counts
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.capacity:
+            counts[item] = count
+        else:
+            # Take over the least common item's count
+            victim = min(counts, key=counts.get)
+            counts[item] = counts.pop(victim) + count
+
+    def update(self, counter):
+        for item, count in counter.items():
+            self.add(item, count)
+
+    def most_common(self, n=None):
+        return sorted(self._counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+
+class KeyedWorkQueue(object):
+    '''Calls handle(item) for each put(key, item) on a pool of worker threads: in order, one at
+    a time, for items with the same key, but concurrently across keys. Workers take turns
+    between keys, so one busy key can't starve the rest.
+
+    At most maxsize items may be waiting for each key; beyond that, put() drops the item and
+    returns False.'''
+
+    def __init__(self, handle, workers, maxsize=None, name='worker'):
+        self._handle = handle
+        self._maxsize = maxsize
+        try:
+            self._executor = concurrent.futures.ThreadPoolExecutor(workers,
+                                                                   thread_name_prefix=name)
+        except TypeError:
+            # thread_name_prefix arrived in Python 3.6
+            self._executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        # Keys are only present while a worker is (or will soon be) handling them
+        self._queues = {}
+        self._waiting = 0
+
+    def put(self, key, item):
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = self._queues[key] = collections.deque()
+                schedule = True
+            elif self._maxsize is not None and len(queue) >= self._maxsize:
+                return False
+            else:
+                schedule = False
+
+            queue.append(item)
+            self._waiting += 1
+
+        if schedule:
+            self._executor.submit(self._run, key)
+        return True
+
+    def qsize(self):
+        '''Items waiting, across all keys.'''
+        return self._waiting
+
+    def join(self):
+        '''Blocks until every item put so far has been handled.'''
+        with self._idle:
+            self._idle.wait_for(lambda: not self._queues)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, key):
+        with self._lock:
+            item = self._queues[key].popleft()
+            self._waiting -= 1
+
+        try:
+            self._handle(item)
+        except Exception:
+            log.exception('while handling %r', key)
+
+        with self._lock:
+            if self._queues[key]:
+                # Back of the line, behind other keys
+                self._executor.submit(self._run, key)
+            else:
+                del self._queues[key]
+                if not self._queues:
+                    self._idle.notify_all()
@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+import fewerror
+
+
+def pytest_configure(config):
+    # Tagging is most of the time the grammar tests take; to cache tags between runs, set
+    # FEWERROR_TAG_CACHE=path/to/tags.sqlite3
+    filename = os.environ.get('FEWERROR_TAG_CACHE')
+    if filename:
+        fewerror.use_tag_cache(filename)
+
+
+def pytest_unconfigure(config):
+    if fewerror.pos_tagger.cache is not None:
+        fewerror.pos_tagger.cache.close()
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmpdir_factory, monkeypatch):
+    # Keep anything cached under ~/.cache (like ThatsNotMyBot's grammar) out of the real one
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir_factory.mktemp('cache')))
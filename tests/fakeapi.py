@@ -0,0 +1,40 @@
+'''A stand-in for the bits of tweepy.API that the block and pacing code uses.'''
+from tweepy.models import User
+
+
+class Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class FakeAPI:
+    '''Keeps a set of blocked ids, which blocks_ids returns in one page; and, if remaining and
+    reset are given, pretends the last response carried those rate-limit headers.'''
+
+    last_response = None
+
+    def __init__(self, block_ids=(), remaining=None, reset=None):
+        self.block_ids = set(block_ids)
+        self.blocks_ids_calls = 0
+        self.blocked = []
+        self.unfollowed = []
+        if remaining is not None:
+            self.last_response = Response({'x-rate-limit-remaining': str(remaining),
+                                           'x-rate-limit-reset': str(reset)})
+
+    def me(self):
+        return User.parse(None, {'id': 1000, 'screen_name': 'me'})
+
+    def blocks_ids(self, cursor=-1):
+        self.blocks_ids_calls += 1
+        return sorted(self.block_ids), (0, 0)
+
+    blocks_ids.pagination_mode = 'cursor'
+
+    def create_block(self, user_id, **kwargs):
+        self.blocked.append(user_id)
+        self.block_ids.add(user_id)
+        return User.parse(None, {'id': user_id, 'screen_name': 'user{}'.format(user_id)})
+
+    def destroy_friendship(self, user_id):
+        self.unfollowed.append(user_id)
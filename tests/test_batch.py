@@ -0,0 +1,183 @@
+import argparse
+import json
+import logging
+
+import pytest
+from tweepy.models import User
+
+from fewerror.twitter import batch
+
+
+def user(i):
+    return User.parse(None, {'id': i, 'id_str': str(i), 'screen_name': 'user{}'.format(i)})
+
+
+class FollowersAPI:
+    '''Pages through self.follower_ids, newest first, 200 at a time.'''
+
+    def __init__(self, follower_ids, fail_after=None):
+        self.follower_ids = follower_ids
+        self.fail_after = fail_after
+        self.calls = 0
+
+        def followers(cursor=-1, count=200):
+            self.calls += 1
+            if self.fail_after is not None and self.calls > self.fail_after:
+                raise ConnectionError('oh no')
+
+            start = 0 if cursor == -1 else cursor
+            end = start + count
+            next_cursor = end if end < len(self.follower_ids) else 0
+            return [user(i) for i in self.follower_ids[start:end]], (start, next_cursor)
+
+        followers.pagination_mode = 'cursor'
+        self.followers = followers
+
+    def me(self):
+        u = user(1)
+        u.followers_count = len(self.follower_ids)
+        return u
+
+
+def fetch(api, directory, **kwargs):
+    args = argparse.Namespace(directory=str(directory), compress=False, incremental=False,
+                              restart=False)
+    vars(args).update(kwargs)
+    batch.fetch_followers(api, args)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_fetch_followers_resumes(tmpdir, compress):
+    ids = list(range(1000, 1500))
+    api = FollowersAPI(ids, fail_after=2)
+
+    with pytest.raises(ConnectionError):
+        fetch(api, tmpdir, compress=compress)
+    assert sorted(batch.iter_user_ids(str(tmpdir))) == ids[:400]
+
+    api.fail_after = None
+    api.calls = 0
+    fetch(api, tmpdir, compress=compress)
+    assert api.calls == 1
+    assert sorted(u['id'] for u in batch.iter_users(str(tmpdir))) == ids
+
+    # Already complete: nothing to do
+    api.calls = 0
+    fetch(api, tmpdir)
+    assert api.calls == 0
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_fetch_followers_interrupted_before_checkpoint(tmpdir, monkeypatch, compress):
+    ids = list(range(1000, 1500))
+    api = FollowersAPI(ids)
+
+    save_checkpoint = batch._save_checkpoint
+    saves = []
+
+    def crash_on_second_page(directory, checkpoint):
+        saves.append(1)
+        if len(saves) == 2:
+            raise KeyboardInterrupt
+        save_checkpoint(directory, checkpoint)
+
+    monkeypatch.setattr(batch, '_save_checkpoint', crash_on_second_page)
+    with pytest.raises(KeyboardInterrupt):
+        fetch(api, tmpdir, compress=compress)
+    # The second page was written, but its cursor wasn't
+    assert sorted(batch.iter_user_ids(str(tmpdir))) == ids[:400]
+
+    monkeypatch.setattr(batch, '_save_checkpoint', save_checkpoint)
+    fetch(api, tmpdir, compress=compress)
+    assert sorted(batch.iter_user_ids(str(tmpdir))) == ids
+
+
+def test_fetch_followers_incremental(tmpdir):
+    ids = list(range(1000, 1500))
+    api = FollowersAPI(ids)
+    fetch(api, tmpdir)
+
+    api.follower_ids = [1, 2, 3] + ids
+    api.calls = 0
+    fetch(api, tmpdir, incremental=True)
+    assert api.calls == 1
+    assert sorted(batch.iter_user_ids(str(tmpdir))) == [1, 2, 3] + ids
+    assert list(batch.load_follower_ids(str(tmpdir))) == [1, 2, 3] + ids
+    assert tmpdir.join(batch.FOLLOWER_IDS).check()
+
+
+def test_fetch_followers_incremental_resumes(tmpdir):
+    ids = list(range(1000, 1500))
+    api = FollowersAPI(ids)
+    fetch(api, tmpdir)
+
+    new = list(range(1, 401))
+    api.follower_ids = new + ids
+    api.fail_after = 1
+    api.calls = 0
+    with pytest.raises(ConnectionError):
+        fetch(api, tmpdir, incremental=True)
+    assert sorted(batch.iter_user_ids(str(tmpdir))) == new[:200] + ids
+
+    # Not finished, so there's nothing to do without --incremental
+    api.fail_after = None
+    api.calls = 0
+    fetch(api, tmpdir)
+    assert api.calls == 0
+
+    fetch(api, tmpdir, incremental=True)
+    assert api.calls == 2
+    assert sorted(batch.iter_user_ids(str(tmpdir))) == new + ids
+    assert list(batch.load_follower_ids(str(tmpdir))) == new + ids
+
+
+def test_fetch_followers_relative_directory(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    api = FollowersAPI(list(range(1000, 1500)))
+    fetch(api, 'followers')
+    assert len(list(batch.iter_user_ids('followers'))) == 500
+
+
+def test_iter_user_ids_old_layout(tmpdir):
+    tmpdir.join('user.42.json').write('{"id": 42}')
+    assert list(batch.iter_user_ids(str(tmpdir))) == [42]
+    assert list(batch.iter_users(str(tmpdir))) == [{'id': 42}]
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+@pytest.mark.parametrize('cache', [False, True])
+def test_classify(tmpdir, capsys, caplog, jobs, cache):
+    users = [
+        {'id': 1, 'screen_name': 'a', 'lang': 'ar', 'following': False},
+        {'id': 2, 'screen_name': 'b', 'lang': 'en', 'following': True,
+         'status': {'lang': 'en'}},
+        {'id': 3, 'screen_name': 'c', 'lang': 'en', 'following': False,
+         'status': {'lang': 'en'}},
+        {'id': 4, 'screen_name': 'd', 'lang': 'en', 'following': False,
+         'protected': False, 'statuses_count': 0, 'followers_count': 5000},
+        {'id': 5, 'screen_name': 'e', 'lang': 'en', 'following': False,
+         'status': {'lang': 'fr'}},
+    ]
+    with open(str(tmpdir.join(batch.SNAPSHOT)), 'w') as f:
+        for u in users:
+            f.write(json.dumps(u) + '\n')
+
+    caplog.set_level(logging.INFO)
+    cache_filename = str(tmpdir.join('cache.sqlite3')) if cache else None
+    for _ in range(2):
+        block_file = tmpdir.join('block.txt')
+        with open(str(block_file), 'w') as f:
+            args = argparse.Namespace(directory=str(tmpdir), block_file=f, jobs=jobs,
+                                      cache=cache_filename)
+            batch.classify(None, args)
+
+        assert sorted(map(int, block_file.readlines())) == [1, 4]
+        assert capsys.readouterr().out.splitlines() == [
+            'already following: 1 users',
+            '      follow back: 1 users',
+            '          neutral: 1 users',
+            '            block: 2 users',
+        ]
+
+    if cache:
+        assert 'Classification cache: 5/5 hits' in caplog.text
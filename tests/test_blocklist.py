@@ -0,0 +1,89 @@
+import argparse
+
+from fewerror.twitter import batch
+from fewerror.twitter.blocklist import Blocklist
+
+from .fakeapi import FakeAPI
+
+
+def test_blocklist(tmpdir):
+    api = FakeAPI({1, 2})
+    now = [1000000]
+
+    b = Blocklist.load('me', str(tmpdir), clock=lambda: now[0])
+    assert b.age() is None
+    assert len(b) == 0
+
+    b.reconcile(api)
+    assert list(b.ids) == [1, 2]
+    assert b.age() == 0
+    now[0] += 100
+    assert b.age() == 100
+
+    api.create_block(3)
+    b.add(3)
+    assert 3 in b
+    assert list(b.ids) == [1, 2, 3]
+    b.close()
+
+    # Blocks made elsewhere don't show up until we reconcile
+    api.block_ids.add(4)
+    b = Blocklist.load('me', str(tmpdir), clock=lambda: now[0])
+    assert list(b.ids) == [1, 2, 3]
+    assert b.age() == 100
+    b.reconcile(api)
+    assert list(b.ids) == [1, 2, 3, 4]
+    assert tmpdir.join('blocks.me.log').read() == ''
+    b.close()
+
+
+def test_add_while_reconciling(tmpdir):
+    b = Blocklist.load('me', str(tmpdir))
+    b.add(1)
+
+    class RacingAPI(FakeAPI):
+        def blocks_ids(self, cursor=-1):
+            result = super().blocks_ids(cursor)
+            # As if another thread blocked someone after this page was fetched
+            self.create_block(2)
+            b.add(2)
+            return result
+
+        blocks_ids.pagination_mode = 'cursor'
+
+    b.reconcile(RacingAPI({1}))
+    assert list(b.ids) == [1, 2]
+    assert tmpdir.join('blocks.me.log').read() == '2\n'
+    b.close()
+
+    b = Blocklist.load('me', str(tmpdir))
+    assert list(b.ids) == [1, 2]
+    b.close()
+
+
+def test_block_uses_local_blocklist(tmpdir, monkeypatch):
+    monkeypatch.setattr(batch.time, 'sleep', lambda t: None)
+    api = FakeAPI({1})
+
+    def block(ids, **kwargs):
+        block_file = tmpdir.join('block.txt')
+        block_file.write(''.join('{}\n'.format(i) for i in ids))
+        with open(str(block_file), 'r') as f:
+            args = argparse.Namespace(block_file=f, journal=str(tmpdir.join('journal')),
+                                      timeout=0, report=False, state=str(tmpdir),
+                                      reconcile=False, max_age=7, per_window=None)
+            vars(args).update(kwargs)
+            batch.block(api, args)
+        tmpdir.join('journal').remove()
+
+    block([1, 2])
+    assert api.blocks_ids_calls == 1
+    assert api.blocked == [2]
+
+    block([1, 2, 3])
+    assert api.blocks_ids_calls == 1
+    assert api.blocked == [2, 3]
+
+    block([4], reconcile=True)
+    assert api.blocks_ids_calls == 2
+    assert api.blocked == [2, 3, 4]
@@ -0,0 +1,111 @@
+import atexit
+import json
+import logging
+import sys
+
+from fewerror import checkedshirt
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_json_formatter():
+    record = logging.LogRecord('fewerror.x', logging.INFO, __file__, 1, 'hello %s', ('you',),
+                               None)
+    j = json.loads(checkedshirt.JSONFormatter().format(record))
+    assert j['message'] == 'hello you'
+    assert j['level'] == 'INFO'
+    assert j['logger'] == 'fewerror.x'
+    assert 'exc' not in j
+
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        record.exc_info = sys.exc_info()
+    j = json.loads(checkedshirt.JSONFormatter().format(record))
+    assert 'ZeroDivisionError' in j['exc']
+
+
+def test_queue_handlers():
+    root = logging.getLogger()
+    old_handlers = root.handlers[:]
+    handler = ListHandler()
+    handler.setLevel(logging.WARNING)
+    root.handlers[:] = [handler]
+    try:
+        listener = checkedshirt._queue_handlers()
+        assert handler not in root.handlers
+
+        log = logging.getLogger('fewerror.test')
+        log.info('ignored')
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            log.warning('oops %d', 1, exc_info=True)
+
+        listener.stop()
+        atexit.unregister(listener.stop)
+    finally:
+        root.handlers[:] = old_handlers
+
+    [record] = handler.records
+    assert record.getMessage() == 'oops 1'
+    # For Sentry's sake
+    assert record.exc_info[0] is ZeroDivisionError
+
+
+def test_deferred_handler():
+    deferred = checkedshirt._DeferredHandler(capacity=2)
+    records = [logging.LogRecord('x', logging.WARNING, __file__, 1, str(i), (), None)
+               for i in range(4)]
+    for record in records[:3]:
+        deferred.handle(record)
+
+    target = ListHandler()
+    deferred.attach(target)
+    # Only the most recent capacity records were kept
+    assert target.records == records[1:3]
+
+    deferred.handle(records[3])
+    assert target.records == records[1:]
+
+
+def test_release(tmpdir, monkeypatch):
+    release_file = tmpdir.join('release')
+    monkeypatch.setattr(checkedshirt, 'RELEASE_FILE', str(release_file))
+    monkeypatch.setenv('SENTRY_RELEASE', 'from-env')
+    assert checkedshirt.release() == 'from-env'
+
+    monkeypatch.delenv('SENTRY_RELEASE')
+    release_file.write('from-file\n')
+    assert checkedshirt.release() == 'from-file'
+
+
+def test_start_sentry_once():
+    root = logging.getLogger()
+    old_handlers = root.handlers[:]
+    root.handlers[:] = []
+    try:
+        thread = checkedshirt._start_sentry()
+        thread.join()
+        atexit.unregister(thread.join)
+        # As when init() is called again
+        assert checkedshirt._start_sentry() is None
+
+        listener = checkedshirt._queue_handlers()
+        assert checkedshirt._queue_handlers() is None
+        assert checkedshirt._start_sentry() is None
+        listener.stop()
+        atexit.unregister(listener.stop)
+
+        deferred = [h for h in checkedshirt._root_handlers()
+                    if isinstance(h, checkedshirt._DeferredHandler)]
+        assert len(deferred) == 1
+    finally:
+        root.handlers[:] = old_handlers
@@ -0,0 +1,82 @@
+import argparse
+import json
+import random
+
+import numpy as np
+from tweepy.models import User
+
+from fewerror.twitter import batch, columnar, classify_user
+
+
+def random_user(i, rng):
+    user = {
+        'id': i,
+        'screen_name': 'user{}'.format(i),
+        'lang': rng.choice(['en', 'en-gb', 'ar', 'fr', 'zh-cn', None]),
+        'protected': rng.random() < 0.2,
+        'following': rng.random() < 0.3,
+        'statuses_count': rng.choice([0, 0, 1, 500]),
+        'followers_count': rng.choice([0, 1000, 1001, 50000]),
+    }
+    if rng.random() < 0.5:
+        user['status'] = {'lang': rng.choice(['en', 'ja', 'fr', 'und'])}
+    return user
+
+
+def test_classify_matches_classify_user():
+    rng = random.Random(1)
+    users = [random_user(i, rng) for i in range(2000)]
+    lines = [json.dumps(u) for u in users]
+
+    columns = columnar.from_lines(lines, chunk_size=300)
+    assert len(columns) == len(users)
+    assert columns.id.tolist() == list(range(2000))
+
+    expected = []
+    for u in users:
+        user = User.parse(None, dict(u, lang=u['lang'] or ''))
+        expected.append(classify_user(None, user, fetch_statuses=False).value)
+
+    assert columnar.classify(columns).tolist() == expected
+
+
+def test_export_and_classify_columns(tmpdir, capsys):
+    users = [
+        {'id': 1, 'lang': 'ar', 'following': False},
+        {'id': 2, 'lang': 'en', 'following': True, 'status': {'lang': 'en'}},
+        {'id': 3, 'lang': 'en', 'following': False, 'status': {'lang': 'en'}},
+        {'id': 4, 'lang': 'en', 'following': False, 'protected': False,
+         'statuses_count': 0, 'followers_count': 5000},
+        {'id': 5, 'lang': 'en', 'following': False, 'status': {'lang': 'fr'}},
+    ]
+    with open(str(tmpdir.join(batch.SNAPSHOT)), 'w') as f:
+        for u in users:
+            f.write(json.dumps(u) + '\n')
+
+    batch.export_columns(None, argparse.Namespace(directory=str(tmpdir)))
+    columns = columnar.Columns.load(str(tmpdir.join(columnar.COLUMNS_DIRECTORY)))
+    assert isinstance(columns.id, np.memmap)
+    assert columns.langs == ['ar', 'en', 'fr']
+    assert columns.status_lang.tolist() == [columnar.NO_STATUS, 1, 1, columnar.NO_STATUS, 2]
+
+    block_file = tmpdir.join('block.txt')
+    with open(str(block_file), 'w') as f:
+        batch.classify_columns(None, argparse.Namespace(directory=str(tmpdir), block_file=f,
+                                                        top_langs=2))
+
+    assert block_file.read() == '1\n4\n'
+    assert capsys.readouterr().out.splitlines() == [
+        'already following: 1 users',
+        '      follow back: 1 users',
+        '          neutral: 1 users',
+        '            block: 2 users',
+        '',
+        '      en: 4 users',
+        '      ar: 1 users',
+    ]
+
+
+def test_empty():
+    columns = columnar.from_lines([])
+    assert len(columns) == 0
+    assert columnar.classify(columns).tolist() == []
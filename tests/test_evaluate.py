@@ -0,0 +1,102 @@
+import io
+import json
+import os
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from fewerror import Correction, _token_offsets, evaluate
+
+
+@pytest.fixture
+def fake_corrections(monkeypatch):
+    '''The tagger's data may not be installed: treat "less X" as always wanting "fewer X".'''
+    def explain_corrections(text):
+        words = text.split()
+        return [Correction('fewer ' + words[i + 1], 'less', None, None)
+                for i, word in enumerate(words[:-1]) if word.lower() == 'less']
+
+    monkeypatch.setattr(evaluate, 'explain_corrections', explain_corrections)
+
+
+def test_parse_tweet():
+    path = os.path.join(os.path.dirname(__file__), '640748887330942977.json')
+    with open(path, 'r') as f:
+        line = json.dumps(json.load(f))
+
+    id_, text = evaluate.parse(line)
+    assert id_ == 640748887330942977
+    assert text == 'The One True Syntax Pedant Bot is . Much less bad than all others.'
+
+    assert evaluate.parse(line, 'text') == (None, line)
+
+
+def test_evaluate(fake_corrections):
+    lines = [
+        'I want less apples\n',
+        'nothing to see here\n',
+        '\n',
+        '{"not": "a tweet"\n',
+        'less apples, less pears\n',
+        'Bless you\n',
+    ]
+    output = io.StringIO()
+    stats = evaluate.evaluate([('a.txt', lines[:3]), ('b.txt', lines[3:])], output,
+                              chunk_size=2)
+
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    # Lines are numbered within each file
+    assert [(r['file'], r['line']) for r in records] == [('a.txt', 1), ('b.txt', 2)]
+    assert records[0]['corrections'] == [
+        {'correction': 'fewer apples', 'rule': 'less', 'start': None, 'end': None},
+    ]
+
+    assert stats['messages'] == 5
+    assert stats['errors'] == 1
+    assert stats['lessish'] == 2
+    assert stats['hits'] == 2
+    assert stats['rules'] == {'less': 3}
+    assert dict(stats['top_corrections']) == {
+        'fewer apples': 1, 'fewer apples,': 1, 'fewer pears': 1,
+    }
+
+
+def test_token_offsets():
+    raw = 'I could care less, “honestly”.'
+    tokens = ['I', 'could', 'care', 'less', ',', '``', 'honestly', "''", '.']
+    assert _token_offsets(raw, tokens) == [0, 2, 8, 13, 17, None, 20, None, 29]
+
+
+def test_evaluate_failure(fake_corrections, monkeypatch):
+    def explain_corrections(text):
+        if 'pears' in text:
+            raise ValueError(text)
+        return []
+
+    monkeypatch.setattr(evaluate, 'explain_corrections', explain_corrections)
+    stats = evaluate.evaluate([('a.txt', ['less apples\n', 'less pears\n', 'less plums\n'])],
+                              io.StringIO())
+    assert stats['messages'] == 3
+    assert stats['errors'] == 1
+    assert stats['lessish'] == 3
+
+
+def test_evaluate_jobs_failure(monkeypatch):
+    # Escapes evaluate_chunk, in a worker process
+    monkeypatch.setattr(evaluate, 'parse', MagicMock(side_effect=RuntimeError))
+    monkeypatch.setattr(evaluate, '_init_worker', lambda *args: None)
+    lines = ['less apples\n'] * 20
+    raised = []
+
+    def run():
+        try:
+            evaluate.evaluate([('a.txt', lines)], io.StringIO(), jobs=2, chunk_size=1)
+        except RuntimeError as e:
+            raised.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive(), 'evaluate() deadlocked'
+    assert len(raised) == 1
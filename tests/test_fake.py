@@ -0,0 +1,60 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from fewerror.twitter import fake
+
+
+@pytest.fixture
+def server():
+    f = fake.FakeTwitter(rate=100., rate_limits={
+        '/1.1/friendships/lookup.json': (2, 60),
+    }, followed_by=1., seed=42)
+    s = fake.make_server(f)
+    t = threading.Thread(target=s.serve_forever, daemon=True)
+    t.start()
+    yield 'http://localhost:{}'.format(s.server_address[1]), f
+    s.shutdown()
+    s.server_close()
+
+
+def test_stream_is_length_delimited(server):
+    url, _ = server
+    with urllib.request.urlopen(url + '/1.1/statuses/filter.json', data=b'track=less') as r:
+        for _ in range(3):
+            length = int(r.readline())
+            status = json.loads(r.read(length).decode('utf-8'))
+            assert 'less' in status['text'].lower()
+            assert status['user']['screen_name']
+
+
+def test_reply_latency(server):
+    url, f = server
+    status = f.next_status()
+
+    req = urllib.request.Request(url + '/1.1/statuses/update.json', data='status=hi&'
+                                 'in_reply_to_status_id={}'.format(status['id']).encode())
+    with urllib.request.urlopen(req) as r:
+        assert json.load(r)['text'] == 'hi'
+
+    stats = f.stats()
+    assert stats['counts']['replies'] == 1
+    assert stats['reply_latency']['n'] == 1
+
+
+def test_rate_limit(server):
+    url, _ = server
+    lookup = url + '/1.1/friendships/lookup.json?screen_name=a,b'
+
+    for remaining in (1, 0):
+        with urllib.request.urlopen(lookup) as r:
+            assert [rel['connections'] for rel in json.load(r)] == [
+                ['followed_by', 'following']] * 2
+            assert r.headers['x-rate-limit-remaining'] == str(remaining)
+
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        urllib.request.urlopen(lookup)
+    assert excinfo.value.code == 429
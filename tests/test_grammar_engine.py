@@ -0,0 +1,162 @@
+import json
+import math
+import os
+import random
+from unittest.mock import MagicMock
+
+import pytest
+import tracery
+from tracery.modifiers import base_english
+
+from fewerror import grammar
+
+CBDQ = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cbdq')
+
+RAW = {
+    'origin': [
+        '#[hero:#name#,Bob]story#',
+        '\\#x\\\\ #animal.capitalize.replace(a,e)# #nope# #animal.nope#',
+        '#[animal:quokka]animal.a# #[animal:POP]animal#',
+        '#[name]name# #[#setPet#]pet#',
+    ],
+    'story': ['#hero# and #hero.s#', '#[x:#hero#]y#'],
+    'name': ['al', 'cy'],
+    'animal': ['ant', 'bee'],
+    'setPet': '[pet:#animal.s#]',
+    'y': '#x.ed#',
+}
+
+
+def tracery_flatten(raw, rule, seed):
+    # tracery.Grammar keeps whatever earlier expansions pushed, so start afresh each time
+    g = tracery.Grammar(raw)
+    g.add_modifiers(base_english)
+    random.seed(seed)
+    return g.flatten(rule)
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_same_as_tracery(seed):
+    g = grammar.Grammar(RAW)
+    expected = tracery_flatten(RAW, '#origin#', seed)
+    assert g.flatten('#origin#', rng=random.Random(seed)) == expected
+
+
+def test_compile_rule():
+    assert grammar.compile_rule('plain') == 'plain'
+    assert grammar.compile_rule('') == ''
+    assert grammar.compile_rule('a #b.c.d(x,y)# e') == (
+        'a ', grammar.Tag('b', (), (('c', ()), ('d', ('x', 'y')))), ' e')
+    assert grammar.compile_rule('#[x:y,z][w:POP]b#') == (
+        grammar.Tag('b', (grammar.Push('x', ('y', 'z')), grammar.Pop('w')), ()),)
+
+
+def test_pushes_do_not_leak():
+    g = grammar.Grammar({'origin': '#[animal:quokka]animal#', 'animal': 'ant'})
+    assert g.flatten('#origin#') == 'quokka'
+    assert g.flatten('#animal#') == 'ant'
+
+
+def test_seed():
+    g = grammar.Grammar(RAW, seed=1)
+    a = [g.flatten('#origin#') for _ in range(20)]
+    g = grammar.Grammar(RAW, seed=1)
+    assert [g.flatten('#origin#') for _ in range(20)] == a
+
+
+def test_cbdq():
+    with open(os.path.join(CBDQ, 'gnuerror.in.yaml'), 'r') as f:
+        raw = grammar.load(f)
+    g = grammar.Grammar(raw)
+    for symbol in raw:
+        for seed in range(5):
+            assert g.flatten('#{}#'.format(symbol), rng=random.Random(seed)) == \
+                tracery_flatten(raw, '#{}#'.format(symbol), seed)
+
+
+def test_expansions():
+    g = grammar.Grammar(RAW)
+    assert grammar.expansions(g.symbols, 'name') == {'al', 'cy'}
+    assert grammar.expansions(g.symbols, 'name', limit=1) is None
+    assert grammar.expansions(g.symbols, 'story') is None
+    assert grammar.expansions(g.symbols, 'missing') is None
+
+    recursive = grammar.compile_grammar({'a': ['x', '#a#y'], 'b': '#a#'})
+    assert grammar.expansions(recursive, 'b') is None
+
+
+def test_modifier_inputs():
+    symbols = grammar.compile_grammar({
+        'origin': '#noun.is# #verb.ed# #[x:y]noun.is# #verb.s.is#',
+        'noun': ['cat', '#adjective# dog'],
+        'adjective': ['big', 'small'],
+        'verb': 'walk',
+    })
+    assert grammar.modifier_inputs(symbols, 'is') == {'cat', 'big dog', 'small dog'}
+    assert grammar.modifier_inputs(symbols, 'ed') == {'walk'}
+
+
+def test_stats():
+    symbols = grammar.compile_grammar({
+        'origin': '#a# #b#',
+        'a': ['x', 'yy'],
+        'b': ['#a#', 'zzzz', '#c.s#'],
+        'c': 'cat',
+        'r': ['x', '#r#'],
+        's': '#r#',
+    })
+    stats = grammar.stats(symbols, limit=6)
+
+    b = stats['b']
+    assert b.derivations == 4
+    assert b.mean_length == pytest.approx((1.5 + 4 + 3 + grammar.MODIFIER_LENGTHS['s'][0]) / 3)
+    assert b.max_length == 5
+
+    origin = stats['origin']
+    assert origin.derivations == 8
+    assert origin.mean_length == pytest.approx(1.5 + 1 + b.mean_length)
+    assert origin.max_length == 8
+    assert origin.lengths.sum() == pytest.approx(1)
+    assert origin.lengths[3] == pytest.approx(0.5 * 1 / 6)
+    # P(longer than 6)
+    assert origin.lengths[-1] == pytest.approx(0.5)
+
+    for symbol in ('r', 's'):
+        assert stats[symbol].derivations == math.inf
+        assert stats[symbol].lengths is None
+
+
+def test_validate():
+    grammar.validate({'origin': '#a.s#', 'a': 'x'})
+    with pytest.raises(ValueError):
+        grammar.validate({'origin': '#b#', 'a': 'x'})
+    with pytest.raises(ValueError):
+        grammar.validate({'origin': 'x', 'a': 'x'})
+    grammar.validate({'origin': 'x', 'a': 'x'}, skip_keys={'a'})
+
+
+def test_transform():
+    source = grammar.Source({'origin': ['a b', '#SPACE#'], 'SPACE': ' '})
+    transformed = source.transform(skip_keys={'SPACE'})
+    assert transformed.raw == {'origin': ['a#SPACE#b', '#SPACE#'], 'SPACE': ' '}
+    assert json.loads(transformed.to_json()) == transformed.raw
+    assert transformed.compile() is transformed.compile()
+
+
+def test_load_cached(tmpdir, monkeypatch):
+    path = tmpdir.join('g.yaml')
+    path.write('origin: x')
+    # A relative cache_dir, like --cache-dir=cache would give
+    monkeypatch.chdir(tmpdir)
+    cache_dir = 'cache'
+    build = MagicMock(side_effect=lambda data: grammar.Source.parse(data).raw)
+
+    for _ in range(2):
+        assert grammar.load_cached(str(path), build, 1, cache_dir) == {'origin': 'x'}
+    assert build.call_count == 1
+
+    # A new version of the file (or of build) replaces the old cache
+    path.write('origin: y')
+    assert grammar.load_cached(str(path), build, 1, cache_dir) == {'origin': 'y'}
+    assert build.call_count == 2
+    assert len(os.listdir(cache_dir)) == 1
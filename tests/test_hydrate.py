@@ -0,0 +1,132 @@
+import threading
+from types import SimpleNamespace
+
+import tweepy
+from tweepy.models import Status, User
+
+from fewerror.twitter import FMK, LessListener, classify_user
+from fewerror.twitter.fmk import ClassificationCache
+from fewerror.twitter.hydrate import FollowQueue, Hydrator
+
+
+def user(i, **kwargs):
+    return User.parse(None, dict({'id': i, 'screen_name': 'user{}'.format(i), 'lang': 'en',
+                                  'protected': False, 'statuses_count': 10,
+                                  'followers_count': 10}, **kwargs))
+
+
+class API:
+    def __init__(self):
+        self.lookups = []
+        self.timelines = []
+
+    def lookup_users(self, user_ids, include_entities):
+        self.lookups.append(list(user_ids))
+        return [user(i, status={'lang': 'ja' if i % 2 else 'en'})
+                for i in user_ids if i < 1000]
+
+    def user_timeline(self, user_id, count):
+        self.timelines.append(user_id)
+        return [Status.parse(None, {'lang': 'en'})]
+
+
+def test_hydrate():
+    api = API()
+    h = Hydrator(api)
+
+    already = user(5, status={'lang': 'en'})
+    users = [user(1), user(2), already, user(2), user(1000)]
+    hydrated = h.hydrate(users)
+    assert api.lookups == [[1, 2, 1000]]
+    assert [u.id for u in hydrated] == [1, 2, 5, 2, 1000]
+    assert hydrated[2] is already
+    assert [hasattr(u, 'status') for u in hydrated] == [True, True, True, True, False]
+    assert [classify_user(h, u) for u in hydrated[:4]] == [
+        FMK.BLOCK, FMK.FOLLOW_BACK, FMK.FOLLOW_BACK, FMK.FOLLOW_BACK,
+    ]
+
+    # Cached
+    h.hydrate([user(1), user(2)])
+    assert api.lookups == [[1, 2, 1000]]
+
+    # No status even after lookup: fall back to the (cached) timeline
+    assert classify_user(h, hydrated[4]) == FMK.FOLLOW_BACK
+    assert classify_user(h, hydrated[4]) == FMK.FOLLOW_BACK
+    assert api.timelines == [1000]
+
+
+def test_handle_follows_error(tmpdir):
+    class ProtectedAPI(API):
+        def user_timeline(self, user_id, count):
+            if user_id == 1001:
+                raise tweepy.TweepError('Not authorized.')
+            return super().user_timeline(user_id, count)
+
+    acted = []
+    listener = SimpleNamespace(
+        _classifications=ClassificationCache(str(tmpdir.join('cache.sqlite3'))),
+        _hydrator=Hydrator(ProtectedAPI()),
+        _act_on_follow=lambda whom, classification: acted.append((whom.id, classification)),
+    )
+    # None of these come back from lookup_users, so all need their timelines
+    LessListener.handle_follows(listener, [user(1000), user(1001), user(1002)])
+    assert acted == [(1000, FMK.FOLLOW_BACK), (1002, FMK.FOLLOW_BACK)]
+    listener._classifications.close()
+
+
+def test_classification_cache(tmpdir):
+    api = API()
+    cache = ClassificationCache(str(tmpdir.join('cache.sqlite3')))
+
+    assert classify_user(api, user(1000), cache=cache) == FMK.FOLLOW_BACK
+    assert classify_user(api, user(1000), cache=cache) == FMK.FOLLOW_BACK
+    assert api.timelines == [1000]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # They've tweeted since
+    assert classify_user(api, user(1000, statuses_count=11), cache=cache) == FMK.FOLLOW_BACK
+    assert api.timelines == [1000, 1000]
+
+    # Not being allowed to fetch their timeline is a different question
+    assert classify_user(api, user(1000, statuses_count=11), fetch_statuses=False,
+                         cache=cache) == FMK.NEUTRAL
+    cache.close()
+
+
+def test_classification_cache_sources(tmpdir):
+    filename = str(tmpdir.join('cache.sqlite3'))
+    stream = ClassificationCache(filename)
+    batch = ClassificationCache(filename, source='batch')
+
+    stream.put(1000, 'x', FMK.BLOCK)
+    assert batch.get(1000, 'x') is None
+    batch.put(1000, 'x', FMK.NEUTRAL)
+    assert stream.get(1000, 'x') == FMK.BLOCK
+    assert batch.get(1000, 'x') == FMK.NEUTRAL
+
+    stream.close()
+    batch.close()
+
+
+def test_hydrate_batches():
+    api = API()
+    Hydrator(api).hydrate([user(i) for i in range(250)])
+    assert [len(ids) for ids in api.lookups] == [100, 100, 50]
+
+
+def test_follow_queue():
+    batches = []
+    go = threading.Event()
+
+    def handle(users):
+        go.wait()
+        batches.append(users)
+
+    q = FollowQueue(handle, name='test_follows', linger=0.5, batch_size=3)
+    for i in range(5):
+        q.put(i)
+    go.set()
+    q.join()
+
+    assert sum(batches, []) == list(range(5))
+    assert all(len(b) <= 3 for b in batches)
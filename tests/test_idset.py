@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from fewerror.idset import IdSet
+
+
+def test_set_operations():
+    a = IdSet([5, 3, 3, 1, 2 ** 62])
+    b = IdSet([3, 4, 5])
+
+    assert list(a) == [1, 3, 5, 2 ** 62]
+    assert len(a) == 4
+    assert 3 in a
+    assert 4 not in a
+    assert 2 ** 62 in a
+    assert 2 ** 62 + 1 not in a
+
+    assert list(a & b) == [3, 5]
+    assert list(a - b) == [1, 2 ** 62]
+    assert list(a | b) == [1, 3, 4, 5, 2 ** 62]
+    assert list(a & [5, 6, 1]) == [1, 5]
+
+    assert a.contains([0, 1, 2, 3, 2 ** 62 + 1]).tolist() == [False, True, False, True, False]
+    assert IdSet().contains([1, 2]).tolist() == [False, False]
+    assert 1 not in IdSet()
+
+
+def test_from_pages():
+    assert list(IdSet.from_pages([[3, 2], [], [1, 2]])) == [1, 2, 3]
+    assert len(IdSet.from_pages([])) == 0
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_save_load(tmpdir, mmap):
+    path = str(tmpdir.join('ids.npy'))
+    a = IdSet(np.arange(0, 100000, 7))
+    a.save(path)
+    assert tmpdir.listdir() == [tmpdir.join('ids.npy')]
+
+    b = IdSet.load(path, mmap=mmap)
+    assert b == a
+    assert isinstance(b.array, np.memmap) == mmap
+    assert 700 in b
+    assert 701 not in b
@@ -0,0 +1,59 @@
+import io
+from datetime import datetime
+
+from tweepy.models import Status
+
+from fewerror.twitter.latency import LatencyTracker, created_timestamp, read_log
+
+
+class Clock:
+    def __init__(self, t):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+
+def test_created_timestamp():
+    s = Status.parse(None, {'id': 1, 'created_at': 'Mon Sep 07 04:50:13 +0000 2015'})
+    assert created_timestamp(s) == 1441601413
+
+    s = Status.parse(None, {'id': 1, 'created_at': 'Mon Sep 07 04:50:13 +0000 2015',
+                            'timestamp_ms': '1441601413456'})
+    assert created_timestamp(s) == 1441601413.456
+
+
+def test_tracker(tmpdir):
+    log_filename = str(tmpdir.join('latency.tsv'))
+    clock = Clock(1000.5)
+    tracker = LatencyTracker(log_filename, clock=clock)
+
+    s = Status.parse(None, {'id': 42, 'timestamp_ms': '1000000'})
+    timing = tracker.start(s)
+    clock.t = 1001
+    tracker.found(timing)
+    clock.t = 1003.25
+    tracker.finish(timing, 'replied')
+
+    s = Status.parse(None, {'id': 43, 'timestamp_ms': '1002000'})
+    timing = tracker.start(s)
+    tracker.finish(timing, 'manual_rt')
+    tracker.close()
+
+    with open(log_filename) as f:
+        assert list(read_log(f)) == [
+            (42, 1000000, {'received': 500, 'found': 1000, 'done': 3250}, 'replied'),
+            (43, 1002000, {'received': 1250, 'found': None, 'done': 1250}, 'manual_rt'),
+        ]
+
+    summary = tracker.summary(ps=(0.,))
+    assert summary == {
+        'received': {0.: 0.5},
+        'found': {0.: 1.},
+        'done': {0.: 1.25},
+    }
+
+
+def test_read_log():
+    f = io.StringIO('1\t2\t3\t\t5\terror\n')
+    assert list(read_log(f)) == [(1, 2, {'received': 3, 'found': None, 'done': 5}, 'error')]
@@ -0,0 +1,57 @@
+import urllib.request
+
+from fewerror import metrics
+
+
+def test_expose():
+    r = metrics.Registry()
+    c = r.register(metrics.Counter('things', 'Things', ('kind',)))
+    g = r.register(metrics.Gauge('depth', 'Depth'))
+    h = r.register(metrics.Histogram('seconds', 'Seconds', buckets=(1, 2)))
+
+    c.labels('a').inc()
+    c.labels('a').inc(2)
+    c.labels('b"').inc()
+    g.set_function(lambda: 7)
+    h.observe(0.5)
+    h.observe(1)
+    h.observe(3)
+
+    assert r.expose().splitlines() == [
+        '# HELP depth Depth',
+        '# TYPE depth gauge',
+        'depth 7',
+        '# HELP seconds Seconds',
+        '# TYPE seconds histogram',
+        'seconds_bucket{le="1.0"} 2',
+        'seconds_bucket{le="2.0"} 2',
+        'seconds_bucket{le="+Inf"} 3',
+        'seconds_sum 4.5',
+        'seconds_count 3',
+        '# HELP things_total Things',
+        '# TYPE things_total counter',
+        'things_total{kind="a"} 3',
+        'things_total{kind="b\\""} 1',
+    ]
+
+
+def test_register_twice():
+    r = metrics.Registry()
+    a = r.register(metrics.Counter('x', 'X'))
+    b = r.register(metrics.Counter('x', 'X'))
+    assert a is b
+
+
+def test_serve():
+    c = metrics.counter('fewerror_test_served', 'Served')
+    c.inc()
+
+    server = metrics.serve(0, 'localhost')
+    try:
+        url = 'http://localhost:{}/metrics'.format(server.server_address[1])
+        with urllib.request.urlopen(url) as r:
+            body = r.read().decode('utf-8')
+    finally:
+        server.shutdown()
+
+    assert 'fewerror_test_served_total 1\n' in body
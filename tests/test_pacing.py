@@ -0,0 +1,82 @@
+import argparse
+
+import pytest
+
+from fewerror.twitter import batch
+from fewerror.twitter.pacing import Journal, Pacer
+
+from .fakeapi import FakeAPI
+
+
+@pytest.mark.parametrize('remaining,reset,expected', [
+    (None, None, 120),   # no headers: fall back to the maximum
+    (100, 1300, 3),      # 300s left, 100 calls: one every 3s
+    (1, 1300, 120),      # never more than the maximum...
+    (0, 1300, 301),      # ...unless we have to wait for the reset
+    (5, 900, 0),         # reset has already passed
+])
+def test_pacer_delay(remaining, reset, expected):
+    pacer = Pacer(FakeAPI(remaining=remaining, reset=reset), max_delay=120, clock=lambda: 1000)
+    assert pacer.delay() == expected
+
+
+def test_pacer_budget():
+    now = [1000]
+    sleeps = []
+    pacer = Pacer(FakeAPI(), max_delay=120, budget=4, window=300, clock=lambda: now[0],
+                  sleep=sleeps.append)
+
+    # Without headers, 3 calls left in a 300s window
+    pacer.wait()
+    assert sleeps == [100]
+    now[0] += 100
+    pacer.wait()
+    now[0] += 100
+    pacer.wait()
+    # The budget is spent, so wait for the window to end
+    now[0] += 50
+    pacer.wait()
+    assert sleeps == [100, 100, 100, 51]
+
+    # A new window
+    now[0] += 51
+    pacer.wait()
+    assert sleeps[-1] == 100
+
+
+def test_journal_discards_partial_line(tmpdir):
+    path = tmpdir.join('journal')
+    # 35 was being written when we died
+    path.write('12\n3')
+    journal = Journal(str(path))
+    assert list(journal.ids) == [12]
+    journal.record(35)
+    journal.close()
+    assert path.read() == '12\n35\n'
+
+
+def test_block_resumes_from_journal(tmpdir, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(batch.time, 'sleep', sleeps.append)
+
+    block_file = tmpdir.join('block.txt')
+    block_file.write('1\n2\n3\n4\n')
+    # 2 was done last time; 3 was being written when we died
+    tmpdir.join('block.txt.journal').write('2\n3')
+
+    api = FakeAPI({1})
+    with open(str(block_file), 'r') as f:
+        args = argparse.Namespace(block_file=f, journal=None, timeout=120, report=False,
+                                  state=str(tmpdir), reconcile=False, max_age=7,
+                                  per_window=None)
+        batch.block(api, args)
+
+    assert api.blocked == [3, 4]
+    assert api.unfollowed == [3, 4]
+    assert sleeps == [120]
+    assert tmpdir.join('block.txt.journal').read() == '2\n3\n4\n'
+
+    journal = Journal(str(tmpdir.join('block.txt.journal')))
+    assert 4 in journal
+    assert 1 not in journal
+    journal.close()
@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from fewerror import OnceNLTKTagger
+from fewerror.tagcache import TagCache, model_version
+
+TAGS = [('I', 'PRP'), ('could', 'MD'), ('care', 'VB'), ('less', 'JJR')]
+
+
+@pytest.fixture
+def filename(tmpdir):
+    return str(tmpdir.join('tags.sqlite3'))
+
+
+def test_round_trip(filename):
+    cache = TagCache(filename)
+    assert cache.get('I could care less') is None
+    cache.put('I could care less', TAGS)
+    assert cache.get('I could care less') == TAGS
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    cache = TagCache(filename)
+    assert cache.get('I could care less') == TAGS
+    assert len(cache) == 1
+    cache.close()
+
+
+def test_version(filename):
+    cache = TagCache(filename, version='old')
+    cache.put('I could care less', TAGS)
+    cache.close()
+
+    cache = TagCache(filename, version='new')
+    assert cache.get('I could care less') is None
+    cache.close()
+
+    assert 'nltk=' in model_version()
+
+
+def test_evicts_least_recently_used(filename):
+    cache = TagCache(filename, max_entries=10)
+    for i in range(10):
+        cache.put('text {}'.format(i), TAGS)
+    assert cache.get('text 0') == TAGS
+    cache.flush()
+
+    cache.put('text 10', TAGS)
+    assert len(cache) == 9
+    assert cache.get('text 0') == TAGS
+    assert cache.get('text 1') is None
+    assert cache.get('text 10') == TAGS
+    cache.close()
+
+
+def test_threads(filename, monkeypatch):
+    # Flush and evict often, as well as getting and putting
+    monkeypatch.setattr('fewerror.tagcache.TOUCH_BATCH', 3)
+    cache = TagCache(filename, max_entries=50)
+    errors = []
+
+    def work(t):
+        try:
+            for i in range(200):
+                text = 'text {}'.format(i % 60)
+                if cache.get(text) is None:
+                    cache.put(text, TAGS)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(t,)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert cache.hits + cache.misses == 8 * 200
+    assert len(cache) <= 50
+    cache.close()
+
+
+def test_tagger_uses_cache(filename):
+    tagger = OnceNLTKTagger()
+    tagger.cache = TagCache(filename)
+    tagger.cache.put('I could care less', TAGS)
+
+    assert tagger.tag('I could care less') == TAGS
+    tagger.cache.close()
@@ -0,0 +1,48 @@
+import argparse
+import http.client
+import json
+import queue
+import threading
+
+import telegram
+from telegram.ext import TypeHandler, Updater
+
+from fewerror import telegram as fewerror_telegram
+from fewerror.telegram_loadtest import FakeBotAPI, free_port, synthetic_update
+
+
+def test_webhook_keep_alive():
+    api = FakeBotAPI(('127.0.0.1', 0))
+    threading.Thread(target=api.serve_forever, daemon=True).start()
+    updater = Updater('123456:test', base_url='http://{}:{}/bot'.format(*api.server_address[:2]))
+    updates = queue.Queue()
+    updater.dispatcher.add_handler(TypeHandler(telegram.Update,
+                                               lambda bot, update: updates.put(update)))
+
+    args = argparse.Namespace(webhook_listen='127.0.0.1', webhook_port=free_port('127.0.0.1'),
+                              webhook_path='/secret', webhook_url=None)
+    fewerror_telegram.start_webhook(updater, args)
+
+    conn = http.client.HTTPConnection(args.webhook_listen, args.webhook_port)
+    try:
+        statuses = []
+        for path, body in [
+            ('/secret', json.dumps(synthetic_update(1, 10, 'less cake'))),
+            ('/wrong', json.dumps(synthetic_update(2, 10, 'lunch?'))),
+            ('/secret', json.dumps(synthetic_update(3, 11, 'lunch?'))),
+        ]:
+            conn.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            statuses.append(response.status)
+
+        assert statuses == [200, 404, 200]
+        received = [updates.get(timeout=5) for _ in range(2)]
+    finally:
+        conn.close()
+        updater.stop()
+        api.shutdown()
+
+    assert [u.update_id for u in received] == [1, 3]
+    assert [u.message.text for u in received] == ['less cake', 'lunch?']
+    assert received[1].message.chat_id == 11
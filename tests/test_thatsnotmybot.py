@@ -3,6 +3,7 @@ import yaml
 import pytest
 
 from unittest.mock import MagicMock, call
+from fewerror import thatsnotmybot
 from fewerror.thatsnotmybot import ThatsNotMyBot
 
 
@@ -10,6 +11,39 @@ def test_validate():
     ThatsNotMyBot()
 
 
+def test_cache(tmpdir, monkeypatch):
+    monkeypatch.setattr(thatsnotmybot, 'precompute_verbs', lambda compiled: {})
+    cold = ThatsNotMyBot(cache_dir=str(tmpdir))
+    assert len(tmpdir.listdir()) == 1
+
+    monkeypatch.setattr(thatsnotmybot.yaml, 'load', MagicMock(side_effect=AssertionError))
+    warm = ThatsNotMyBot(cache_dir=str(tmpdir))
+    assert warm.source == cold.source
+
+
+def test_cache_version(tmpdir, monkeypatch):
+    monkeypatch.setattr(thatsnotmybot, 'precompute_verbs', lambda compiled: {})
+    ThatsNotMyBot(cache_dir=str(tmpdir))
+    before = tmpdir.listdir()
+
+    # As if grammar.py or thatsnotmybot.py had changed
+    monkeypatch.setattr(thatsnotmybot, 'cache_version', lambda: 'changed')
+    monkeypatch.setattr(thatsnotmybot.yaml, 'load', MagicMock(side_effect=AssertionError))
+    with pytest.raises(AssertionError):
+        ThatsNotMyBot(cache_dir=str(tmpdir))
+    assert tmpdir.listdir() == before
+
+
+def test_cache_without_tagger(tmpdir, monkeypatch):
+    monkeypatch.setattr(thatsnotmybot, 'precompute_verbs', lambda compiled: None)
+    ThatsNotMyBot(cache_dir=str(tmpdir))
+    assert tmpdir.listdir() == []
+
+    monkeypatch.setattr(thatsnotmybot, 'precompute_verbs', lambda compiled: {})
+    ThatsNotMyBot(cache_dir=str(tmpdir))
+    assert len(tmpdir.listdir()) == 1
+
+
 def test_generate():
     ThatsNotMyBot().generate()
 
@@ -68,3 +102,62 @@ def test_first_tweet(tmpdir, initial_state, is_my):
         assert tweet.startswith("THAT'S my")
     else:
         assert tweet.startswith("That's not")
+
+
+def test_precompute_verbs(monkeypatch):
+    agreeing_verb = MagicMock(side_effect=lambda phrase: ' are' if phrase.endswith('s') else ' is')
+    monkeypatch.setattr(thatsnotmybot, 'agreeing_verb', agreeing_verb)
+
+    compiled = thatsnotmybot.grammar.compile_grammar({
+        'origin': 'Its #feature.is# too soft.',
+        'feature': ['tail', 'ears', '#feature#s'],
+    })
+    assert thatsnotmybot.precompute_verbs(compiled) == {}
+
+    compiled = thatsnotmybot.grammar.compile_grammar({
+        'origin': 'Its #feature.is# too soft.',
+        'feature': ['tail', 'ears'],
+    })
+    verbs = thatsnotmybot.precompute_verbs(compiled)
+    assert verbs == {'tail': ' is', 'ears': ' are'}
+
+    agreeing_verb.reset_mock()
+    assert thatsnotmybot.modifier_is('ears', verbs=verbs) == 'ears are'
+    assert thatsnotmybot.modifier_is('paws', verbs=verbs) == 'paws are'
+    assert agreeing_verb.mock_calls == [call('paws')]
+
+
+@pytest.fixture
+def fake_agreement(monkeypatch):
+    # The tagger's data may not be installed; and if it is, it's slow
+    monkeypatch.setattr(thatsnotmybot, 'agreeing_verb',
+                        lambda phrase: ' are' if phrase.endswith('s') else ' is')
+
+
+def test_sample_jobs(tmpdir, fake_agreement):
+    tnmb = ThatsNotMyBot()
+    outputs = []
+    for jobs in (1, 3):
+        output = tmpdir.join('{}.txt'.format(jobs))
+        with output.open('w') as f:
+            tnmb.sample(2500, seed=42, jobs=jobs, output=f)
+        outputs.append(output.read().splitlines())
+
+    assert len(outputs[0]) == 2500
+    assert outputs[0] == outputs[1]
+
+
+def test_sample_dedup(tmpdir, fake_agreement):
+    output = tmpdir.join('samples.txt')
+    with output.open('w') as f:
+        ThatsNotMyBot().sample(2000, seed=1, output=f, dedup=True)
+
+    texts = output.read().splitlines()
+    assert 0 < len(texts) <= 2000
+    assert len(set(texts)) == len(texts)
+
+
+def test_stats(capsys):
+    ThatsNotMyBot().main(['stats', '--limit', '280'])
+    out, _ = capsys.readouterr()
+    assert out.splitlines()[1].split()[0] == 'origin'
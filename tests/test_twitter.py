@@ -194,6 +194,24 @@ def test_festivity(date, p, tmpdir):
     assert l.get_festive_probability(date) == p
 
 
+@pytest.mark.parametrize('hours_old,loaded', [
+    (1, True),
+    (7, False),
+])
+def test_follower_ids_age(tmpdir, hours_old, loaded):
+    from fewerror.idset import IdSet
+
+    path = str(tmpdir.join('followers.npy'))
+    IdSet([1, 2, 3]).save(path)
+    then = os.stat(path).st_mtime - hours_old * 60 * 60
+    os.utime(path, (then, then))
+
+    api = MockAPI(connections={})
+    l = LessListener(api=api, state_dir=str(tmpdir), follower_ids=path)
+
+    assert (l._follower_ids is not None) == loaded
+
+
 @pytest.mark.parametrize('id_,expected_filename', [
     ('649911069322948608', '64/649911069322948608.json'),
     ('1649911069322948608', '164/1649911069322948608.json'),
@@ -211,3 +229,68 @@ def test_save_tweet(tmpdir, id_, expected_filename):
 
     j = tmpdir.join('foo', expected_filename)
     assert j.check()
+
+
+def test_stream_reconnects_with_same_listener(tmpdir, monkeypatch):
+    import argparse
+    import requests
+    import fewerror.twitter
+
+    class Stream:
+        def __init__(self, auth, listener):
+            self.listener = listener
+            self.n = 0
+
+        def userstream(self, replies):
+            self.n += 1
+            if self.n > 3:
+                raise KeyboardInterrupt
+            self.listener.on_connect()
+            raise requests.exceptions.ConnectionError()
+
+    me_calls = []
+    api = MockAPI(connections={})
+    real_me = api.me
+    api.me = lambda: me_calls.append(1) or real_me()
+    api.auth = None
+
+    delays = []
+    monkeypatch.setattr(fewerror.twitter, 'warm_up', lambda: None)
+    monkeypatch.setattr(fewerror.twitter.tweepy, 'Stream', Stream)
+    monkeypatch.setattr(fewerror.twitter.time, 'sleep', delays.append)
+
+    args = argparse.Namespace(post_replies=False, gather=None, state=str(tmpdir),
+                              use_public_stream=False, latency_log=None, follower_ids=None,
+                              follower_ids_max_age=6)
+    with pytest.raises(KeyboardInterrupt):
+        fewerror.twitter.stream(api, args)
+
+    assert me_calls == [1]
+    assert len(delays) == 3
+    assert delays[0] <= 1 < delays[2] <= 4
+
+
+def test_load_accounts():
+    import io
+    from fewerror.twitter.accounts import load_accounts
+
+    accounts = load_accounts(io.StringIO('''
+defaults:
+  post_replies: true
+accounts:
+  - name: fewerror
+  - name: fewerror_uk
+    env_prefix: UK_
+    state: var/uk
+'''))
+    assert [a['name'] for a in accounts] == ['fewerror', 'fewerror_uk']
+    assert all(a['post_replies'] for a in accounts)
+    assert accounts[0]['env_prefix'] == ''
+    assert accounts[1]['env_prefix'] == 'UK_'
+    assert accounts[1]['state'] == 'var/uk'
+
+    with pytest.raises(ValueError):
+        load_accounts(io.StringIO('accounts: [{name: a, colour: blue}]'))
+
+    with pytest.raises(ValueError):
+        load_accounts(io.StringIO('accounts: [{name: a}, {name: a}]'))
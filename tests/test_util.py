@@ -0,0 +1,132 @@
+import threading
+import time
+
+from fewerror.util import Backoff, BloomFilter, KeyedWorkQueue, TopK, TTLCache, imap_bounded
+
+
+def test_backoff():
+    b = Backoff(initial=1, cap=10, random=lambda: 1.)
+    assert [b.next() for _ in range(6)] == [1, 2, 4, 8, 10, 10]
+
+    b.reset()
+    assert b.next() == 1
+
+
+def test_backoff_jitter():
+    b = Backoff(initial=4, random=lambda: 0.)
+    assert b.next() == 2
+    assert b.next() == 4
+
+
+def test_backoff_stays_capped():
+    b = Backoff(initial=1, cap=10, random=lambda: 1.)
+    for _ in range(2000):
+        assert b.next() <= 10
+
+
+def test_ttl_cache():
+    now = [0]
+    c = TTLCache(ttl=10, maxsize=2, clock=lambda: now[0])
+    c['a'] = 1
+    now[0] = 5
+    c['b'] = 2
+    assert c['a'] == 1
+    assert 'b' in c
+
+    now[0] = 10
+    assert 'a' not in c
+    assert c.get('b') == 2
+
+    c['c'] = 3
+    c['d'] = 4
+    assert 'b' not in c
+    assert len(c) == 2
+
+
+def test_keyed_work_queue():
+    handled = []
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def handle(item):
+        key, i = item
+        if key == 'slow':
+            release.wait()
+        with lock:
+            handled.append(item)
+
+    q = KeyedWorkQueue(handle, workers=2, maxsize=3)
+    assert q.put('slow', ('slow', 0))
+    for i in range(3):
+        assert q.put('a', ('a', i))
+        assert q.put('b', ('b', i))
+
+    # 'slow' is stuck, but the others get through on the other worker
+    for _ in range(100):
+        if len(handled) == 6:
+            break
+        time.sleep(0.01)
+    assert sorted(handled) == [('a', 0), ('a', 1), ('a', 2), ('b', 0), ('b', 1), ('b', 2)]
+
+    # 'slow' has room for three more
+    assert [q.put('slow', ('slow', i)) for i in range(1, 5)] == [True, True, True, False]
+    assert q.qsize() == 3
+
+    release.set()
+    q.join()
+    q.shutdown()
+    assert [i for key, i in handled if key == 'slow'] == [0, 1, 2, 3]
+    assert [i for key, i in handled if key == 'a'] == [0, 1, 2]
+
+
+def test_imap_bounded():
+    class Pool(object):
+        submitted = []
+
+        def apply_async(self, func, args):
+            self.submitted.extend(args)
+            return Result(func(*args))
+
+    class Result(object):
+        def __init__(self, value):
+            self.value = value
+
+        def get(self):
+            return self.value
+
+    pool = Pool()
+    results = imap_bounded(pool, lambda x: x * 2, range(10), 3)
+    assert next(results) == 0
+    # No more than in_flight items were submitted before the first was consumed
+    assert pool.submitted == [0, 1, 2]
+    assert list(results) == [2 * x for x in range(1, 10)]
+
+
+def test_bloom_filter():
+    seen = BloomFilter(1000, error_rate=0.01)
+    assert seen.add('a')
+    assert not seen.add('a')
+    assert 'a' in seen
+
+    words = [str(i) for i in range(1000)]
+    for w in words:
+        seen.add(w)
+    assert all(w in seen for w in words)
+
+    false_positives = sum('x' + w in seen for w in words)
+    assert false_positives < 50
+
+
+def test_top_k():
+    top = TopK(3)
+    for word in 'a b a c a b d a b e'.split():
+        top.add(word)
+    assert len(top) == 3
+    [(first, n), (second, m)] = top.most_common(2)
+    assert (first, n) == ('a', 4)
+    assert second == 'b' and m >= 3
+
+    # z takes over the count of whichever item was least common, so is overestimated
+    top.update({'z': 10})
+    assert top.most_common(1) == [('z', 13)]
+    assert len(top) == 3
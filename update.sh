@@ -16,6 +16,8 @@ if [[ "$#" -ge 1 ]]; then
     exec flock $PARENT/update.lock "$0"
 else
     pipenv install
+    # Read by checkedshirt, to tell Sentry which release it's running
+    git rev-parse HEAD > .release
     pipenv run python -m textblob.download_corpora
     #sudo systemctl restart fewerror-twitter
 fi